@@ -0,0 +1,80 @@
+"""
+Микробенчмарк проверки запрещённых слов: прежняя реализация contains_bad_words
+(множество слов текста + перебор всего списка) против автомата Ахо–Корасик.
+Использование: python benchmarks/bench_bad_words.py [--words 10000] [--texts 2000]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from portal.word_filter import BadWordMatcher
+
+ALPHABET = "абвгдежзийклмнопрстуфхцчшщыьэюя"
+
+
+def legacy_contains_bad_words(text: str, bad_words: set) -> bool:
+    """Реализация из routes.py до перехода на автомат."""
+    if not text:
+        return False
+    lowered = text.lower()
+    cleaned = re.sub(r"[^\wа-яё]+", " ", lowered, flags=re.IGNORECASE)
+    words = set(cleaned.split())
+    return any(bad in words for bad in bad_words)
+
+
+def make_word(rng: random.Random) -> str:
+    return "".join(rng.choice(ALPHABET) for _ in range(rng.randint(4, 10)))
+
+
+def make_corpus(rng: random.Random, bad_words: list, texts: int, words_per_text: int) -> list:
+    vocabulary = [make_word(rng) for _ in range(5000)]
+    corpus = []
+    for i in range(texts):
+        words = [rng.choice(vocabulary) for _ in range(words_per_text)]
+        # Примерно каждый двадцатый текст содержит запрещённое слово
+        if i % 20 == 0:
+            words[rng.randrange(len(words))] = rng.choice(bad_words)
+        corpus.append(" ".join(words).capitalize() + ".")
+    return corpus
+
+
+def bench(label: str, func, corpus: list) -> float:
+    started = time.perf_counter()
+    hits = sum(1 for text in corpus if func(text))
+    elapsed = time.perf_counter() - started
+    per_text = elapsed / len(corpus) * 1_000_000
+    print(f"  {label:<28} {elapsed * 1000:9.1f} мс  {per_text:8.1f} мкс/текст  совпадений: {hits}")
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--words", type=int, default=10_000, help="Размер списка запрещённых слов")
+    parser.add_argument("--texts", type=int, default=2_000, help="Количество проверяемых текстов")
+    parser.add_argument("--text-words", type=int, default=120, help="Слов в одном тексте")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    bad_words = sorted({make_word(rng) for _ in range(args.words)})
+    corpus = make_corpus(rng, bad_words, args.texts, args.text_words)
+    bad_set = set(bad_words)
+
+    print(f"Список: {len(bad_words)} слов, текстов: {len(corpus)} по {args.text_words} слов")
+
+    started = time.perf_counter()
+    matcher = BadWordMatcher(bad_words)
+    print(f"  {'компиляция автомата':<28} {(time.perf_counter() - started) * 1000:9.1f} мс")
+
+    legacy = bench("прежняя реализация", lambda text: legacy_contains_bad_words(text, bad_set), corpus)
+    compiled = bench("автомат: contains", matcher.contains, corpus)
+    bench("автомат: find_all", matcher.find_all, corpus)
+    print(f"Ускорение contains: x{legacy / compiled:.1f}")
+
+
+if __name__ == "__main__":
+    main()
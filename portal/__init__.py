@@ -5,7 +5,9 @@ from dotenv import load_dotenv
 
 from .extensions import db, login_manager
 from .routes import bp as main_bp
-from .migrations import run_simple_migrations
+from .migrations import run_migrations
+from .query_stats import init_query_stats
+from .thumbnails import init_thumbnails
 
 
 def create_app():
@@ -18,6 +20,48 @@ def create_app():
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
     # Ограничиваем размер всех загружаемых файлов (200 МБ)
     app.config["MAX_CONTENT_LENGTH"] = 200 * 1024 * 1024
+    # Как часто процесс сверяет версию списка запрещённых слов с БД (секунды)
+    app.config["BAD_WORDS_REFRESH_SECONDS"] = float(os.getenv("BAD_WORDS_REFRESH_SECONDS", "5"))
+    # Кэш категорий и популярных тегов: срок жизни и частота сверки версии (секунды)
+    app.config["SIDEBAR_CACHE_TTL"] = float(os.getenv("SIDEBAR_CACHE_TTL", "300"))
+    app.config["SIDEBAR_VERSION_CHECK_SECONDS"] = float(os.getenv("SIDEBAR_VERSION_CHECK_SECONDS", "5"))
+    # Через сколько секунд сохранённые рекомендации пересчитываются, даже без новых действий
+    app.config["RECOMMENDATIONS_TTL"] = float(os.getenv("RECOMMENDATIONS_TTL", "900"))
+    # Как часто пересчитывать в фоне устаревшие ленты, открытые на главной (секунды, 0 — только по cron)
+    app.config["RECOMMENDATIONS_REFRESH_SECONDS"] = float(os.getenv("RECOMMENDATIONS_REFRESH_SECONDS", "10"))
+    # Период полураспада горячести постов (часы)
+    app.config["HOT_HALF_LIFE_HOURS"] = float(os.getenv("HOT_HALF_LIFE_HOURS", "24"))
+    # Буфер маяков просмотра: период сброса в БД (секунды, 0 — писать сразу) и размер пачки
+    app.config["VIEW_BUFFER_FLUSH_SECONDS"] = float(os.getenv("VIEW_BUFFER_FLUSH_SECONDS", "0.3"))
+    app.config["VIEW_BUFFER_MAX_ENTRIES"] = int(os.getenv("VIEW_BUFFER_MAX_ENTRIES", "200"))
+    # Счётчик открытий постов: период записи в Post.views (0 — писать сразу),
+    # окно дедупликации по сессии (секунды), число полос
+    app.config["VIEW_COUNTER_FLUSH_SECONDS"] = float(os.getenv("VIEW_COUNTER_FLUSH_SECONDS", "5"))
+    app.config["VIEW_DEDUP_SECONDS"] = float(os.getenv("VIEW_DEDUP_SECONDS", "1800"))
+    app.config["VIEW_COUNTER_STRIPES"] = int(os.getenv("VIEW_COUNTER_STRIPES", "16"))
+    # Лента подписок: с какого числа подписчиков посты автора не раскладываются по лентам, размер ленты,
+    # как часто обрезать ленты после публикаций (секунды, 0 — сразу при публикации)
+    app.config["TIMELINE_FANOUT_LIMIT"] = int(os.getenv("TIMELINE_FANOUT_LIMIT", "5000"))
+    app.config["TIMELINE_MAX_ENTRIES"] = int(os.getenv("TIMELINE_MAX_ENTRIES", "1000"))
+    app.config["TIMELINE_TRIM_SECONDS"] = float(os.getenv("TIMELINE_TRIM_SECONDS", "30"))
+    # Кэш тегов на модерации и категорий: как часто сверять версию (секунды)
+    app.config["TAG_CACHE_CHECK_SECONDS"] = float(os.getenv("TAG_CACHE_CHECK_SECONDS", "5"))
+    # Файл без ссылок удаляется сборщиком gc_media не раньше, чем через столько секунд после последнего использования
+    app.config["MEDIA_GC_GRACE_SECONDS"] = float(os.getenv("MEDIA_GC_GRACE_SECONDS", "3600"))
+    # Загрузка частями: размер части, предел файла, одновременных загрузок на пользователя,
+    # через сколько секунд без новых частей загрузка считается брошенной (удаляет gc_media)
+    app.config["UPLOAD_CHUNK_SIZE"] = int(os.getenv("UPLOAD_CHUNK_SIZE", str(8 * 1024 * 1024)))
+    app.config["UPLOAD_MAX_SIZE"] = int(os.getenv("UPLOAD_MAX_SIZE", str(200 * 1024 * 1024)))
+    app.config["UPLOAD_MAX_ACTIVE"] = int(os.getenv("UPLOAD_MAX_ACTIVE", "5"))
+    app.config["UPLOAD_SESSION_TTL"] = float(os.getenv("UPLOAD_SESSION_TTL", "86400"))
+    # Уменьшенные копии картинок: потоков в пуле (0 — не строить при загрузке), как часто искать новые копии (секунды)
+    app.config["THUMBNAIL_WORKERS"] = int(os.getenv("THUMBNAIL_WORKERS", "2"))
+    app.config["THUMBNAIL_CHECK_SECONDS"] = float(os.getenv("THUMBNAIL_CHECK_SECONDS", "30"))
+    # Статистика SQL по запросам (см. query_stats.py): пороги (0 — без порога), строгий режим для тестов
+    app.config["QUERY_STATS"] = os.getenv("QUERY_STATS", "0") == "1"
+    app.config["QUERY_STATS_MAX_QUERIES"] = int(os.getenv("QUERY_STATS_MAX_QUERIES", "50"))
+    app.config["QUERY_STATS_MAX_REPEATS"] = int(os.getenv("QUERY_STATS_MAX_REPEATS", "5"))
+    app.config["QUERY_STATS_STRICT"] = os.getenv("QUERY_STATS_STRICT", "0") == "1"
 
     db.init_app(app)
     login_manager.init_app(app)
@@ -26,16 +70,15 @@ def create_app():
     app.register_blueprint(main_bp)
 
     with app.app_context():
-        from . import models  # noqa: F401
+        # Схема и начальные данные по журналу миграций: при актуальной схеме — один SELECT
+        run_migrations()
 
-        db.create_all()
+        from .seed import promote_admins
 
-        # Простые миграции для существующих SQLite-баз
-        run_simple_migrations()
+        promote_admins()
 
-        from .seed import ensure_seed_data
-
-        ensure_seed_data()
+    init_query_stats(app)
+    init_thumbnails(app)
 
     return app
 
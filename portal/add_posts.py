@@ -17,9 +17,12 @@ except ImportError:
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from portal import create_app
+from portal.counters import adjust_user_counters
+from portal.duplicate_checker import index_post
 from portal.extensions import db
-from portal.models import Post, User, Category, Tag
-import re
+from portal.models import Post, User, Category
+from portal.tags import get_or_create_tags
+from portal.timeline import fan_out_post
 
 
 def download_image(url, save_path):
@@ -56,34 +59,6 @@ def get_random_images():
     return image_urls
 
 
-def slugify_tag(name: str) -> str:
-    """Создает slug из названия тега."""
-    name = name.lower().strip()
-    name = re.sub(r"[^\wа-яё-]+", "-", name)
-    name = re.sub(r"-+", "-", name)
-    return name.strip("-")
-
-
-def get_or_create_tags(tag_names: str):
-    """Получает или создает теги из строки с запятыми."""
-    if not tag_names:
-        return []
-    tags = []
-    for name in tag_names.split(","):
-        name = name.strip()
-        if not name:
-            continue
-        slug = slugify_tag(name)
-        if not slug:
-            continue
-        tag = Tag.query.filter_by(slug=slug).first()
-        if not tag:
-            tag = Tag(name=name, slug=slug)
-            db.session.add(tag)
-        tags.append(tag)
-    return tags
-
-
 def create_posts_from_data():
     """Создает посты из реалистичных данных"""
     
@@ -125,11 +100,15 @@ def create_posts_from_data():
             
             # Добавляем теги
             if post_data.get("tags"):
-                tags = get_or_create_tags(post_data["tags"])
+                tags, _ = get_or_create_tags(post_data["tags"])
                 post.tags = tags
             
             db.session.add(post)
+            adjust_user_counters(user.id, posts_count=1)
             db.session.flush()
+            index_post(post, replace=False)
+            # Пост должен попасть в ленты подписчиков автора, как при публикации через сайт
+            fan_out_post(post)
             
             # Пытаемся скачать изображение (опционально)
             # Можно раскомментировать, если нужны реальные изображения
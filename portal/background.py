@@ -0,0 +1,39 @@
+"""
+Фоновый поток, периодически сбрасывающий накопленные в памяти данные в БД
+(буфер просмотров, счётчики просмотров). Поток запускается лениво, при первой
+записи, чтобы консольные скрипты с create_app() его не поднимали.
+"""
+import atexit
+import threading
+
+
+class PeriodicFlusher:
+    """Вызывает flush() раз в interval секунд или раньше — по wake()."""
+
+    def __init__(self, flush, interval: float, name: str):
+        self.flush = flush
+        self.interval = interval
+        self.name = name
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        # Последний сброс при остановке процесса
+        atexit.register(flush)
+
+    def ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def wake(self) -> None:
+        self._wakeup.set()
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self.flush()
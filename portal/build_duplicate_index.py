@@ -0,0 +1,53 @@
+"""
+Скрипт для (пере)построения индекса похожих постов: LSH-корзин
+и SimHash-отпечатков. Нужен один раз для уже существующих постов:
+новые и отредактированные посты индексируются автоматически.
+Использование: python -m portal.build_duplicate_index [--missing]
+
+  --missing  обработать только посты без SimHash-отпечатков
+"""
+import sys
+
+from portal import create_app
+from portal.duplicate_checker import index_posts
+from portal.extensions import db
+from portal.models import Post
+
+BATCH_SIZE = 500
+
+app = create_app()
+
+
+def build_duplicate_index(missing_only=False):
+    """Пересчитывает LSH-корзины и отпечатки постов пачками по BATCH_SIZE."""
+    with app.app_context():
+        base_query = Post.query
+        if missing_only:
+            base_query = base_query.filter(Post.text_simhash.is_(None))
+        total = base_query.count()
+        print(f"🔍 Индексирую {total} постов...")
+
+        processed = 0
+        last_id = 0
+        while True:
+            posts = (
+                base_query.filter(Post.id > last_id)
+                .order_by(Post.id.asc())
+                .limit(BATCH_SIZE)
+                .all()
+            )
+            if not posts:
+                break
+            index_posts(posts)
+            last_id = posts[-1].id
+            processed += len(posts)
+            db.session.commit()
+            # Освобождаем память сессии между пачками
+            db.session.expunge_all()
+            print(f"  Проиндексировано: {processed}/{total}")
+
+        print(f"✅ Готово! Проиндексировано постов: {processed}")
+
+
+if __name__ == "__main__":
+    build_duplicate_index(missing_only="--missing" in sys.argv)
@@ -0,0 +1,110 @@
+"""
+Офлайн-расчёт похожих постов по совместным лайкам (item-to-item).
+Для каждой пары постов считается косинусная близость по пользователям,
+которым понравились оба; в таблицу post_neighbor сохраняются top-K соседей
+каждого поста. Рекомендации и страница поста читают их по индексу.
+Запускать периодически (например, раз в сутки по cron).
+Использование: python -m portal.build_post_neighbors [--top-k 20] [--with-views]
+    [--min-common 2]
+
+  --with-views  учитывать и дочитанные просмотры (с меньшим весом)
+"""
+import argparse
+import heapq
+import math
+
+from sqlalchemy import delete, insert, or_
+
+from portal import create_app
+from portal.extensions import db
+from portal.models import PostLike, PostNeighbor, PostView
+
+LIKE_WEIGHT = 1.0
+VIEW_WEIGHT = 0.5
+# Просмотр засчитывается, если пост прочитан хотя бы наполовину
+VIEW_MIN_PROGRESS = 0.5
+# Пользователи с огромной историей дают квадратичное число пар и мало сигнала
+MAX_USER_ITEMS = 300
+STREAM_BATCH_SIZE = 5000
+INSERT_BATCH_SIZE = 5000
+
+app = create_app()
+
+
+def _user_items(with_views):
+    """Собирает {post_id: вес} по каждому пользователю (строки читаются пачками)."""
+    sources = [
+        db.session.query(PostLike.user_id, PostLike.post_id, db.literal(LIKE_WEIGHT))
+        .filter(PostLike.reaction == "like")
+    ]
+    if with_views:
+        sources.append(
+            db.session.query(PostView.user_id, PostView.post_id, db.literal(VIEW_WEIGHT))
+            .filter(or_(PostView.is_complete.is_(True), PostView.progress >= VIEW_MIN_PROGRESS))
+        )
+    items = {}
+    for query in sources:
+        for user_id, post_id, weight in query.execution_options(yield_per=STREAM_BATCH_SIZE):
+            user_items = items.setdefault(user_id, {})
+            user_items[post_id] = max(user_items.get(post_id, 0.0), weight)
+    yield from items.values()
+
+
+def compute_neighbors(top_k=20, with_views=False, min_common=2):
+    """Возвращает {post_id: [(neighbor_id, score), ...]} — top-K соседей по косинусу."""
+    norms = {}
+    co_weight = {}
+    co_count = {}
+    skipped = 0
+    for items in _user_items(with_views):
+        if len(items) > MAX_USER_ITEMS:
+            skipped += 1
+            continue
+        posts = sorted(items)
+        for i, a in enumerate(posts):
+            wa = items[a]
+            norms[a] = norms.get(a, 0.0) + wa * wa
+            for b in posts[i + 1:]:
+                key = (a, b)
+                co_weight[key] = co_weight.get(key, 0.0) + wa * items[b]
+                co_count[key] = co_count.get(key, 0) + 1
+    if skipped:
+        print(f"  ⚠️ Пропущено пользователей с историей больше {MAX_USER_ITEMS}: {skipped}")
+
+    candidates = {}
+    for (a, b), weight in co_weight.items():
+        if co_count[(a, b)] < min_common:
+            continue
+        score = weight / math.sqrt(norms[a] * norms[b])
+        candidates.setdefault(a, []).append((score, b))
+        candidates.setdefault(b, []).append((score, a))
+    return {
+        post_id: [(neighbor_id, score) for score, neighbor_id in heapq.nlargest(top_k, pairs)]
+        for post_id, pairs in candidates.items()
+    }
+
+
+def build_post_neighbors(top_k=20, with_views=False, min_common=2):
+    with app.app_context():
+        print("🔍 Считаю совместные лайки...")
+        neighbors = compute_neighbors(top_k=top_k, with_views=with_views, min_common=min_common)
+        rows = [
+            {"post_id": post_id, "neighbor_id": neighbor_id, "score": round(score, 6), "rank": rank}
+            for post_id, pairs in neighbors.items()
+            for rank, (neighbor_id, score) in enumerate(pairs)
+        ]
+        # Полная замена в одной транзакции: читатели видят либо старые, либо новые соседи
+        db.session.execute(delete(PostNeighbor))
+        for start in range(0, len(rows), INSERT_BATCH_SIZE):
+            db.session.execute(insert(PostNeighbor), rows[start:start + INSERT_BATCH_SIZE])
+        db.session.commit()
+        print(f"✅ Готово! Постов с соседями: {len(neighbors)}, связей: {len(rows)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Расчёт похожих постов по совместным лайкам.")
+    parser.add_argument("--top-k", type=int, default=20, help="Соседей на пост")
+    parser.add_argument("--with-views", action="store_true", help="Учитывать дочитанные просмотры")
+    parser.add_argument("--min-common", type=int, default=2, help="Минимум общих пользователей у пары")
+    args = parser.parse_args()
+    build_post_neighbors(top_k=max(1, args.top_k), with_views=args.with_views, min_common=max(1, args.min_common))
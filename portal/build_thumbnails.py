@@ -0,0 +1,60 @@
+"""
+Строит уменьшенные копии (см. portal/thumbnails.py) для уже загруженных
+картинок постов и аватаров. Уже готовые копии пропускаются, поэтому скрипт
+можно перезапускать после сбоя.
+Использование: python -m portal.build_thumbnails [--workers N]
+"""
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from portal import create_app
+from portal.extensions import db
+from portal.models import Post, User
+from portal.thumbnails import build_derivatives, is_supported, kind_widths
+
+app = create_app()
+
+
+def _build(task):
+    static_root, path, widths = task
+    try:
+        return path, build_derivatives(static_root, path, widths), None
+    except Exception as e:
+        return path, 0, e
+
+
+def build_thumbnails(workers=None):
+    with app.app_context():
+        if not is_supported():
+            print("⚠️ Pillow не установлен (pip install Pillow) — копии не строятся.")
+            return
+
+        static_root = app.static_folder
+        post_images = {
+            path for (path,) in db.session.query(Post.media_path).filter(
+                Post.media_path.isnot(None), Post.media_type != "video"
+            ).distinct()
+        }
+        avatars = {path for (path,) in db.session.query(User.avatar_path).filter(User.avatar_path.isnot(None)).distinct()}
+        tasks = [(static_root, path, kind_widths("post")) for path in sorted(post_images)]
+        tasks += [(static_root, path, kind_widths("avatar")) for path in sorted(avatars)]
+        tasks = [task for task in tasks if os.path.isfile(os.path.join(static_root, task[1]))]
+        print(f"🖼️ Картинок: {len(tasks)} (постов: {len(post_images)}, аватаров: {len(avatars)})")
+
+        created = failed = 0
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+            for path, count, error in pool.map(_build, tasks, chunksize=8):
+                if error is not None:
+                    failed += 1
+                    print(f"  ⚠️ {path}: {error}")
+                created += count
+        print(f"  Новых файлов: {created}, ошибок: {failed}")
+        print("✅ Готово!")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Уменьшенные копии загруженных картинок.")
+    parser.add_argument("--workers", type=int, default=None, help="Процессов (по умолчанию — по числу ядер)")
+    args = parser.parse_args()
+    build_thumbnails(workers=args.workers)
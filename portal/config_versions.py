@@ -0,0 +1,42 @@
+"""
+Версии настроек, которые каждый процесс держит у себя в памяти.
+
+Запись меняет данные и увеличивает версию в той же транзакции; процессы
+периодически читают одно число и перезагружают данные только при его изменении.
+"""
+from datetime import datetime, timezone
+
+from .extensions import db
+from .models import ConfigVersion
+
+
+def get_config_version(key: str) -> int:
+    """Текущая версия настройки (0, если её ещё не меняли)."""
+    version = db.session.query(ConfigVersion.version).filter_by(key=key).scalar()
+    return version or 0
+
+
+def bump_config_version(key: str) -> int:
+    """Увеличивает версию в текущей транзакции и возвращает новое значение."""
+    updated = (
+        ConfigVersion.query.filter_by(key=key)
+        .update(
+            {"version": ConfigVersion.version + 1, "updated_at": datetime.now(timezone.utc)},
+            synchronize_session=False,
+        )
+    )
+    if not updated:
+        db.session.add(ConfigVersion(key=key, version=1))
+        db.session.flush()
+    return get_config_version(key)
+
+
+def set_config_version(key: str, version: int) -> None:
+    """Поднимает версию до version (не ниже текущей) в текущей транзакции."""
+    updated = (
+        ConfigVersion.query.filter(ConfigVersion.key == key, ConfigVersion.version < version)
+        .update({"version": version, "updated_at": datetime.now(timezone.utc)}, synchronize_session=False)
+    )
+    if not updated and not db.session.query(ConfigVersion.id).filter_by(key=key).first():
+        db.session.add(ConfigVersion(key=key, version=version))
+        db.session.flush()
@@ -0,0 +1,118 @@
+"""
+Денормализованные счётчики на Post и User.
+
+Частые записи (комментарий, реакция, новый зритель, подписка) меняют счётчики
+атомарным UPDATE col = col + delta в той же транзакции. Удаления задевают много
+строк сразу, поэтому для них затронутые посты и пользователи пересчитываются
+целиком (recount_posts / recount_users) — тем же кодом, что и полная сверка
+python -m portal.reconcile_counters.
+"""
+from sqlalchemy import func, select, update
+
+from .extensions import db
+from .models import Comment, Follow, Post, PostLike, PostView, User
+
+# Счётчик на Post для каждого типа реакции
+REACTION_COUNTERS = {
+    "like": "likes_count",
+    "dislike": "dislikes_count",
+}
+
+
+def _adjust(model, object_id: int, deltas: dict) -> None:
+    values = {name: getattr(model, name) + delta for name, delta in deltas.items() if delta}
+    if not values:
+        return
+    db.session.execute(
+        update(model)
+        .where(model.id == object_id)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def adjust_post_counters(post_id: int, **deltas) -> None:
+    """Например: adjust_post_counters(post.id, comments_count=1)."""
+    _adjust(Post, post_id, deltas)
+
+
+def adjust_user_counters(user_id: int, **deltas) -> None:
+    """Например: adjust_user_counters(user.id, followers_count=-1)."""
+    _adjust(User, user_id, deltas)
+
+
+def adjust_reaction_counters(post_id: int, old_reaction, new_reaction) -> None:
+    """Учитывает смену реакции (None — реакции не было / реакция снята)."""
+    deltas = {}
+    if old_reaction in REACTION_COUNTERS:
+        deltas[REACTION_COUNTERS[old_reaction]] = -1
+    if new_reaction in REACTION_COUNTERS:
+        name = REACTION_COUNTERS[new_reaction]
+        deltas[name] = deltas.get(name, 0) + 1
+    adjust_post_counters(post_id, **deltas)
+
+
+def _count(model, column, owner_column, **filters):
+    query = select(func.count(column)).where(owner_column)
+    for name, value in filters.items():
+        query = query.where(getattr(model, name) == value)
+    return query.scalar_subquery()
+
+
+def recount_posts(post_ids=None) -> None:
+    """Пересчитывает счётчики постов (всех, если post_ids не задан)."""
+    db.session.flush()
+    values = {
+        "comments_count": _count(Comment, Comment.id, Comment.post_id == Post.id),
+        "viewers_count": _count(PostView, PostView.id, PostView.post_id == Post.id),
+    }
+    for reaction, name in REACTION_COUNTERS.items():
+        values[name] = _count(PostLike, PostLike.id, PostLike.post_id == Post.id, reaction=reaction)
+    statement = update(Post).values(**values).execution_options(synchronize_session=False)
+    if post_ids is not None:
+        if not post_ids:
+            return
+        statement = statement.where(Post.id.in_(list(post_ids)))
+    db.session.execute(statement)
+
+
+def recount_users(user_ids=None) -> None:
+    """Пересчитывает счётчики пользователей (всех, если user_ids не задан)."""
+    db.session.flush()
+    values = {
+        "posts_count": _count(Post, Post.id, Post.author_id == User.id),
+        "comments_count": _count(Comment, Comment.id, Comment.author_id == User.id),
+        "followers_count": _count(Follow, Follow.id, Follow.followed_id == User.id),
+        "following_count": _count(Follow, Follow.id, Follow.follower_id == User.id),
+    }
+    statement = update(User).values(**values).execution_options(synchronize_session=False)
+    if user_ids is not None:
+        if not user_ids:
+            return
+        statement = statement.where(User.id.in_(list(user_ids)))
+    db.session.execute(statement)
+
+
+def users_affected_by_post_delete(post_ids) -> set:
+    """Авторы постов и их комментаторов — их счётчики изменятся при удалении постов."""
+    post_ids = list(post_ids)
+    if not post_ids:
+        return set()
+    authors = db.session.query(Post.author_id).filter(Post.id.in_(post_ids))
+    commenters = db.session.query(Comment.author_id).filter(Comment.post_id.in_(post_ids))
+    return {uid for (uid,) in authors.union(commenters)}
+
+
+def affected_by_user_delete(user_id: int) -> tuple:
+    """(post_ids, user_ids), чьи счётчики изменятся при удалении пользователя."""
+    own_post_ids = {pid for (pid,) in db.session.query(Post.id).filter(Post.author_id == user_id)}
+    interactions = db.session.query(Comment.post_id).filter(Comment.author_id == user_id).union(
+        db.session.query(PostLike.post_id).filter(PostLike.user_id == user_id),
+        db.session.query(PostView.post_id).filter(PostView.user_id == user_id),
+    )
+    post_ids = {pid for (pid,) in interactions} - own_post_ids
+    user_ids = users_affected_by_post_delete(own_post_ids)
+    user_ids |= {uid for (uid,) in db.session.query(Follow.follower_id).filter(Follow.followed_id == user_id)}
+    user_ids |= {uid for (uid,) in db.session.query(Follow.followed_id).filter(Follow.follower_id == user_id)}
+    user_ids.discard(user_id)
+    return post_ids, user_ids
@@ -0,0 +1,31 @@
+"""
+Пересчёт горячести постов с нуля (см. portal/hotness.py).
+Затухание хранится в самом счёте, поэтому периодический пересчёт не нужен;
+пересчёт по истории нужен после смены HOT_HALF_LIFE_HOURS или ручных правок в БД.
+Использование: python -m portal.decay_hot_scores --rebuild
+
+  --rebuild  пересчитать горячесть по всей истории комментариев,
+             реакций и просмотров
+"""
+import sys
+
+from portal import create_app
+from portal.extensions import db
+from portal.hotness import rebuild_hot_scores as rebuild_scores
+
+app = create_app()
+
+
+def rebuild_hot_scores():
+    """Считает горячесть заново по всей истории событий."""
+    with app.app_context():
+        total = rebuild_scores(app.config["HOT_HALF_LIFE_HOURS"])
+        db.session.commit()
+        print(f"✅ Горячесть рассчитана заново для {total} постов")
+
+
+if __name__ == "__main__":
+    if "--rebuild" in sys.argv:
+        rebuild_hot_scores()
+    else:
+        print(__doc__)
@@ -0,0 +1,377 @@
+"""
+Отчёт о кластерах дубликатов по всей базе постов.
+
+Пары-кандидаты берутся из LSH-индекса (post_lsh_bucket), поэтому перед первым
+запуском индекс должен быть построен: python -m portal.build_duplicate_index.
+Посты индекса делятся на шарды по id; процесс сам выбирает из индекса пары
+«пост шарда — пост с большим id» и сравнивает их точно, так что все пары
+в памяти не собираются. Совпадения шарда дописываются строкой в
+<checkpoint>.edges.jsonl, а в контрольной точке хранятся только номера готовых
+шардов: прерванный запуск продолжится с места остановки. В конце совпадения
+объединяются в кластеры через union-find.
+
+Использование:
+    python -m portal.dedup_report [--output dedup_report.json] [--format json|csv]
+        [--threshold 0.85] [--workers N] [--shard-size 2000]
+        [--checkpoint dedup_report.checkpoint.json] [--published-only]
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime, timezone
+from difflib import SequenceMatcher
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import Session
+
+from portal import create_app
+from portal.duplicate_checker import normalize_text
+from portal.extensions import db
+from portal.models import Post, PostLshBucket
+
+# Корзины больше этого размера — шаблонный текст, их пары не сравниваем
+MAX_BUCKET_SIZE = 200
+STREAM_BATCH_SIZE = 5000
+
+_worker_session = None
+_worker_threshold = 0.85
+_worker_published_only = False
+_worker_oversized = ()
+
+
+class UnionFind:
+    """Система непересекающихся множеств со сжатием путей."""
+
+    def __init__(self):
+        self.parent = {}
+        self.size = {}
+
+    def find(self, item: int) -> int:
+        root = self.parent.setdefault(item, item)
+        if root == item:
+            self.size.setdefault(item, 1)
+            return item
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[item] != root:
+            self.parent[item], item = root, self.parent[item]
+        return root
+
+    def union(self, a: int, b: int) -> None:
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a == root_b:
+            return
+        if self.size[root_a] < self.size[root_b]:
+            root_a, root_b = root_b, root_a
+        self.parent[root_b] = root_a
+        self.size[root_a] += self.size.pop(root_b)
+
+    def groups(self) -> list:
+        clusters = {}
+        for item in self.parent:
+            clusters.setdefault(self.find(item), []).append(item)
+        return [sorted(members) for members in clusters.values() if len(members) > 1]
+
+
+def _init_worker(database_url: str, threshold: float, published_only: bool, oversized: tuple) -> None:
+    """
+    Каждый процесс открывает собственное подключение к БД. Приложение не
+    создаётся: create_app() в каждом процессе заново проверял бы миграции и админов.
+    """
+    global _worker_session, _worker_threshold, _worker_published_only, _worker_oversized
+    _worker_session = Session(create_engine(database_url))
+    _worker_threshold = threshold
+    _worker_published_only = published_only
+    _worker_oversized = oversized
+
+
+def _bucket_members(published_only: bool):
+    """(bucket, post_id) индекса LSH, при published_only — только опубликованных постов."""
+    query = select(PostLshBucket.bucket, PostLshBucket.post_id)
+    if published_only:
+        query = query.join(Post, Post.id == PostLshBucket.post_id).where(Post.is_published.is_(True))
+    return query
+
+
+def _oversized_buckets(published_only: bool):
+    """Корзины больше MAX_BUCKET_SIZE — шаблонный текст, их пары не сравниваем."""
+    members = _bucket_members(published_only).subquery()
+    return select(members.c.bucket).group_by(members.c.bucket).having(func.count() > MAX_BUCKET_SIZE)
+
+
+def _shard_pairs(session, first_id: int, last_id: int, published_only: bool, oversized) -> list:
+    """
+    Уникальные пары (a, b), a < b, где a — пост шарда [first_id, last_id], а b делит
+    с ним корзину не из oversized.
+    """
+    left = _bucket_members(published_only).subquery()
+    right = _bucket_members(published_only).subquery()
+    query = (
+        select(left.c.post_id, right.c.post_id)
+        .distinct()
+        .join(right, right.c.bucket == left.c.bucket)
+        .where(
+            left.c.post_id.between(first_id, last_id),
+            right.c.post_id > left.c.post_id,
+            left.c.bucket.not_in(oversized),
+        )
+    )
+    return [tuple(row) for row in session.execute(query)]
+
+
+def _compare_shard(shard_index: int, first_id: int, last_id: int) -> tuple:
+    """Сравнивает пары шарда, возвращает (shard_index, [(a, b, similarity), ...])."""
+    pairs = _shard_pairs(_worker_session, first_id, last_id, _worker_published_only, _worker_oversized)
+    ids = {pid for pair in pairs for pid in pair}
+    rows = _worker_session.execute(select(Post.id, Post.title, Post.body).where(Post.id.in_(ids))).all()
+    # Закрываем транзакцию чтения, чтобы процесс не держал снимок БД между шардами
+    _worker_session.rollback()
+    texts = {}
+    for pid, title, body in rows:
+        norm_title = normalize_text(title)
+        texts[pid] = (norm_title, f"{norm_title} {normalize_text(body)}")
+
+    matches = []
+    for a, b in pairs:
+        if a not in texts or b not in texts:
+            continue
+        title_a, text_a = texts[a]
+        title_b, text_b = texts[b]
+        # Та же формула, что и в check_duplicate: заголовок важнее
+        title_sim = SequenceMatcher(None, title_a, title_b).ratio() if title_a and title_b else 0.0
+        text_sim = SequenceMatcher(None, text_a, text_b).ratio() if text_a.strip() and text_b.strip() else 0.0
+        similarity = (title_sim * 0.6) + (text_sim * 0.4)
+        if similarity >= _worker_threshold:
+            matches.append((a, b, round(similarity, 4)))
+    return shard_index, matches
+
+
+def _shards(published_only: bool, shard_size: int) -> list:
+    """Границы шардов [(первый id, последний id), ...] по постам из индекса LSH."""
+    members = _bucket_members(published_only).subquery()
+    query = select(members.c.post_id).distinct().order_by(members.c.post_id)
+    shards = []
+    first_id = last_id = None
+    count = 0
+    for (post_id,) in db.session.execute(query.execution_options(yield_per=STREAM_BATCH_SIZE)):
+        if count == shard_size:
+            shards.append((first_id, last_id))
+            first_id, count = None, 0
+        if first_id is None:
+            first_id = post_id
+        last_id = post_id
+        count += 1
+    if first_id is not None:
+        shards.append((first_id, last_id))
+    return shards
+
+
+def _corpus_signature(published_only: bool) -> dict:
+    return {
+        "posts": Post.query.count(),
+        "max_post_id": db.session.query(func.max(Post.id)).scalar() or 0,
+        "buckets": db.session.query(func.count(PostLshBucket.id)).scalar() or 0,
+        "published_only": published_only,
+    }
+
+
+def _load_checkpoint(path: str, settings: dict) -> dict:
+    if not path or not os.path.exists(path):
+        return {"done": []}
+    with open(path, encoding="utf-8") as f:
+        state = json.load(f)
+    if any(state.get(key) != value for key, value in settings.items()):
+        print("⚠️ Контрольная точка относится к другому состоянию базы — начинаю заново.", file=sys.stderr)
+        return {"done": []}
+    print(f"↩️ Продолжаю с контрольной точки: готово шардов {len(state['done'])}.", file=sys.stderr)
+    return state
+
+
+def _save_checkpoint(path: str, state: dict) -> None:
+    if not path:
+        return
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+
+def _append_edges(f, shard_index: int, matches: list) -> None:
+    """Дописывает совпадения шарда; до записи контрольной точки они уже на диске."""
+    f.write(json.dumps({"shard": shard_index, "edges": matches}) + "\n")
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def _read_edges(path: str, done: set):
+    """
+    Совпадения готовых шардов из файла. Строки шардов, не попавших в контрольную
+    точку (запуск прервался между записями), и повторы пропускаются.
+    """
+    seen = set()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Недописанная последняя строка прерванного запуска
+                continue
+            if record["shard"] not in done or record["shard"] in seen:
+                continue
+            seen.add(record["shard"])
+            for a, b, similarity in record["edges"]:
+                yield a, b, similarity
+
+
+def _print_progress(done: int, total: int, matches: int, started: float) -> None:
+    percent = (done / total * 100) if total else 100.0
+    elapsed = time.monotonic() - started
+    print(
+        f"\r  Шардов: {done}/{total} ({percent:.1f}%), совпадений: {matches}, прошло {elapsed:.0f} с",
+        end="",
+        file=sys.stderr,
+        flush=True,
+    )
+
+
+def _write_report(path: str, fmt: str, clusters: list, edges, threshold: float) -> None:
+    member_ids = [pid for cluster in clusters for pid in cluster]
+    titles = {}
+    for start in range(0, len(member_ids), STREAM_BATCH_SIZE):
+        chunk = member_ids[start:start + STREAM_BATCH_SIZE]
+        titles.update(Post.query.with_entities(Post.id, Post.title).filter(Post.id.in_(chunk)).all())
+
+    clusters = sorted(clusters, key=len, reverse=True)
+    if fmt == "csv":
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["cluster_id", "cluster_size", "post_id", "title"])
+            for cluster_id, members in enumerate(clusters, start=1):
+                for pid in members:
+                    writer.writerow([cluster_id, len(members), pid, titles.get(pid, "")])
+        return
+
+    cluster_of = {pid: idx for idx, members in enumerate(clusters) for pid in members}
+    cluster_pairs = [[] for _ in clusters]
+    for a, b, similarity in edges:
+        cluster_pairs[cluster_of[a]].append({"a": a, "b": b, "similarity": similarity})
+    report = {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "threshold": threshold,
+        "clusters": [
+            {
+                "id": idx + 1,
+                "size": len(members),
+                "posts": [{"id": pid, "title": titles.get(pid, "")} for pid in members],
+                "pairs": cluster_pairs[idx],
+            }
+            for idx, members in enumerate(clusters)
+        ],
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+def build_report(output: str, fmt: str, threshold: float, workers: int, shard_size: int,
+                 checkpoint: str, published_only: bool) -> None:
+    app = create_app()
+    with app.app_context():
+        signature = _corpus_signature(published_only)
+        print(f"🔍 Делю на шарды {signature['posts']} постов...", file=sys.stderr)
+        shards = _shards(published_only, shard_size)
+        # Большие корзины считаются один раз здесь и передаются процессам списком
+        oversized = tuple(db.session.scalars(_oversized_buckets(published_only)))
+        if oversized:
+            print(f"  ⚠️ Пропущено слишком больших корзин: {len(oversized)}", file=sys.stderr)
+        print(f"📋 Шардов: {len(shards)}, процессов: {workers}", file=sys.stderr)
+        database_url = db.engine.url.render_as_string(hide_password=False)
+
+        settings = {"corpus": signature, "threshold": threshold, "shard_size": shard_size}
+        state = _load_checkpoint(checkpoint, settings)
+        state.update(settings)
+        done = set(state["done"])
+        pending = [idx for idx in range(len(shards)) if idx not in done]
+
+        if checkpoint:
+            edges_path = f"{checkpoint}.edges.jsonl"
+        else:
+            fd, edges_path = tempfile.mkstemp(prefix="dedup_report-", suffix=".edges.jsonl")
+            os.close(fd)
+        # Совпадения прошлого запуска нужны, только если продолжаем с контрольной точки
+        edges_file = open(edges_path, "a" if done else "w", encoding="utf-8")
+        matched = 0
+
+        started = time.monotonic()
+        _print_progress(len(done), len(shards), matched, started)
+        try:
+            if pending:
+                with ProcessPoolExecutor(
+                    max_workers=workers,
+                    initializer=_init_worker,
+                    initargs=(database_url, threshold, published_only, oversized),
+                ) as pool:
+                    queue = iter(pending)
+                    in_flight = set()
+                    # Ограничиваем число задач в очереди, чтобы не держать все шарды в памяти процессов
+                    for shard_index in queue:
+                        in_flight.add(pool.submit(_compare_shard, shard_index, *shards[shard_index]))
+                        if len(in_flight) >= workers * 2:
+                            break
+                    while in_flight:
+                        finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for future in finished:
+                            shard_index, matches = future.result()
+                            _append_edges(edges_file, shard_index, matches)
+                            done.add(shard_index)
+                            matched += len(matches)
+                            next_index = next(queue, None)
+                            if next_index is not None:
+                                in_flight.add(pool.submit(_compare_shard, next_index, *shards[next_index]))
+                        state["done"] = sorted(done)
+                        _save_checkpoint(checkpoint, state)
+                        _print_progress(len(done), len(shards), matched, started)
+        finally:
+            edges_file.close()
+        print(file=sys.stderr)
+
+        uf = UnionFind()
+        for a, b, _similarity in _read_edges(edges_path, done):
+            uf.union(a, b)
+        clusters = uf.groups()
+        _write_report(output, fmt, clusters, _read_edges(edges_path, done), threshold)
+
+    for path in (checkpoint, edges_path):
+        if path and os.path.exists(path):
+            os.remove(path)
+    print(f"✅ Кластеров дубликатов: {len(clusters)}. Отчёт сохранён в {output}", file=sys.stderr)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Поиск кластеров дубликатов по всей базе постов.")
+    parser.add_argument("--output", default=None, help="Файл отчёта (по умолчанию dedup_report.<format>)")
+    parser.add_argument("--format", choices=("json", "csv"), default="json")
+    parser.add_argument("--threshold", type=float, default=0.85, help="Порог схожести (0.0 - 1.0)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--shard-size", type=int, default=2000, help="Постов в одном задании для процесса")
+    parser.add_argument("--checkpoint", default="dedup_report.checkpoint.json")
+    parser.add_argument("--published-only", action="store_true", help="Только опубликованные посты")
+    args = parser.parse_args(argv)
+
+    build_report(
+        output=args.output or f"dedup_report.{args.format}",
+        fmt=args.format,
+        threshold=args.threshold,
+        workers=max(1, args.workers),
+        shard_size=max(1, args.shard_size),
+        checkpoint=args.checkpoint,
+        published_only=args.published_only,
+    )
+
+
+if __name__ == "__main__":
+    main()
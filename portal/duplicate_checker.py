@@ -1,12 +1,66 @@
 """
 Модуль для проверки дубликатов постов.
 Использует различные алгоритмы для определения схожести контента.
+
+Чтобы не сравнивать новый пост со всей базой, для каждого поста хранится
+индекс MinHash/LSH (таблица post_lsh_bucket). Проверка сначала выбирает
+кандидатов из общих корзин и только для них считает точную схожесть.
+
+Дополнительно у поста хранятся 64-битные SimHash заголовка и полного текста
+(колонки title_simhash / text_simhash) и их 16-битные полосы (post_simhash_band).
+Почти идентичные посты находятся по полосам за один индексированный запрос и
+добавляются к кандидатам: близость по Хэммингу в пределах SIMHASH_MAX_DISTANCE
+всегда не меньше 0.95 и с порогом точной схожести не сравнима, поэтому
+дубликатом пост признаёт только точное сравнение. Нормализованный текст
+кандидатов кэшируется в процессе по (id, updated_at).
 """
+import hashlib
+import random
 import re
+import threading
 from difflib import SequenceMatcher
 from typing import Optional, Tuple
 
-from .models import Post
+from sqlalchemy import bindparam, delete, func, insert, select, update
+
+from .extensions import db
+from .models import Post, PostLshBucket, PostSimhashBand
+
+# Параметры LSH: 20 полос по 3 строки. Пары с Jaccard ~0.5 попадают
+# в общую корзину с вероятностью ~93%, случайные тексты — почти никогда.
+LSH_BANDS = 20
+LSH_ROWS = 3
+MINHASH_PERMUTATIONS = LSH_BANDS * LSH_ROWS
+# Сколько лучших кандидатов проверять точным сравнением
+MAX_CANDIDATES = 50
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_BUCKET_MASK = (1 << 63) - 1  # корзина должна помещаться в знаковый BIGINT
+
+# Фиксированное зерно: сигнатуры должны совпадать между процессами и перезапусками
+_rng = random.Random(20240917)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(MINHASH_PERMUTATIONS)
+]
+
+# SimHash: 64 бита делятся на 4 полосы по 16 бит. Если отпечатки отличаются
+# не более чем на 3 бита, хотя бы одна полоса совпадает целиком.
+SIMHASH_BITS = 64
+SIMHASH_BANDS = 4
+SIMHASH_BAND_BITS = SIMHASH_BITS // SIMHASH_BANDS
+SIMHASH_MAX_DISTANCE = SIMHASH_BANDS - 1
+_SIMHASH_MASK = (1 << SIMHASH_BITS) - 1
+_SIMHASH_KINDS = {"t": 0, "x": 1}
+
+# Пачка постов при индексации существующих постов в миграциях
+INDEX_BATCH_SIZE = 500
+
+# Сколько постов помнит кэш нормализованных текстов
+NORMALIZED_CACHE_MAX_ENTRIES = 5000
+_normalized_lock = threading.Lock()
+# {(id поста, updated_at): (заголовок, заголовок + текст)}
+_normalized = {}
 
 
 def normalize_text(text: str) -> str:
@@ -31,6 +85,249 @@ def calculate_similarity(text1: str, text2: str) -> float:
     return SequenceMatcher(None, norm1, norm2).ratio()
 
 
+def _normalized_post(post: Post) -> tuple:
+    """(нормализованный заголовок, заголовок + текст) поста; результат кэшируется в процессе."""
+    key = (post.id, post.updated_at)
+    with _normalized_lock:
+        cached = _normalized.get(key)
+    if cached is not None:
+        return cached
+    title = normalize_text(post.title)
+    value = (title, f"{title} {normalize_text(post.body)}")
+    with _normalized_lock:
+        if len(_normalized) >= NORMALIZED_CACHE_MAX_ENTRIES:
+            _normalized.clear()
+        _normalized[key] = value
+    return value
+
+
+def _ratio(a: str, b: str) -> float:
+    return SequenceMatcher(None, a, b).ratio() if a.strip() and b.strip() else 0.0
+
+
+def _hash64(value: str) -> int:
+    """Стабильный 64-битный хеш (встроенный hash() случаен между процессами)."""
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def _title_shingles(title: str) -> set:
+    """Символьные 3-граммы заголовка: заголовки короткие, слов в них мало."""
+    norm = normalize_text(title)
+    if len(norm) < 3:
+        return {norm} if norm else set()
+    return {norm[i:i + 3] for i in range(len(norm) - 2)}
+
+
+def _text_shingles(title: str, body: str) -> set:
+    """Пары соседних слов полного текста."""
+    words = f"{normalize_text(title)} {normalize_text(body)}".split()
+    if len(words) < 2:
+        return set(words)
+    return {f"{words[i]} {words[i + 1]}" for i in range(len(words) - 1)}
+
+
+def minhash_signature(shingles: set) -> list:
+    """MinHash-сигнатура множества шинглов."""
+    hashes = [_hash64(s) for s in shingles]
+    if not hashes:
+        return []
+    return [min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in _PERMUTATIONS]
+
+
+def _signature_buckets(kind: str, signature: list) -> set:
+    """Разбивает сигнатуру на полосы и возвращает идентификаторы корзин."""
+    buckets = set()
+    if not signature:
+        return buckets
+    for band in range(LSH_BANDS):
+        rows = signature[band * LSH_ROWS:(band + 1) * LSH_ROWS]
+        key = f"{kind}:{band}:" + ":".join(str(r) for r in rows)
+        buckets.add(_hash64(key) & _BUCKET_MASK)
+    return buckets
+
+
+def simhash(shingles: set) -> Optional[int]:
+    """64-битный SimHash множества шинглов (знаковый, чтобы помещаться в BIGINT)."""
+    hashes = [_hash64(s) for s in shingles]
+    if not hashes:
+        return None
+    value = 0
+    for bit in range(SIMHASH_BITS):
+        ones = sum((h >> bit) & 1 for h in hashes)
+        if ones * 2 > len(hashes):
+            value |= 1 << bit
+    return value - (1 << SIMHASH_BITS) if value >> (SIMHASH_BITS - 1) else value
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """Количество различающихся бит двух отпечатков."""
+    return bin((a ^ b) & _SIMHASH_MASK).count("1")
+
+
+def _simhash_band_keys(kind: str, fingerprint: Optional[int]) -> set:
+    """Ключи полос отпечатка: вид отпечатка, номер полосы и её 16 бит."""
+    if fingerprint is None:
+        return set()
+    unsigned = fingerprint & _SIMHASH_MASK
+    band_mask = (1 << SIMHASH_BAND_BITS) - 1
+    return {
+        (_SIMHASH_KINDS[kind] << 20) | (band << 16) | ((unsigned >> (band * SIMHASH_BAND_BITS)) & band_mask)
+        for band in range(SIMHASH_BANDS)
+    }
+
+
+def compute_simhashes(title: str, body: str) -> Tuple[Optional[int], Optional[int]]:
+    """SimHash нормализованного заголовка и полного текста."""
+    return (
+        simhash(_title_shingles(title or "")),
+        simhash(_text_shingles(title or "", body or "")),
+    )
+
+
+def compute_lsh_buckets(title: str, body: str) -> set:
+    """Корзины LSH для заголовка и полного текста поста."""
+    buckets = _signature_buckets("t", minhash_signature(_title_shingles(title or "")))
+    buckets |= _signature_buckets("x", minhash_signature(_text_shingles(title or "", body or "")))
+    return buckets
+
+
+def _write_index(posts, replace: bool) -> list:
+    """
+    Пишет корзины и полосы постов (что угодно с id, title и body) и возвращает
+    их отпечатки [(title_simhash, text_simhash), ...] в порядке posts.
+    """
+    fingerprints = []
+    buckets = []
+    bands = []
+    for post in posts:
+        title_fp, text_fp = compute_simhashes(post.title, post.body)
+        fingerprints.append((title_fp, text_fp))
+        buckets += [
+            {"post_id": post.id, "bucket": bucket} for bucket in compute_lsh_buckets(post.title, post.body)
+        ]
+        band_keys = _simhash_band_keys("t", title_fp) | _simhash_band_keys("x", text_fp)
+        bands += [{"post_id": post.id, "band_key": key} for key in band_keys]
+    if replace:
+        post_ids = [post.id for post in posts]
+        for model in (PostLshBucket, PostSimhashBand):
+            db.session.execute(
+                delete(model).where(model.post_id.in_(post_ids)).execution_options(synchronize_session=False)
+            )
+    if buckets:
+        db.session.execute(insert(PostLshBucket), buckets)
+    if bands:
+        db.session.execute(insert(PostSimhashBand), bands)
+    return fingerprints
+
+
+def index_posts(posts: list, replace: bool = True) -> None:
+    """
+    Обновляет LSH-индекс и SimHash-отпечатки постов. Нужен id поста, поэтому
+    вызывается после flush. Корзины и полосы всех постов пишутся одним
+    пакетным INSERT на таблицу, а не строкой на корзину. replace=False — для
+    только что созданных постов, у которых строк индекса ещё нет. При удалении
+    поста строки индекса удаляются каскадом.
+    """
+    for post, (title_fp, text_fp) in zip(posts, _write_index(posts, replace)):
+        post.title_simhash, post.text_simhash = title_fp, text_fp
+
+
+def index_missing_posts(batch_size: int = INDEX_BATCH_SIZE) -> int:
+    """
+    Индексирует посты без SimHash-отпечатков пачками по id; возвращает их число.
+    Читает и пишет только колонки индекса, поэтому годится для миграций, пока
+    остальных колонок модели Post в таблице ещё нет.
+    """
+    post = Post.__table__
+    set_fingerprints = (
+        update(post)
+        .where(post.c.id == bindparam("post_id"))
+        .values(title_simhash=bindparam("title_fp"), text_simhash=bindparam("text_fp"))
+    )
+    indexed = last_id = 0
+    while True:
+        rows = db.session.execute(
+            select(post.c.id, post.c.title, post.c.body)
+            .where(post.c.text_simhash.is_(None), post.c.id > last_id)
+            .order_by(post.c.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return indexed
+        fingerprints = _write_index(rows, replace=True)
+        db.session.execute(
+            set_fingerprints,
+            [
+                {"post_id": row.id, "title_fp": title_fp, "text_fp": text_fp}
+                for row, (title_fp, text_fp) in zip(rows, fingerprints)
+            ],
+        )
+        indexed += len(rows)
+        last_id = rows[-1].id
+
+
+def index_post(post: Post, replace: bool = True) -> None:
+    """Индексирует один пост (см. index_posts); вызывать после flush."""
+    index_posts([post], replace=replace)
+
+
+def find_near_identical(post_id: int, title_fp: Optional[int], text_fp: Optional[int]) -> set:
+    """
+    Находит ID опубликованных постов, у которых оба отпечатка отличаются
+    не более чем на SIMHASH_MAX_DISTANCE бит.
+    """
+    if title_fp is None or text_fp is None:
+        return set()
+    band_keys = _simhash_band_keys("t", title_fp) | _simhash_band_keys("x", text_fp)
+    rows = (
+        db.session.query(Post.id, Post.title_simhash, Post.text_simhash)
+        .join(PostSimhashBand, PostSimhashBand.post_id == Post.id)
+        .filter(PostSimhashBand.band_key.in_(band_keys))
+        .filter(Post.id != post_id)
+        .filter(Post.is_published.is_(True))
+        .distinct()
+        .all()
+    )
+    return {
+        pid
+        for pid, post_title_fp, post_text_fp in rows
+        if post_title_fp is not None
+        and post_text_fp is not None
+        and hamming_distance(title_fp, post_title_fp) <= SIMHASH_MAX_DISTANCE
+        and hamming_distance(text_fp, post_text_fp) <= SIMHASH_MAX_DISTANCE
+    }
+
+
+def find_candidate_ids(post_id: int, title: str, body: str, limit: int = MAX_CANDIDATES) -> list:
+    """
+    Находит ID опубликованных постов, попавших хотя бы в одну общую корзину.
+    Чем больше общих корзин, тем выше кандидат в списке.
+    """
+    buckets = compute_lsh_buckets(title, body)
+    if not buckets:
+        return []
+    shared = func.count(PostLshBucket.id)
+    rows = (
+        db.session.query(PostLshBucket.post_id, shared)
+        .join(Post, Post.id == PostLshBucket.post_id)
+        .filter(PostLshBucket.bucket.in_(buckets))
+        .filter(PostLshBucket.post_id != post_id)
+        .filter(Post.is_published.is_(True))
+        .group_by(PostLshBucket.post_id)
+        .order_by(shared.desc())
+        .limit(limit)
+        .all()
+    )
+    return [row[0] for row in rows]
+
+
+def _load_candidates(post_id: int, title: str, body: str) -> list:
+    candidate_ids = find_candidate_ids(post_id, title, body)
+    if not candidate_ids:
+        return []
+    return Post.query.filter(Post.id.in_(candidate_ids)).all()
+
+
 def find_similar_posts(post_id: int, title: str, body: str, threshold: float = 0.7) -> list:
     """
     Находит похожие посты.
@@ -47,18 +344,16 @@ def find_similar_posts(post_id: int, title: str, body: str, threshold: float = 0
     if not title and not body:
         return []
     
-    # Получаем все опубликованные посты кроме текущего
-    all_posts = Post.query.filter(
-        Post.id != post_id,
-        Post.is_published.is_(True)
-    ).all()
+    # Точное сравнение только с кандидатами из LSH-индекса
+    candidates = _load_candidates(post_id, title, body)
     
     similar = []
-    combined_text = f"{title} {body}"
+    norm_title = normalize_text(title)
+    combined_text = f"{norm_title} {normalize_text(body)}"
     
-    for post in all_posts:
-        post_combined = f"{post.title} {post.body}"
-        similarity = calculate_similarity(combined_text, post_combined)
+    for post in candidates:
+        _, post_combined = _normalized_post(post)
+        similarity = _ratio(combined_text, post_combined)
         
         if similarity >= threshold:
             similar.append((post, similarity))
@@ -85,14 +380,14 @@ def check_duplicate(post_id: int, title: str, body: str, threshold: float = 0.85
     if not title and not body:
         return None
     
-    # Получаем все опубликованные посты кроме текущего
-    all_posts = Post.query.filter(
-        Post.id != post_id,
-        Post.is_published.is_(True)
-    ).all()
-    
-    if not all_posts:
+    # Почти идентичные по отпечаткам — тоже только кандидаты: схожесть по Хэммингу
+    # у них всегда выше порога, решает точное сравнение
+    title_fp, text_fp = compute_simhashes(title, body)
+    near = find_near_identical(post_id, title_fp, text_fp)
+    candidate_ids = set(find_candidate_ids(post_id, title, body)) | near
+    if not candidate_ids:
         return None
+    candidates = Post.query.filter(Post.id.in_(candidate_ids)).all()
     
     best_match = None
     best_similarity = 0.0
@@ -102,13 +397,13 @@ def check_duplicate(post_id: int, title: str, body: str, threshold: float = 0.85
     norm_body = normalize_text(body)
     combined_text = f"{norm_title} {norm_body}"
     
-    for post in all_posts:
+    for post in candidates:
+        post_title, post_combined = _normalized_post(post)
         # Сравниваем заголовки (более важны)
-        title_sim = calculate_similarity(title, post.title) if title and post.title else 0.0
+        title_sim = _ratio(norm_title, post_title)
         
         # Сравниваем полный текст
-        post_combined = f"{normalize_text(post.title)} {normalize_text(post.body)}"
-        text_sim = calculate_similarity(combined_text, post_combined)
+        text_sim = _ratio(combined_text, post_combined)
         
         # Взвешенная схожесть (заголовок важнее)
         similarity = (title_sim * 0.6) + (text_sim * 0.4)
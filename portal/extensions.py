@@ -1,7 +1,14 @@
 from flask_login import LoginManager
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects import postgresql, sqlite
 
 db = SQLAlchemy()
 login_manager = LoginManager()
 
 
+def upsert_insert(table):
+    """INSERT с ON CONFLICT DO NOTHING / DO UPDATE для текущей СУБД (SQLite или PostgreSQL)."""
+    dialect = postgresql if db.engine.dialect.name == "postgresql" else sqlite
+    return dialect.insert(table)
+
+
@@ -1,16 +1,33 @@
 """
 Скрипт для поиска запрещенных слов в постах и комментариях.
-Использование: python -m portal.find_bad_words
+Использование: python -m portal.find_bad_words [--delete]
+
+Потоковый режим для больших баз (ограниченная память, пул процессов,
+массовые DELETE по пачкам, продолжение после прерывания):
+    python -m portal.find_bad_words --stream [--delete] [--workers N]
+        [--batch-size 1000] [--checkpoint find_bad_words.checkpoint.json]
 """
+import hashlib
+import json
 import os
 import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from flask import Flask
 from dotenv import load_dotenv
+from sqlalchemy import delete, insert
+from sqlalchemy.orm import joinedload
 
 from portal import create_app
+from portal.counters import recount_posts, recount_users, users_affected_by_post_delete
 from portal.extensions import db
-from portal.models import Post, Comment, ModerationLog, User
-from portal.routes import contains_bad_words, log_moderation, BAD_WORDS
+from portal.media import release_media
+from portal.models import (
+    Post, Comment, ModerationLog, User, PostLike, PostView, Track, delete_post_rows, post_categories, post_tags,
+)
+from portal.sidebar_cache import invalidate_sidebar
+from portal.routes import bad_word_matches, contains_bad_words, get_bad_words, log_moderation, moderation_log_values
+from portal.word_filter import BadWordMatcher
 
 load_dotenv()
 
@@ -20,18 +37,19 @@ app = create_app()
 def find_bad_words_in_content():
     """Находит посты и комментарии с запрещенными словами."""
     with app.app_context():
-        if not BAD_WORDS:
+        bad_words = get_bad_words()
+        if not bad_words:
             print("⚠️ Список запрещенных слов пуст. Добавьте слова в админ-панели.")
             return
         
         print(f"🔍 Поиск запрещенных слов в постах и комментариях...")
-        print(f"📋 Список запрещенных слов: {len(BAD_WORDS)} шт.\n")
+        print(f"📋 Список запрещенных слов: {len(bad_words)} шт.\n")
         
         found_posts = []
         found_comments = []
         
-        # Проверяем посты
-        posts = Post.query.filter_by(is_published=True).all()
+        # Проверяем посты (автор нужен для отчёта — грузим сразу, без запроса на каждый пост)
+        posts = Post.query.options(joinedload(Post.author)).filter_by(is_published=True).all()
         print(f"📄 Проверяю {len(posts)} опубликованных постов...")
         
         for post in posts:
@@ -46,7 +64,7 @@ def find_bad_words_in_content():
                 print(f"  ⚠️ Пост #{post.id}: '{post.title[:50]}...' (автор: {post.author.username})")
         
         # Проверяем комментарии
-        comments = Comment.query.all()
+        comments = Comment.query.options(joinedload(Comment.author)).all()
         print(f"\n💬 Проверяю {len(comments)} комментариев...")
         
         for comment in comments:
@@ -77,7 +95,7 @@ def find_bad_words_in_content():
 def delete_content_with_bad_words(delete_posts=True, delete_comments=True):
     """Удаляет посты и комментарии с запрещенными словами."""
     with app.app_context():
-        if not BAD_WORDS:
+        if not get_bad_words():
             print("⚠️ Список запрещенных слов пуст.")
             return
         
@@ -85,6 +103,9 @@ def delete_content_with_bad_words(delete_posts=True, delete_comments=True):
         
         deleted_posts = 0
         deleted_comments = 0
+        # Чьи счётчики пересчитать после удаления
+        affected_posts = set()
+        affected_users = set()
         
         # Удаляем посты
         if delete_posts:
@@ -96,7 +117,8 @@ def delete_content_with_bad_words(delete_posts=True, delete_comments=True):
                     post.body or "",
                 ])
                 
-                if contains_bad_words(text_blob):
+                bad_terms = bad_word_matches(text_blob)
+                if bad_terms:
                     # Логируем удаление
                     log_moderation(
                         "post_deleted",
@@ -104,23 +126,20 @@ def delete_content_with_bad_words(delete_posts=True, delete_comments=True):
                         post_id=post.id,
                         reason="bad_words_scan",
                         text=text_blob[:200] if text_blob else "",
+                        terms=bad_terms,
                     )
                     
+                    affected_users |= users_affected_by_post_delete([post.id])
                     # Удаляем связанные данные
                     from portal.models import Track, PostLike, PostView
                     Track.query.filter_by(post_id=post.id).delete()
                     Comment.query.filter_by(post_id=post.id).delete()
                     PostLike.query.filter_by(post_id=post.id).delete()
                     PostView.query.filter_by(post_id=post.id).delete()
+                    delete_post_rows([post.id])
                     
-                    # Удаляем медиафайл если есть
-                    if post.media_path:
-                        try:
-                            media_path = os.path.join(app.root_path, "static", post.media_path)
-                            if os.path.exists(media_path):
-                                os.remove(media_path)
-                        except Exception as e:
-                            print(f"  ⚠️ Не удалось удалить медиафайл для поста #{post.id}: {e}")
+                    # Медиафайл теряет ссылку (удалит gc_media)
+                    release_media(post.media_path)
                     
                     db.session.delete(post)
                     deleted_posts += 1
@@ -130,7 +149,8 @@ def delete_content_with_bad_words(delete_posts=True, delete_comments=True):
         if delete_comments:
             comments = Comment.query.all()
             for comment in comments:
-                if contains_bad_words(comment.body or ""):
+                bad_terms = bad_word_matches(comment.body or "")
+                if bad_terms:
                     # Логируем удаление
                     log_moderation(
                         "comment_blocked",
@@ -139,12 +159,19 @@ def delete_content_with_bad_words(delete_posts=True, delete_comments=True):
                         comment_id=comment.id,
                         reason="bad_words_scan",
                         text=comment.body[:200] if comment.body else "",
+                        terms=bad_terms,
                     )
                     
                     db.session.delete(comment)
+                    affected_posts.add(comment.post_id)
+                    affected_users.add(comment.author_id)
                     deleted_comments += 1
                     print(f"  🗑️ Удален комментарий #{comment.id} к посту #{comment.post_id}")
         
+        recount_posts(affected_posts)
+        recount_users(affected_users)
+        if deleted_posts:
+            invalidate_sidebar()
         db.session.commit()
         
         print(f"\n{'='*60}")
@@ -154,16 +181,257 @@ def delete_content_with_bad_words(delete_posts=True, delete_comments=True):
         print(f"{'='*60}\n")
 
 
+# --- Потоковый режим ---
+
+_worker_matcher = None
+
+
+def _init_worker(words):
+    """Каждый процесс пула один раз компилирует свой автомат."""
+    global _worker_matcher
+    _worker_matcher = BadWordMatcher(words)
+
+
+def _match_batch(items):
+    """Проверяет пачку [(id, text), ...], возвращает [(id, найденные слова), ...]."""
+    results = []
+    for item_id, text in items:
+        terms = _worker_matcher.find_all(text)
+        if terms:
+            results.append((item_id, terms))
+    return results
+
+
+def _words_fingerprint(words) -> str:
+    return hashlib.sha1("\n".join(sorted(words)).encode("utf-8")).hexdigest()
+
+
+def _load_checkpoint(path, fingerprint, delete_mode):
+    state = {
+        "words": fingerprint,
+        "delete": delete_mode,
+        "posts_last_id": 0,
+        "comments_last_id": 0,
+        "found_posts": 0,
+        "found_comments": 0,
+    }
+    if not path or not os.path.exists(path):
+        return state
+    with open(path, encoding="utf-8") as f:
+        saved = json.load(f)
+    if saved.get("words") != fingerprint or saved.get("delete") != delete_mode:
+        print("⚠️ Контрольная точка сделана для другого списка слов или режима — начинаю заново.")
+        return state
+    print(
+        f"↩️ Продолжаю с контрольной точки: пост #{saved['posts_last_id']}, "
+        f"комментарий #{saved['comments_last_id']}."
+    )
+    return saved
+
+
+def _save_checkpoint(path, state):
+    if not path:
+        return
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+
+def _post_batches(last_id, batch_size):
+    """Keyset-пачки опубликованных постов вместе с никами авторов (без N+1)."""
+    while True:
+        rows = (
+            db.session.query(
+                Post.id, Post.title, Post.summary, Post.body, Post.author_id, Post.media_path, User.username
+            )
+            .join(User, User.id == Post.author_id)
+            .filter(Post.is_published.is_(True), Post.id > last_id)
+            .order_by(Post.id.asc())
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            return
+        last_id = rows[-1].id
+        yield rows
+
+
+def _comment_batches(last_id, batch_size):
+    """Keyset-пачки комментариев вместе с никами авторов (без N+1)."""
+    while True:
+        rows = (
+            db.session.query(Comment.id, Comment.body, Comment.author_id, Comment.post_id, User.username)
+            .join(User, User.id == Comment.author_id)
+            .filter(Comment.id > last_id)
+            .order_by(Comment.id.asc())
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            return
+        last_id = rows[-1].id
+        yield rows
+
+
+def _post_text(row) -> str:
+    return " ".join([row.title or "", row.summary or "", row.body or ""])
+
+
+def _delete_posts(rows, hits):
+    """Массово удаляет посты пачки и связанные с ними строки."""
+    ids = [row.id for row in rows if row.id in hits]
+    affected_users = users_affected_by_post_delete(ids)
+    db.session.execute(
+        insert(ModerationLog),
+        [
+            moderation_log_values(
+                "post_deleted",
+                user_id=row.author_id,
+                post_id=row.id,
+                reason="bad_words_scan",
+                text=_post_text(row)[:200],
+                terms=hits[row.id],
+            )
+            for row in rows
+            if row.id in hits
+        ],
+    )
+    for model in (Track, Comment, PostLike, PostView):
+        db.session.execute(delete(model).where(model.post_id.in_(ids)))
+    delete_post_rows(ids)
+    db.session.execute(delete(post_tags).where(post_tags.c.post_id.in_(ids)))
+    db.session.execute(delete(post_categories).where(post_categories.c.post_id.in_(ids)))
+    db.session.execute(delete(Post).where(Post.id.in_(ids)))
+    recount_users(affected_users)
+
+    for row in rows:
+        if row.id in hits:
+            release_media(row.media_path)
+
+
+def _delete_comments(rows, hits):
+    """Массово удаляет комментарии пачки."""
+    db.session.execute(
+        insert(ModerationLog),
+        [
+            moderation_log_values(
+                "comment_blocked",
+                user_id=row.author_id,
+                post_id=row.post_id,
+                comment_id=row.id,
+                reason="bad_words_scan",
+                text=(row.body or "")[:200],
+                terms=hits[row.id],
+            )
+            for row in rows
+            if row.id in hits
+        ],
+    )
+    db.session.execute(delete(Comment).where(Comment.id.in_(list(hits))))
+    recount_posts({row.post_id for row in rows if row.id in hits})
+    recount_users({row.author_id for row in rows if row.id in hits})
+
+
+def _scan_stream(pool, batches, text_of, on_hits, workers):
+    """
+    Отправляет пачки в пул, пока предыдущие проверяются, и обрабатывает
+    результаты строго по порядку — так контрольная точка всегда корректна.
+    """
+    in_flight = deque()
+    for rows in batches:
+        items = [(row.id, text_of(row)) for row in rows]
+        in_flight.append((rows, pool.submit(_match_batch, items)))
+        if len(in_flight) >= workers * 2:
+            done_rows, future = in_flight.popleft()
+            on_hits(done_rows, dict(future.result()))
+    while in_flight:
+        done_rows, future = in_flight.popleft()
+        on_hits(done_rows, dict(future.result()))
+
+
+def scan_content_streaming(delete_mode=False, workers=None, batch_size=1000, checkpoint="find_bad_words.checkpoint.json"):
+    """Потоковая проверка (и удаление) контента с ограниченным потреблением памяти."""
+    with app.app_context():
+        words = sorted(get_bad_words())
+        if not words:
+            print("⚠️ Список запрещенных слов пуст. Добавьте слова в админ-панели.")
+            return
+
+        workers = workers or os.cpu_count() or 1
+        state = _load_checkpoint(checkpoint, _words_fingerprint(words), delete_mode)
+        action = "Удаление" if delete_mode else "Поиск"
+        print(f"🔍 {action} в потоковом режиме: {len(words)} слов, процессов: {workers}, пачка: {batch_size}\n")
+
+        def handle_posts(rows, hits):
+            for row in rows:
+                if row.id in hits:
+                    verb = "🗑️ Удален" if delete_mode else "⚠️"
+                    print(f"  {verb} пост #{row.id}: '{(row.title or '')[:50]}...' (автор: {row.username})")
+            if hits and delete_mode:
+                _delete_posts(rows, hits)
+                invalidate_sidebar()
+            state["posts_last_id"] = rows[-1].id
+            state["found_posts"] += len(hits)
+            db.session.commit()
+            _save_checkpoint(checkpoint, state)
+
+        def handle_comments(rows, hits):
+            for row in rows:
+                if row.id in hits:
+                    verb = "🗑️ Удален" if delete_mode else "⚠️"
+                    print(f"  {verb} комментарий #{row.id} к посту #{row.post_id} (автор: {row.username})")
+            if hits and delete_mode:
+                _delete_comments(rows, hits)
+            state["comments_last_id"] = rows[-1].id
+            state["found_comments"] += len(hits)
+            db.session.commit()
+            _save_checkpoint(checkpoint, state)
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(words,)) as pool:
+            print("📄 Проверяю опубликованные посты...")
+            _scan_stream(pool, _post_batches(state["posts_last_id"], batch_size), _post_text, handle_posts, workers)
+            print("\n💬 Проверяю комментарии...")
+            _scan_stream(
+                pool,
+                _comment_batches(state["comments_last_id"], batch_size),
+                lambda row: row.body or "",
+                handle_comments,
+                workers,
+            )
+
+        if checkpoint and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+
+        print(f"\n{'='*60}")
+        print(f"📊 {'Удалено' if delete_mode else 'Найдено'}:")
+        print(f"  Постов: {state['found_posts']}")
+        print(f"  Комментариев: {state['found_comments']}")
+        print(f"{'='*60}\n")
+
+
 if __name__ == "__main__":
-    import sys
-    
-    if "--delete" in sys.argv:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Поиск запрещенных слов в постах и комментариях.")
+    parser.add_argument("--delete", action="store_true", help="Удалить найденный контент")
+    parser.add_argument("--stream", action="store_true", help="Потоковый режим для больших баз")
+    parser.add_argument("--workers", type=int, default=None, help="Процессов для проверки (потоковый режим)")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Строк в пачке (потоковый режим)")
+    parser.add_argument("--checkpoint", default="find_bad_words.checkpoint.json", help="Файл контрольной точки")
+    args = parser.parse_args()
+
+    if args.delete:
         print("⚠️ ВНИМАНИЕ: Будут удалены все посты и комментарии с запрещенными словами!")
         response = input("Продолжить? (yes/no): ")
-        if response.lower() == "yes":
-            delete_content_with_bad_words()
-        else:
+        if response.lower() != "yes":
             print("Отменено.")
+        elif args.stream:
+            scan_content_streaming(True, args.workers, args.batch_size, args.checkpoint)
+        else:
+            delete_content_with_bad_words()
+    elif args.stream:
+        scan_content_streaming(False, args.workers, args.batch_size, args.checkpoint)
     else:
         find_bad_words_in_content()
 
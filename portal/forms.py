@@ -1,6 +1,6 @@
 from flask_wtf import FlaskForm
 from flask_wtf.file import FileAllowed, FileField
-from wtforms import BooleanField, FieldList, FormField, PasswordField, SelectMultipleField, StringField, TextAreaField
+from wtforms import BooleanField, FieldList, FormField, HiddenField, PasswordField, SelectField, SelectMultipleField, StringField, TextAreaField
 from wtforms.validators import Email, Length, DataRequired, EqualTo, Optional, URL
 
 
@@ -38,6 +38,8 @@ class PostForm(FlaskForm):
             )
         ],
     )
+    # Токен файла, загруженного частями через /api/uploads (большие видео)
+    upload_token = HiddenField(validators=[Optional(), Length(max=32)])
 
 
 class CommentForm(FlaskForm):
@@ -53,6 +55,11 @@ class CategoryForm(FlaskForm):
     slug = StringField("Slug", validators=[DataRequired(), Length(min=2, max=64)])
 
 
+class TagCategoryForm(FlaskForm):
+    tag = StringField("Тег", validators=[DataRequired(), Length(min=1, max=32)])
+    category_id = SelectField("Категория", coerce=int, validators=[DataRequired()])
+
+
 class ProfileEditForm(FlaskForm):
     bio = TextAreaField("О себе", validators=[Optional(), Length(max=500)])
     is_private = BooleanField("Приватный профиль", default=False)
@@ -0,0 +1,54 @@
+"""
+Сборка мусора в хранилище загрузок (media_blob, см. portal/media.py):
+удаляет брошенные загрузки частями (без новых частей дольше
+UPLOAD_SESSION_TTL, см. portal/uploads.py) с их промежуточными файлами,
+пересчитывает ссылки из постов и аватаров и удаляет файлы, на которые никто
+не ссылается дольше MEDIA_GC_GRACE_SECONDS, а также файлы хранилища без строки
+в media_blob (остаются после отката загрузки).
+С --adopt сначала переносит старые файлы uploads/<uuid>.ext в хранилище по
+хешу, склеивая одинаковые.
+Использование: python -m portal.gc_media [--adopt] [--grace-seconds 3600]
+"""
+import argparse
+
+from sqlalchemy import func
+
+from portal import create_app
+from portal.extensions import db
+from portal.media import adopt_legacy_files, collect_garbage
+from portal.models import MediaBlob
+from portal.uploads import collect_abandoned_uploads
+
+app = create_app()
+
+
+def _megabytes(size):
+    return f"{size / (1024 * 1024):.1f} МБ"
+
+
+def gc_media(adopt=False, grace_seconds=None):
+    with app.app_context():
+        if adopt:
+            print("📦 Переношу старые загрузки в хранилище по хешу...")
+            adopted, freed = adopt_legacy_files()
+            print(f"  Файлов: {adopted}, дубликатов освобождено: {_megabytes(freed)}")
+
+        print("⏳ Удаляю брошенные загрузки частями...")
+        uploads, staged = collect_abandoned_uploads()
+        print(f"  Загрузок: {uploads}, промежуточных данных: {_megabytes(staged)}")
+
+        print("🧹 Удаляю файлы без ссылок...")
+        removed, freed = collect_garbage(grace_seconds)
+        print(f"  Удалено файлов: {removed}, освобождено: {_megabytes(freed)}")
+
+        blobs, size = db.session.query(func.count(MediaBlob.id), func.coalesce(func.sum(MediaBlob.size), 0)).one()
+        print(f"  В хранилище: {blobs} файлов, {_megabytes(size)}")
+        print("✅ Готово!")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Сборка мусора в хранилище загрузок.")
+    parser.add_argument("--adopt", action="store_true", help="Перенести старые файлы в хранилище по хешу")
+    parser.add_argument("--grace-seconds", type=float, default=None, help="Сколько ждать перед удалением файла без ссылок")
+    args = parser.parse_args()
+    gc_media(adopt=args.adopt, grace_seconds=args.grace_seconds)
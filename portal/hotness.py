@@ -0,0 +1,146 @@
+"""
+«Горячесть» поста: взвешенная сумма комментариев, реакций и новых зрителей
+с экспоненциальным затуханием (период полураспада HOT_HALF_LIFE_HOURS).
+
+Затухание не пересчитывается: вес события приводится не к «сейчас», а к
+общей точке отсчёта HOT_EPOCH — событие в момент t весит w·2^(периодов от
+HOT_EPOCH до t). Сравнение таких сумм у двух постов даёт тот же порядок, что
+и сравнение затухших к любому общему моменту, поэтому «Обсуждаемое» и
+сортировка ?sort=hot — чтение по индексу (is_published, hot_score), а счёт
+поста без новых событий не меняется между загрузками страниц.
+
+Суммы растут экспоненциально, поэтому в post.hot_score хранится их log2
+(0 — событий нет). Событие прибавляется, а снятая реакция вычитается
+сравнением со старым значением (UPDATE ... WHERE hot_score = прочитанное,
+при гонке — повтор). После смены HOT_HALF_LIFE_HOURS горячесть пересчитывается
+по истории (rebuild_hot_scores): python -m portal.decay_hot_scores --rebuild;
+то же делает миграция для уже существующих постов.
+"""
+import math
+from datetime import datetime, timezone
+
+from flask import current_app
+from sqlalchemy import select, update
+
+from .extensions import db
+from .models import Comment, Post, PostLike, PostView
+
+# Веса событий
+HOT_COMMENT_WEIGHT = 3.0
+HOT_LIKE_WEIGHT = 2.0
+HOT_REACTION_WEIGHT = 1.0  # остальные реакции, кроме дизлайка
+HOT_VIEW_WEIGHT = 1.0  # новый зритель поста
+# Точка отсчёта затухания: раньше любых событий, поэтому log2 счёта всегда > 0
+HOT_EPOCH = datetime(2000, 1, 1, tzinfo=timezone.utc)
+# Счёт поста без событий
+HOT_EMPTY = 0.0
+# Остаток меньше этой доли после вычитания считается нулём (погрешность float)
+HOT_REMAINDER_EPSILON = 1e-9
+# Сколько раз повторять обновление счёта, если его успел изменить параллельный запрос
+HOT_UPDATE_ATTEMPTS = 5
+# Пересчёт по истории: строк событий за одно чтение и постов в одном UPDATE
+REBUILD_STREAM_BATCH_SIZE = 5000
+REBUILD_UPDATE_BATCH_SIZE = 1000
+
+
+def reaction_weight(reaction: str) -> float:
+    if reaction == "like":
+        return HOT_LIKE_WEIGHT
+    if reaction == "dislike":
+        return 0.0
+    return HOT_REACTION_WEIGHT
+
+
+def _as_utc(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+def event_score(weight: float, at: datetime, half_life_hours: float = None) -> float:
+    """log2 веса события в момент at, приведённого к HOT_EPOCH."""
+    if half_life_hours is None:
+        half_life_hours = current_app.config.get("HOT_HALF_LIFE_HOURS", 24.0)
+    hours = (_as_utc(at) - HOT_EPOCH).total_seconds() / 3600.0
+    return math.log2(weight) + hours / half_life_hours
+
+
+def add_scores(score: float, event: float) -> float:
+    """log2(2^score + 2^event) без переполнения."""
+    if score == HOT_EMPTY:
+        return event
+    high, low = max(score, event), min(score, event)
+    return high + math.log2(1.0 + 2.0 ** (low - high))
+
+
+def subtract_scores(score: float, event: float) -> float:
+    """log2(2^score − 2^event); HOT_EMPTY, если не осталось ничего."""
+    if score == HOT_EMPTY or event >= score:
+        return HOT_EMPTY
+    remainder = 1.0 - 2.0 ** (event - score)
+    if remainder < HOT_REMAINDER_EPSILON:
+        return HOT_EMPTY
+    return score + math.log2(remainder)
+
+
+def _change_score(post_id: int, change) -> None:
+    """Применяет change(старый счёт) -> новый счёт, не затирая параллельные обновления."""
+    now = datetime.now(timezone.utc)
+    for _ in range(HOT_UPDATE_ATTEMPTS):
+        current = db.session.execute(select(Post.hot_score).where(Post.id == post_id)).scalar()
+        if current is None:
+            return
+        updated = db.session.execute(
+            update(Post)
+            .where(Post.id == post_id, Post.hot_score == current)
+            .values(hot_score=change(current), hot_updated_at=now)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if updated:
+            return
+    current_app.logger.warning("Горячесть поста %s не обновлена: слишком много параллельных изменений", post_id)
+
+
+def bump_hot_score(post: Post, weight: float, at: datetime = None) -> None:
+    """Учитывает событие в горячести поста (вызывать до commit())."""
+    if weight <= 0:
+        return
+    event = event_score(weight, at or datetime.now(timezone.utc))
+    _change_score(post.id, lambda score: add_scores(score, event))
+
+
+def drop_hot_score(post: Post, weight: float, at: datetime) -> None:
+    """Убирает из горячести событие с весом weight в момент at (например, снятую реакцию)."""
+    if weight <= 0:
+        return
+    event = event_score(weight, at)
+    _change_score(post.id, lambda score: subtract_scores(score, event))
+
+
+def rebuild_hot_scores(half_life_hours: float = None) -> int:
+    """
+    Считает горячесть всех постов заново по комментариям, реакциям и просмотрам;
+    возвращает число постов. Не коммитит.
+    """
+    if half_life_hours is None:
+        half_life_hours = current_app.config.get("HOT_HALF_LIFE_HOURS", 24.0)
+    now = datetime.now(timezone.utc)
+    scores = {post_id: HOT_EMPTY for (post_id,) in db.session.query(Post.id)}
+    sources = (
+        (db.session.query(Comment.post_id, Comment.created_at), lambda row: HOT_COMMENT_WEIGHT),
+        (db.session.query(PostLike.post_id, PostLike.created_at, PostLike.reaction), lambda row: reaction_weight(row[2])),
+        (db.session.query(PostView.post_id, PostView.viewed_at), lambda row: HOT_VIEW_WEIGHT),
+    )
+    for query, weight_of in sources:
+        for row in query.execution_options(yield_per=REBUILD_STREAM_BATCH_SIZE):
+            weight = weight_of(row)
+            if row[0] in scores and weight > 0:
+                scores[row[0]] = add_scores(scores[row[0]], event_score(weight, row[1], half_life_hours))
+
+    rows = [{"id": post_id, "hot_score": score, "hot_updated_at": now} for post_id, score in scores.items()]
+    for start in range(0, len(rows), REBUILD_UPDATE_BATCH_SIZE):
+        db.session.execute(update(Post), rows[start:start + REBUILD_UPDATE_BATCH_SIZE])
+    return len(rows)
+
+
+def hot_order():
+    """Порядок сортировки ленты по горячести."""
+    return (Post.hot_score.desc(), Post.created_at.desc())
@@ -0,0 +1,301 @@
+"""
+Хранилище загруженных файлов по хешу содержимого.
+
+Загрузка потоком пишется во временный файл в static/uploads и по дороге
+хешируется (BLAKE2b), затем переименовывается в
+uploads/media/<первые 2 символа хеша>/<хеш>.<расширение>. Одинаковые файлы
+хранятся один раз: если такой хеш уже есть, временный файл удаляется, а
+Post.media_path / User.avatar_path указывают на общий файл.
+
+Таблица media_blob считает ссылки: store_upload() увеличивает счётчик,
+release_media() уменьшает. Файлы без ссылок удаляет python -m portal.gc_media —
+не сразу, а спустя MEDIA_GC_GRACE_SECONDS после последнего использования,
+чтобы не удалить файл, на который ссылается ещё не закоммиченная загрузка.
+
+Гонка загрузки со сборщиком закрыта блокировкой строки media_blob: загрузка
+сначала добавляет ссылку (INSERT ... ON CONFLICT) и только потом смотрит, есть
+ли файл на диске. Сборщик удаляет строки и убирает их файлы в сторону в одной
+транзакции, поэтому загрузка того же содержимого ждёт его commit и затем
+кладёт свой файл заново; если же ссылка успела раньше, сборщик не удалит строку.
+Сборщик же пересчитывает счётчики по постам и аватарам и переносит старые
+файлы с именами uuid4 в общее хранилище (--adopt).
+
+Файл попадает в хранилище до commit загрузки, поэтому после отката остаётся
+файл без строки media_blob. Такие файлы (и их копии, см. thumbnails.py)
+сборщик тоже удаляет, если они не менялись дольше MEDIA_GC_GRACE_SECONDS:
+за это время незакоммиченная загрузка либо сохранит свою строку, либо откатится.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+from sqlalchemy import delete, func, select, update
+
+from .extensions import db, upsert_insert
+from .models import MediaBlob, Post, UploadSession, User
+from .thumbnails import remove_derivatives
+
+MEDIA_PREFIX = "uploads/media/"
+# Файл, удаляемый сборщиком, до commit переименовывается с этим суффиксом
+TRASH_SUFFIX = ".gc"
+# Размер куска при копировании и хешировании (1 МБ)
+CHUNK_SIZE = 1024 * 1024
+
+
+def _absolute(path: str) -> str:
+    return os.path.join(current_app.root_path, "static", path)
+
+
+def _blob_path(digest: str, ext: str) -> str:
+    return f"{MEDIA_PREFIX}{digest[:2]}/{digest}.{ext}"
+
+
+def content_hash():
+    """Хеш, по которому адресуются файлы хранилища."""
+    return hashlib.blake2b(digest_size=32)
+
+
+def _copy_hashed(source, target) -> tuple:
+    """Копирует поток в файл кусками; возвращает (hex-хеш BLAKE2b, размер)."""
+    digest = content_hash()
+    size = 0
+    while True:
+        chunk = source.read(CHUNK_SIZE)
+        if not chunk:
+            return digest.hexdigest(), size
+        digest.update(chunk)
+        target.write(chunk)
+        size += len(chunk)
+
+
+def _place(stream, ext: str) -> tuple:
+    """
+    Пишет поток во временный файл, затем добавляет ссылку и кладёт файл по адресу
+    хеша (если такого файла ещё нет). Возвращает (путь относительно static, размер, создан ли файл).
+    """
+    upload_dir = os.path.join(current_app.root_path, "static", "uploads")
+    os.makedirs(upload_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=upload_dir, prefix=".upload-")
+    try:
+        with os.fdopen(fd, "wb") as target:
+            digest, size = _copy_hashed(stream, target)
+        path, created = _move_into_store(tmp_path, digest, ext, size)
+        return path, size, created
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _move_into_store(source_path: str, digest: str, ext: str, size: int) -> tuple:
+    """
+    +1 ссылка на файл, затем перенос файла по адресу хеша, если его там нет (иначе
+    source_path остаётся на месте). Возвращает (путь относительно static, создан ли файл).
+    """
+    # Ссылка — до проверки файла: после неё сборщик этот файл уже не удалит (см. выше)
+    path = _add_reference(digest, _blob_path(digest, ext), size)
+    absolute = _absolute(path)
+    created = not os.path.exists(absolute)
+    if created:
+        os.makedirs(os.path.dirname(absolute), exist_ok=True)
+        # move, а не replace: файл может лежать на другом разделе (см. uploads.py)
+        shutil.move(source_path, absolute)
+    return path, created
+
+
+def _add_reference(digest: str, path: str, size: int) -> str:
+    """
+    +1 ссылка на файл (строка создаётся при первой загрузке); возвращает путь из таблицы.
+    Расширение задаёт первая загрузка: тот же файл под другим именем не дублируется.
+    """
+    now = datetime.now(timezone.utc)
+    statement = (
+        upsert_insert(MediaBlob)
+        .values(hash=digest, path=path, size=size, ref_count=1, created_at=now, last_used_at=now)
+        .on_conflict_do_update(
+            index_elements=["hash"],
+            set_={"ref_count": MediaBlob.ref_count + 1, "last_used_at": now},
+        )
+        .returning(MediaBlob.path)
+    )
+    return db.session.execute(statement).scalar()
+
+
+def store_upload(file, ext: str) -> str:
+    """
+    Сохраняет загруженный файл (FileStorage) и возвращает путь для media_path /
+    avatar_path. Вызывать внутри транзакции, которая сохранит ссылку на путь.
+    """
+    path, _, _ = _place(file.stream, ext)
+    return path
+
+
+def store_file(source_path: str, ext: str, digest: str, size: int) -> str:
+    """
+    Кладёт в хранилище уже записанный файл с известным хешем BLAKE2b (например,
+    собранный из частей, см. uploads.py); source_path после вызова не существует.
+    Возвращает путь для media_path.
+    """
+    try:
+        path, _ = _move_into_store(source_path, digest, ext, size)
+    finally:
+        if os.path.exists(source_path):
+            os.remove(source_path)
+    return path
+
+
+def release_media(path) -> None:
+    """
+    -1 ссылка на файл (пост удалён или медиа заменено). Сам файл удалит gc_media.
+    Старые файлы вне хранилища (uploads/<uuid>.ext) принадлежат одному посту
+    и удаляются сразу, как раньше.
+    """
+    if not path:
+        return
+    if not path.startswith(MEDIA_PREFIX):
+        try:
+            absolute = _absolute(path)
+            if os.path.exists(absolute):
+                os.remove(absolute)
+            remove_derivatives(absolute)
+        except OSError:
+            pass
+        return
+    db.session.execute(
+        update(MediaBlob)
+        .where(MediaBlob.path == path, MediaBlob.ref_count > 0)
+        .values(ref_count=MediaBlob.ref_count - 1, last_used_at=datetime.now(timezone.utc))
+        .execution_options(synchronize_session=False)
+    )
+
+
+def recount_references() -> None:
+    """
+    Пересчитывает ref_count по Post.media_path, User.avatar_path и завершённым,
+    но ещё не прикреплённым загрузкам частями (все столбцы с индексом).
+    """
+    posts = select(func.count(Post.id)).where(Post.media_path == MediaBlob.path).scalar_subquery()
+    avatars = select(func.count(User.id)).where(User.avatar_path == MediaBlob.path).scalar_subquery()
+    uploads = select(func.count(UploadSession.id)).where(UploadSession.media_path == MediaBlob.path).scalar_subquery()
+    db.session.execute(
+        update(MediaBlob).values(ref_count=posts + avatars + uploads).execution_options(synchronize_session=False)
+    )
+
+
+def collect_garbage(grace_seconds=None) -> tuple:
+    """
+    Удаляет файлы без ссылок, не использовавшиеся дольше grace_seconds
+    (по умолчанию MEDIA_GC_GRACE_SECONDS). Возвращает (файлов, байт).
+    """
+    if grace_seconds is None:
+        grace_seconds = current_app.config.get("MEDIA_GC_GRACE_SECONDS", 3600)
+    recount_references()
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=grace_seconds)
+    removed = db.session.execute(
+        delete(MediaBlob)
+        .where(MediaBlob.ref_count <= 0, MediaBlob.last_used_at < cutoff)
+        .returning(MediaBlob.path, MediaBlob.size)
+    ).all()
+    # Файлы убираются в сторону до commit, пока удалённые строки заблокированы:
+    # загрузка того же файла ждёт commit и после него кладёт файл заново.
+    # Если commit не пройдёт, файлы возвращаются на место.
+    trashed = []
+    for path, size in removed:
+        absolute = _absolute(path)
+        try:
+            os.replace(absolute, absolute + TRASH_SUFFIX)
+            trashed.append((absolute, size))
+        except FileNotFoundError:
+            pass
+    try:
+        db.session.commit()
+    except Exception:
+        for absolute, _ in trashed:
+            os.replace(absolute + TRASH_SUFFIX, absolute)
+        raise
+
+    freed = 0
+    for absolute, size in trashed:
+        os.remove(absolute + TRASH_SUFFIX)
+        freed += size
+    for path, _ in removed:
+        remove_derivatives(_absolute(path))
+    orphans, orphan_size = sweep_orphan_files(cutoff)
+    return len(removed) + orphans, freed + orphan_size
+
+
+def sweep_orphan_files(cutoff: datetime) -> tuple:
+    """
+    Удаляет файлы хранилища, у хеша которых нет строки media_blob (загрузка
+    откатилась, сборщик упал между commit и удалением), если они не менялись
+    с cutoff. Возвращает (файлов, байт).
+    """
+    store = _absolute(MEDIA_PREFIX)
+    if not os.path.isdir(store):
+        return 0, 0
+    oldest = cutoff.timestamp()
+    removed = freed = 0
+    for prefix in sorted(os.listdir(store)):
+        directory = os.path.join(store, prefix)
+        if not os.path.isdir(directory):
+            continue
+        known = set(db.session.scalars(select(MediaBlob.hash).where(MediaBlob.hash.startswith(prefix))))
+        for name in os.listdir(directory):
+            # <хеш>.jpg, копии <хеш>.640w.webp и убранные в сторону <хеш>.jpg.gc
+            if name.split(".", 1)[0] in known:
+                continue
+            absolute = os.path.join(directory, name)
+            try:
+                stat = os.stat(absolute)
+                if stat.st_mtime >= oldest:
+                    continue
+                os.remove(absolute)
+            except FileNotFoundError:
+                continue
+            removed += 1
+            freed += stat.st_size
+    return removed, freed
+
+
+def _legacy_paths() -> list:
+    """Пути файлов, загруженных до хранилища по хешу."""
+    paths = select(Post.media_path).where(
+        Post.media_path.isnot(None), ~Post.media_path.startswith(MEDIA_PREFIX)
+    ).union(
+        select(User.avatar_path).where(User.avatar_path.isnot(None), ~User.avatar_path.startswith(MEDIA_PREFIX))
+    )
+    return [path for (path,) in db.session.execute(paths)]
+
+
+def adopt_legacy_files() -> tuple:
+    """
+    Переносит старые файлы в хранилище по хешу: одинаковые склеиваются, ссылки
+    в постах и аватарах переписываются. Возвращает (перенесено файлов, освобождено байт).
+    """
+    adopted = freed = 0
+    for old_path in _legacy_paths():
+        absolute = _absolute(old_path)
+        if not os.path.isfile(absolute):
+            continue
+        ext = old_path.rsplit(".", 1)[-1].lower() if "." in old_path else "bin"
+        with open(absolute, "rb") as source:
+            # Копия, а не перенос: до commit старый путь должен оставаться рабочим
+            new_path, size, created = _place(source, ext)
+        for column in (Post.media_path, User.avatar_path):
+            db.session.execute(
+                update(column.class_)
+                .where(column == old_path)
+                .values({column.key: new_path})
+                .execution_options(synchronize_session=False)
+            )
+        db.session.commit()
+        os.remove(absolute)
+        adopted += 1
+        if not created:
+            # Такой файл в хранилище уже был — старая копия была дубликатом
+            freed += size
+    recount_references()
+    db.session.commit()
+    return adopted, freed
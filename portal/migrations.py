@@ -1,32 +1,69 @@
-from sqlalchemy import text
+"""
+Версионированные миграции схемы без Alembic.
+
+Номер последней применённой миграции хранится в таблице schema_version
+(одна строка). На старте читается только он: если схема актуальна, больше
+ничего не выполняется — ни create_all, ни проверок начальных данных.
+Иначе по порядку применяются шаги с большим номером; шаг и запись его номера
+фиксируются одним commit.
+
+Шаги идемпотентны (таблица, индекс или колонка создаются, только если их ещё
+нет), поэтому база без schema_version — старая или только что созданная через
+create_all — просто проходит все шаги и догоняет версию.
+
+CREATE TABLE в шагах написаны для SQLite и нужны только старым базам: новая
+база (в том числе PostgreSQL) получает все таблицы из models.py через
+create_all, и для уже существующей таблицы DDL не выполняется.
+
+Новая миграция — функция и строка в MIGRATIONS со следующим номером. Уже
+выпущенный шаг правится, только чтобы он выполнялся там, где раньше падал
+(идемпотентность, другая СУБД), и так, чтобы базы, уже прошедшие его, ничего
+не теряли. Заполнение данных для существующих строк и исправления данных
+всегда идут отдельным новым шагом (как 14, 16 и 17): его проходят и старые,
+и новые базы. Новые таблицы из models.py создаёт create_all,
+который выполняется перед шагами, но тоже только при отставании версии.
+"""
+from sqlalchemy import inspect, text
 
 from .extensions import db
 
+VERSION_TABLE = "schema_version"
 
-def run_simple_migrations() -> None:
-    """
-    Примитивные миграции для SQLite без Alembic.
 
-    Безопасно вызывается на каждом старте приложения.
-    """
+def _execute(sql: str) -> None:
+    db.session.execute(text(sql))
 
-    def _try(sql: str) -> None:
-        try:
-            db.session.execute(text(sql))
-            db.session.commit()
-        except Exception:
-            db.session.rollback()
 
-    # Добавляем колонку reaction в post_like, если её ещё нет
-    _try("ALTER TABLE post_like ADD COLUMN reaction VARCHAR(16) NOT NULL DEFAULT 'like';")
+def _create_table(table: str, ddl: str) -> bool:
+    """CREATE TABLE, если таблицы ещё нет (её мог создать create_all); True — таблица создана."""
+    if inspect(db.session.connection()).has_table(table):
+        return False
+    _execute(ddl)
+    return True
+
+
+def _add_column(table: str, column: str, definition: str) -> bool:
+    """ALTER TABLE ... ADD COLUMN, если колонки ещё нет; True — колонка добавлена."""
+    columns = {info["name"] for info in inspect(db.session.connection()).get_columns(table)}
+    if column in columns:
+        return False
+    # user — зарезервированное слово в PostgreSQL
+    table = db.engine.dialect.identifier_preparer.quote(table)
+    _execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition};")
+    return True
+
 
-    # Добавляем медиа-поля к постам, если их ещё нет
-    _try("ALTER TABLE post ADD COLUMN media_path VARCHAR(255);")
-    _try("ALTER TABLE post ADD COLUMN media_type VARCHAR(16);")
+def _base_tables() -> None:
+    # Колонка reaction в post_like
+    _add_column("post_like", "reaction", "VARCHAR(16) NOT NULL DEFAULT 'like'")
 
-    # Создаём таблицу track для музыкальных треков
-    _try("""
-        CREATE TABLE IF NOT EXISTS track (
+    # Медиа-поля постов
+    _add_column("post", "media_path", "VARCHAR(255)")
+    _add_column("post", "media_type", "VARCHAR(16)")
+
+    # Таблица track для музыкальных треков
+    _create_table("track", """
+        CREATE TABLE track (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             title VARCHAR(200) NOT NULL,
             artist VARCHAR(200) NOT NULL,
@@ -37,33 +74,31 @@ def run_simple_migrations() -> None:
             FOREIGN KEY (post_id) REFERENCES post (id) ON DELETE CASCADE
         );
     """)
-    _try("CREATE INDEX IF NOT EXISTS ix_track_post_id ON track(post_id);")
-    _try("CREATE INDEX IF NOT EXISTS ix_track_created_at ON track(created_at);")
+    _execute("CREATE INDEX IF NOT EXISTS ix_track_post_id ON track(post_id);")
+    _execute("CREATE INDEX IF NOT EXISTS ix_track_created_at ON track(created_at);")
 
-    # Добавляем поля профиля к пользователю
-    _try("ALTER TABLE user ADD COLUMN avatar_path VARCHAR(255);")
-    _try("ALTER TABLE user ADD COLUMN bio VARCHAR(500);")
-    _try("ALTER TABLE user ADD COLUMN is_private BOOLEAN NOT NULL DEFAULT 0;")
-    _try("ALTER TABLE user ADD COLUMN theme_preference VARCHAR(16) NOT NULL DEFAULT 'dark';")
+    # Поля профиля пользователя
+    _add_column("user", "avatar_path", "VARCHAR(255)")
+    _add_column("user", "bio", "VARCHAR(500)")
+    _add_column("user", "is_private", "BOOLEAN NOT NULL DEFAULT 0")
+    _add_column("user", "theme_preference", "VARCHAR(16) NOT NULL DEFAULT 'dark'")
 
-    # Добавляем счетчик просмотров к постам
-    _try("ALTER TABLE post ADD COLUMN views INTEGER NOT NULL DEFAULT 0;")
+    # Счётчик просмотров постов
+    _add_column("post", "views", "INTEGER NOT NULL DEFAULT 0")
 
-    # Создаём таблицу tag для тегов
-    _try("""
-        CREATE TABLE IF NOT EXISTS tag (
+    # Теги и связующая таблица post_tags
+    _create_table("tag", """
+        CREATE TABLE tag (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             name VARCHAR(32) NOT NULL UNIQUE,
             slug VARCHAR(32) NOT NULL UNIQUE,
             created_at TIMESTAMP NOT NULL
         );
     """)
-    _try("CREATE INDEX IF NOT EXISTS ix_tag_name ON tag(name);")
-    _try("CREATE INDEX IF NOT EXISTS ix_tag_slug ON tag(slug);")
-
-    # Создаём связующую таблицу post_tags
-    _try("""
-        CREATE TABLE IF NOT EXISTS post_tags (
+    _execute("CREATE INDEX IF NOT EXISTS ix_tag_name ON tag(name);")
+    _execute("CREATE INDEX IF NOT EXISTS ix_tag_slug ON tag(slug);")
+    _create_table("post_tags", """
+        CREATE TABLE post_tags (
             post_id INTEGER NOT NULL,
             tag_id INTEGER NOT NULL,
             PRIMARY KEY (post_id, tag_id),
@@ -72,9 +107,9 @@ def run_simple_migrations() -> None:
         );
     """)
 
-    # Создаём таблицу follow для подписок
-    _try("""
-        CREATE TABLE IF NOT EXISTS follow (
+    # Подписки
+    _create_table("follow", """
+        CREATE TABLE follow (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             created_at TIMESTAMP NOT NULL,
             follower_id INTEGER NOT NULL,
@@ -84,13 +119,13 @@ def run_simple_migrations() -> None:
             UNIQUE (follower_id, followed_id)
         );
     """)
-    _try("CREATE INDEX IF NOT EXISTS ix_follow_follower_id ON follow(follower_id);")
-    _try("CREATE INDEX IF NOT EXISTS ix_follow_followed_id ON follow(followed_id);")
-    _try("CREATE INDEX IF NOT EXISTS ix_follow_created_at ON follow(created_at);")
+    _execute("CREATE INDEX IF NOT EXISTS ix_follow_follower_id ON follow(follower_id);")
+    _execute("CREATE INDEX IF NOT EXISTS ix_follow_followed_id ON follow(followed_id);")
+    _execute("CREATE INDEX IF NOT EXISTS ix_follow_created_at ON follow(created_at);")
 
-    # Создаём таблицу post_view для отслеживания просмотров
-    _try("""
-        CREATE TABLE IF NOT EXISTS post_view (
+    # Просмотры постов
+    _create_table("post_view", """
+        CREATE TABLE post_view (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             user_id INTEGER NOT NULL,
             post_id INTEGER NOT NULL,
@@ -102,16 +137,14 @@ def run_simple_migrations() -> None:
             UNIQUE (user_id, post_id)
         );
     """)
-    _try("CREATE INDEX IF NOT EXISTS ix_post_view_user_id ON post_view(user_id);")
-    _try("CREATE INDEX IF NOT EXISTS ix_post_view_post_id ON post_view(post_id);")
-    _try("CREATE INDEX IF NOT EXISTS ix_post_view_viewed_at ON post_view(viewed_at);")
-    
-    # Добавляем колонку view_duration для времени просмотра
-    _try("ALTER TABLE post_view ADD COLUMN view_duration REAL NOT NULL DEFAULT 0.0;")
+    _execute("CREATE INDEX IF NOT EXISTS ix_post_view_user_id ON post_view(user_id);")
+    _execute("CREATE INDEX IF NOT EXISTS ix_post_view_post_id ON post_view(post_id);")
+    _execute("CREATE INDEX IF NOT EXISTS ix_post_view_viewed_at ON post_view(viewed_at);")
+    _add_column("post_view", "view_duration", "REAL NOT NULL DEFAULT 0.0")
 
-    # Создаём таблицу user_tag_preference для предпочтений по тегам
-    _try("""
-        CREATE TABLE IF NOT EXISTS user_tag_preference (
+    # Предпочтения пользователей по тегам
+    _create_table("user_tag_preference", """
+        CREATE TABLE user_tag_preference (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             user_id INTEGER NOT NULL,
             tag_id INTEGER NOT NULL,
@@ -123,19 +156,364 @@ def run_simple_migrations() -> None:
             UNIQUE (user_id, tag_id)
         );
     """)
-    _try("CREATE INDEX IF NOT EXISTS ix_user_tag_preference_user_id ON user_tag_preference(user_id);")
-    _try("CREATE INDEX IF NOT EXISTS ix_user_tag_preference_tag_id ON user_tag_preference(tag_id);")
-    _try("CREATE INDEX IF NOT EXISTS ix_user_tag_preference_created_at ON user_tag_preference(created_at);")
+    _execute("CREATE INDEX IF NOT EXISTS ix_user_tag_preference_user_id ON user_tag_preference(user_id);")
+    _execute("CREATE INDEX IF NOT EXISTS ix_user_tag_preference_tag_id ON user_tag_preference(tag_id);")
+    _execute("CREATE INDEX IF NOT EXISTS ix_user_tag_preference_created_at ON user_tag_preference(created_at);")
 
-    # Создаём таблицу moderated_tag для тегов, требующих модерации
-    _try("""
-        CREATE TABLE IF NOT EXISTS moderated_tag (
+    # Теги, требующие модерации
+    _create_table("moderated_tag", """
+        CREATE TABLE moderated_tag (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             tag_id INTEGER NOT NULL UNIQUE,
             created_at TIMESTAMP NOT NULL,
             FOREIGN KEY (tag_id) REFERENCES tag (id) ON DELETE CASCADE
         );
     """)
-    _try("CREATE INDEX IF NOT EXISTS ix_moderated_tag_tag_id ON moderated_tag(tag_id);")
+    _execute("CREATE INDEX IF NOT EXISTS ix_moderated_tag_tag_id ON moderated_tag(tag_id);")
+
+
+def _duplicate_index() -> None:
+    # Индекс похожих постов (MinHash/LSH)
+    _create_table("post_lsh_bucket", """
+        CREATE TABLE post_lsh_bucket (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            post_id INTEGER NOT NULL,
+            bucket BIGINT NOT NULL,
+            FOREIGN KEY (post_id) REFERENCES post (id) ON DELETE CASCADE
+        );
+    """)
+    _execute("CREATE INDEX IF NOT EXISTS ix_post_lsh_bucket_post_id ON post_lsh_bucket(post_id);")
+    _execute("CREATE INDEX IF NOT EXISTS ix_post_lsh_bucket_bucket ON post_lsh_bucket(bucket);")
+
+    # SimHash-отпечатки постов и таблица полос для поиска по расстоянию Хэмминга
+    _add_column("post", "title_simhash", "BIGINT")
+    _add_column("post", "text_simhash", "BIGINT")
+    _create_table("post_simhash_band", """
+        CREATE TABLE post_simhash_band (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            post_id INTEGER NOT NULL,
+            band_key INTEGER NOT NULL,
+            FOREIGN KEY (post_id) REFERENCES post (id) ON DELETE CASCADE
+        );
+    """)
+    _execute("CREATE INDEX IF NOT EXISTS ix_post_simhash_band_post_id ON post_simhash_band(post_id);")
+    _execute("CREATE INDEX IF NOT EXISTS ix_post_simhash_band_band_key ON post_simhash_band(band_key);")
+    # Существующие посты индексирует шаг 16
+
+
+def _index_existing_posts() -> None:
+    """LSH-корзины и отпечатки постов без отпечатков, иначе проверка дубликатов их не видит."""
+    from .duplicate_checker import index_missing_posts
+
+    index_missing_posts()
+
+
+def _bad_words_and_config_versions() -> None:
+    # Список запрещённых слов в БД и версии настроек для горячей перезагрузки
+    _create_table("bad_word", """
+        CREATE TABLE bad_word (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            word VARCHAR(64) NOT NULL UNIQUE,
+            created_at TIMESTAMP NOT NULL
+        );
+    """)
+    _create_table("config_version", """
+        CREATE TABLE config_version (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            "key" VARCHAR(32) NOT NULL UNIQUE,
+            version INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP NOT NULL
+        );
+    """)
+    _execute("CREATE INDEX IF NOT EXISTS ix_config_version_key ON config_version(\"key\");")
+    # Старую таблицу bad_word с колонкой term приводит к новой шаг 14
+
+
+def _reconcile_bad_word() -> None:
+    """
+    Старые базы уже содержат bad_word с колонкой term, и шаг 3 её пропускает.
+    Колонка переименовывается в word; если уникального индекса по ней не было,
+    повторы удаляются и индекс создаётся.
+    """
+    inspector = inspect(db.session.connection())
+    columns = {info["name"] for info in inspector.get_columns("bad_word")}
+    if "word" in columns or "term" not in columns:
+        return
+    unique = any(index["unique"] and index["column_names"] == ["term"] for index in inspector.get_indexes("bad_word"))
+    _execute("ALTER TABLE bad_word RENAME COLUMN term TO word;")
+    if not unique:
+        _execute("DELETE FROM bad_word WHERE id NOT IN (SELECT MIN(id) FROM bad_word GROUP BY word);")
+        _execute("CREATE UNIQUE INDEX IF NOT EXISTS uq_bad_word_word ON bad_word(word);")
+
+
+def _recommendations() -> None:
+    # Предрассчитанные рекомендации пользователей
+    _add_column("user", "recommendations_stale", "BOOLEAN NOT NULL DEFAULT 1")
+    _add_column("user", "recommendations_refreshed_at", "TIMESTAMP")
+    _create_table("user_recommendation", """
+        CREATE TABLE user_recommendation (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            post_id INTEGER NOT NULL,
+            "rank" INTEGER NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES user (id) ON DELETE CASCADE,
+            FOREIGN KEY (post_id) REFERENCES post (id) ON DELETE CASCADE,
+            CONSTRAINT uq_recommendation_user_post UNIQUE (user_id, post_id)
+        );
+    """)
+    _execute("CREATE INDEX IF NOT EXISTS ix_user_recommendation_user_rank ON user_recommendation(user_id, \"rank\");")
+    _execute("CREATE INDEX IF NOT EXISTS ix_user_recommendation_post_id ON user_recommendation(post_id);")
+
+    # Похожие посты по совместным лайкам (item-to-item)
+    _create_table("post_neighbor", """
+        CREATE TABLE post_neighbor (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            post_id INTEGER NOT NULL,
+            neighbor_id INTEGER NOT NULL,
+            score FLOAT NOT NULL,
+            "rank" INTEGER NOT NULL,
+            FOREIGN KEY (post_id) REFERENCES post (id) ON DELETE CASCADE,
+            FOREIGN KEY (neighbor_id) REFERENCES post (id) ON DELETE CASCADE
+        );
+    """)
+    _execute("CREATE INDEX IF NOT EXISTS ix_post_neighbor_post_rank ON post_neighbor(post_id, \"rank\");")
+    _execute("CREATE INDEX IF NOT EXISTS ix_post_neighbor_neighbor_id ON post_neighbor(neighbor_id);")
+
+
+def _hot_scores() -> None:
+    # Горячесть постов для «Обсуждаемого» и сортировки ?sort=hot
+    _add_column("post", "hot_score", "FLOAT NOT NULL DEFAULT 0")
+    _add_column("post", "hot_updated_at", "TIMESTAMP")
+    _execute("CREATE INDEX IF NOT EXISTS ix_post_published_hot ON post(is_published, hot_score);")
+    # Счёт существующих постов заполняет шаг 17: он пишет его уже в форме шага 15
+
+
+def _counters() -> None:
+    # Денормализованные счётчики постов и пользователей
+    for table, column in (
+        ("post", "comments_count"),
+        ("post", "likes_count"),
+        ("post", "dislikes_count"),
+        ("post", "viewers_count"),
+        ("user", "posts_count"),
+        ("user", "comments_count"),
+        ("user", "followers_count"),
+        ("user", "following_count"),
+    ):
+        _add_column(table, column, "INTEGER NOT NULL DEFAULT 0")
+
+    # Заполняем по существующим данным (шаг выполняется один раз)
+    from .counters import recount_posts, recount_users
+
+    recount_posts()
+    recount_users()
 
 
+def _feed_indexes() -> None:
+    # Индексы для курсорной пагинации лент
+    _execute("CREATE INDEX IF NOT EXISTS ix_post_published_created ON post(is_published, created_at);")
+    _execute("CREATE INDEX IF NOT EXISTS ix_post_author_created ON post(author_id, created_at);")
+
+
+def _timelines() -> None:
+    # Лента подписок (fan-out при публикации)
+    _create_table("timeline_entry", """
+        CREATE TABLE timeline_entry (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            post_id INTEGER NOT NULL,
+            author_id INTEGER NOT NULL,
+            created_at TIMESTAMP NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES user (id),
+            FOREIGN KEY (post_id) REFERENCES post (id),
+            FOREIGN KEY (author_id) REFERENCES user (id),
+            CONSTRAINT uq_timeline_user_post UNIQUE (user_id, post_id)
+        );
+    """)
+    _execute("CREATE INDEX IF NOT EXISTS ix_timeline_entry_post_id ON timeline_entry(post_id);")
+    _execute("CREATE INDEX IF NOT EXISTS ix_timeline_user_created ON timeline_entry(user_id, created_at, post_id);")
+    _execute("CREATE INDEX IF NOT EXISTS ix_timeline_user_author ON timeline_entry(user_id, author_id);")
+    _execute("CREATE INDEX IF NOT EXISTS ix_user_followers_count ON \"user\"(followers_count);")
+    _add_column("user", "timeline_since", "TIMESTAMP")
+
+    # Собираем ленты по текущим подпискам
+    from .timeline import rebuild_all_timelines
+
+    rebuild_all_timelines()
+
+
+def _search_index() -> None:
+    # Полнотекстовый индекс постов (FTS5 / tsvector) и триггеры его синхронизации
+    from .search import ensure_search_index
+
+    ensure_search_index()
+
+
+def _seed_data() -> None:
+    # Категории, теги, стартовые посты, достижения и квиз
+    from .seed import ensure_seed_data
+
+    ensure_seed_data()
+
+
+def _tag_categories() -> None:
+    # Таблица «тег → категория» вместо словаря в коде; начальные строки — из seed
+    _create_table("tag_category", """
+        CREATE TABLE tag_category (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tag_slug VARCHAR(32) NOT NULL,
+            category_id INTEGER NOT NULL,
+            created_at TIMESTAMP NOT NULL,
+            FOREIGN KEY (category_id) REFERENCES category (id)
+        );
+    """)
+    _execute("CREATE UNIQUE INDEX IF NOT EXISTS ix_tag_category_tag_slug ON tag_category(tag_slug);")
+    _execute("CREATE INDEX IF NOT EXISTS ix_tag_category_category_id ON tag_category(category_id);")
+
+    from .seed import ensure_seed_data
+
+    ensure_seed_data()
+
+
+def _media_blobs() -> None:
+    # Хранилище загрузок по хешу содержимого со счётчиком ссылок
+    _create_table("media_blob", """
+        CREATE TABLE media_blob (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            hash VARCHAR(64) NOT NULL,
+            path VARCHAR(255) NOT NULL,
+            size INTEGER NOT NULL,
+            ref_count INTEGER NOT NULL,
+            created_at TIMESTAMP NOT NULL,
+            last_used_at TIMESTAMP NOT NULL
+        );
+    """)
+    _execute("CREATE UNIQUE INDEX IF NOT EXISTS ix_media_blob_hash ON media_blob(hash);")
+    _execute("CREATE UNIQUE INDEX IF NOT EXISTS ix_media_blob_path ON media_blob(path);")
+    _execute("CREATE INDEX IF NOT EXISTS ix_media_blob_last_used_at ON media_blob(last_used_at);")
+    # Пересчёт ссылок сборщиком ищет посты и пользователей по пути файла
+    _execute("CREATE INDEX IF NOT EXISTS ix_post_media_path ON post(media_path);")
+    _execute("CREATE INDEX IF NOT EXISTS ix_user_avatar_path ON \"user\"(avatar_path);")
+
+
+def _upload_sessions() -> None:
+    # Загрузка больших файлов частями с докачкой
+    _create_table("upload_session", """
+        CREATE TABLE upload_session (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            token VARCHAR(32) NOT NULL,
+            user_id INTEGER NOT NULL,
+            filename VARCHAR(255) NOT NULL,
+            size INTEGER NOT NULL,
+            received INTEGER NOT NULL,
+            checksum VARCHAR(64),
+            media_path VARCHAR(255),
+            created_at TIMESTAMP NOT NULL,
+            updated_at TIMESTAMP NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES user (id)
+        );
+    """)
+    _execute("CREATE UNIQUE INDEX IF NOT EXISTS ix_upload_session_token ON upload_session(token);")
+    _execute("CREATE INDEX IF NOT EXISTS ix_upload_session_user_id ON upload_session(user_id);")
+    _execute("CREATE INDEX IF NOT EXISTS ix_upload_session_media_path ON upload_session(media_path);")
+    _execute("CREATE INDEX IF NOT EXISTS ix_upload_session_updated_at ON upload_session(updated_at);")
+
+
+def _hot_scores_log_form() -> None:
+    # Горячесть хранится как log2 суммы весов, приведённых к HOT_EPOCH (см. hotness.py):
+    # счёт s, затухший к hot_updated_at, переводится в log2(s) + периодов от эпохи
+    from datetime import datetime, timezone
+
+    from sqlalchemy import select, update
+
+    from .hotness import event_score
+    from .models import Post
+
+    now = datetime.now(timezone.utc)
+    rows = db.session.execute(select(Post.id, Post.hot_score, Post.hot_updated_at).where(Post.hot_score > 0)).all()
+    if rows:
+        db.session.execute(
+            update(Post),
+            [{"id": post_id, "hot_score": event_score(score, updated_at or now)} for post_id, score, updated_at in rows],
+        )
+
+
+def _search_index_folded() -> None:
+    # Индекс шага 9 хранил ё и й как есть: пересоздаём его по тексту с ё → е, й → и
+    from .search import drop_search_index, ensure_search_index
+
+    if db.engine.dialect.name == "sqlite":
+        drop_search_index()
+        ensure_search_index()
+
+
+def _rebuild_hot_scores() -> None:
+    # Горячесть по всей истории комментариев, реакций и просмотров: до этого шага
+    # посты, созданные до шага 5, оставались с нулевым счётом
+    from .hotness import rebuild_hot_scores
+
+    rebuild_hot_scores()
+
+
+# (номер, описание, шаг) — номера только растут, данные выпущенных шагов догоняют новые шаги
+MIGRATIONS = [
+    (1, "базовые таблицы и колонки", _base_tables),
+    (2, "индекс похожих постов", _duplicate_index),
+    (3, "запрещённые слова и версии настроек", _bad_words_and_config_versions),
+    (4, "рекомендации", _recommendations),
+    (5, "горячесть постов", _hot_scores),
+    (6, "денормализованные счётчики", _counters),
+    (7, "индексы лент", _feed_indexes),
+    (8, "лента подписок", _timelines),
+    (9, "полнотекстовый поиск", _search_index),
+    (10, "начальные данные", _seed_data),
+    (11, "таблица тег → категория", _tag_categories),
+    (12, "хранилище загрузок по хешу", _media_blobs),
+    (13, "загрузка частями", _upload_sessions),
+    (14, "колонка word в старой таблице bad_word", _reconcile_bad_word),
+    (15, "горячесть без периодического затухания", _hot_scores_log_form),
+    (16, "индекс похожих постов для существующих постов", _index_existing_posts),
+    (17, "горячесть существующих постов", _rebuild_hot_scores),
+    (18, "поиск без различия ё/е и й/и", _search_index_folded),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version() -> int:
+    """Номер применённой миграции (0 — журнала ещё нет)."""
+    try:
+        version = db.session.execute(text(f"SELECT version FROM {VERSION_TABLE}")).scalar()
+    except Exception:
+        db.session.rollback()
+        return 0
+    return version or 0
+
+
+def _set_schema_version(version: int) -> None:
+    updated = db.session.execute(text(f"UPDATE {VERSION_TABLE} SET version = :version"), {"version": version})
+    if not updated.rowcount:
+        _execute(f"INSERT INTO {VERSION_TABLE} (version) VALUES ({int(version)})")
+
+
+def run_migrations() -> None:
+    """Применяет недостающие миграции; при актуальной схеме — один SELECT."""
+    version = get_schema_version()
+    if version >= LATEST_VERSION:
+        return
+
+    from . import models  # noqa: F401
+
+    db.create_all()
+    _execute(f"CREATE TABLE IF NOT EXISTS {VERSION_TABLE} (version INTEGER NOT NULL)")
+    db.session.commit()
+
+    for number, description, step in MIGRATIONS:
+        if number <= version:
+            continue
+        try:
+            step()
+            _set_schema_version(number)
+            db.session.commit()
+        except Exception as exc:
+            db.session.rollback()
+            raise RuntimeError(f"Миграция {number} ({description}) не применилась") from exc
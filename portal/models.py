@@ -1,6 +1,7 @@
 from datetime import datetime, timezone
 
 from flask_login import UserMixin
+from sqlalchemy import delete
 from werkzeug.security import check_password_hash, generate_password_hash
 
 from .extensions import db, login_manager
@@ -27,16 +28,30 @@ class User(db.Model, UserMixin):
     is_admin = db.Column(db.Boolean, default=False, nullable=False)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
     # Профиль
-    avatar_path = db.Column(db.String(255), nullable=True)
+    avatar_path = db.Column(db.String(255), nullable=True, index=True)
     bio = db.Column(db.String(500), nullable=True)
     is_private = db.Column(db.Boolean, default=False, nullable=False)
     theme_preference = db.Column(db.String(16), default="dark", nullable=False)  # dark, light, auto
+    # Сохранённые рекомендации: флаг устаревания и время последнего пересчёта
+    recommendations_stale = db.Column(db.Boolean, default=True, nullable=False)
+    recommendations_refreshed_at = db.Column(db.DateTime, nullable=True)
+    # Денормализованные счётчики (см. counters.py)
+    posts_count = db.Column(db.Integer, default=0, nullable=False)
+    comments_count = db.Column(db.Integer, default=0, nullable=False)
+    followers_count = db.Column(db.Integer, default=0, nullable=False, index=True)
+    following_count = db.Column(db.Integer, default=0, nullable=False)
+    # Лента подписок хранит все посты новее этой границы; более старые читаются напрямую (см. timeline.py)
+    timeline_since = db.Column(db.DateTime, nullable=True)
 
     posts = db.relationship("Post", backref="author", lazy=True, cascade="all, delete-orphan")
     comments = db.relationship("Comment", backref="author", lazy=True, cascade="all, delete-orphan")
     likes = db.relationship("PostLike", backref="user", lazy=True, cascade="all, delete-orphan")
     achievements = db.relationship("UserAchievement", backref="user", lazy=True, cascade="all, delete-orphan")
     quiz_results = db.relationship("QuizResult", backref="user", lazy=True, cascade="all, delete-orphan")
+    recommendations = db.relationship("UserRecommendation", lazy=True, cascade="all, delete-orphan")
+    timeline = db.relationship(
+        "TimelineEntry", foreign_keys="TimelineEntry.user_id", lazy=True, cascade="all, delete-orphan"
+    )
     # Подписки
     following = db.relationship(
         "Follow",
@@ -84,25 +99,72 @@ class Post(db.Model):
     summary = db.Column(db.String(240), nullable=True)
     body = db.Column(db.Text, nullable=False)
     cover_emoji = db.Column(db.String(8), nullable=True)
-    media_path = db.Column(db.String(255), nullable=True)
+    media_path = db.Column(db.String(255), nullable=True, index=True)
     media_type = db.Column(db.String(16), nullable=True)
     is_published = db.Column(db.Boolean, default=True, nullable=False)
     views = db.Column(db.Integer, default=0, nullable=False)  # Счетчик просмотров
+    # Горячесть с затуханием (см. hotness.py) и момент её последнего пересчёта
+    hot_score = db.Column(db.Float, default=0.0, nullable=False)
+    hot_updated_at = db.Column(db.DateTime, nullable=True)
+    # Денормализованные счётчики (см. counters.py); viewers_count — уникальные зрители
+    comments_count = db.Column(db.Integer, default=0, nullable=False)
+    likes_count = db.Column(db.Integer, default=0, nullable=False)
+    dislikes_count = db.Column(db.Integer, default=0, nullable=False)
+    viewers_count = db.Column(db.Integer, default=0, nullable=False)
+    # 64-битные SimHash нормализованного заголовка и полного текста (для поиска дубликатов)
+    title_simhash = db.Column(db.BigInteger, nullable=True)
+    text_simhash = db.Column(db.BigInteger, nullable=True)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False, index=True)
     updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
 
     author_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False, index=True)
 
-    categories = db.relationship("Category", secondary=post_categories, lazy="subquery")
-    tags = db.relationship("Tag", secondary=post_tags, lazy="subquery")
+    # selectin: теги и категории всей страницы одним запросом по id, без повтора исходного запроса
+    categories = db.relationship("Category", secondary=post_categories, lazy="selectin")
+    tags = db.relationship("Tag", secondary=post_tags, lazy="selectin")
     comments = db.relationship("Comment", backref="post", lazy=True, cascade="all, delete-orphan")
     likes = db.relationship("PostLike", backref="post", lazy=True, cascade="all, delete-orphan")
     tracks = db.relationship("Track", backref="post", lazy=True, cascade="all, delete-orphan", order_by="Track.order")
+    # Служебные строки поста (индексы дубликатов, ленты, рекомендации, соседи) бывают
+    # тысячами: ORM их не загружает, перед удалением поста их стирает delete_post_rows
+    lsh_buckets = db.relationship("PostLshBucket", lazy=True, cascade="all, delete-orphan", passive_deletes=True)
+    simhash_bands = db.relationship("PostSimhashBand", lazy=True, cascade="all, delete-orphan", passive_deletes=True)
+    recommended_to = db.relationship("UserRecommendation", lazy=True, cascade="all, delete-orphan", passive_deletes=True)
+    timeline_entries = db.relationship("TimelineEntry", lazy=True, cascade="all, delete-orphan", passive_deletes=True)
+    neighbors = db.relationship(
+        "PostNeighbor", foreign_keys="PostNeighbor.post_id", lazy=True, cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
+    neighbor_of = db.relationship(
+        "PostNeighbor", foreign_keys="PostNeighbor.neighbor_id", lazy=True, cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
+
+    __table_args__ = (
+        db.Index("ix_post_published_hot", "is_published", "hot_score"),
+        # Курсорная пагинация лент по (created_at, id), см. pagination.py
+        db.Index("ix_post_published_created", "is_published", "created_at"),
+        db.Index("ix_post_author_created", "author_id", "created_at"),
+    )
 
     def touch(self) -> None:
         self.updated_at = datetime.now(timezone.utc)
 
 
+class PostLshBucket(db.Model):
+    """Корзины MinHash/LSH поста для быстрого поиска кандидатов в дубликаты."""
+    id = db.Column(db.Integer, primary_key=True)
+    post_id = db.Column(db.Integer, db.ForeignKey("post.id"), nullable=False, index=True)
+    bucket = db.Column(db.BigInteger, nullable=False, index=True)
+
+
+class PostSimhashBand(db.Model):
+    """16-битные полосы SimHash поста: совпадение хотя бы одной полосы — кандидат в дубликаты."""
+    id = db.Column(db.Integer, primary_key=True)
+    post_id = db.Column(db.Integer, db.ForeignKey("post.id"), nullable=False, index=True)
+    band_key = db.Column(db.Integer, nullable=False, index=True)
+
+
 class Track(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
@@ -155,6 +217,56 @@ class UserTagPreference(db.Model):
     __table_args__ = (db.UniqueConstraint("user_id", "tag_id", name="uq_user_tag_preference"),)
 
 
+class UserRecommendation(db.Model):
+    """Предрассчитанная лента рекомендаций пользователя (позиция rank — порядок показа)."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    post_id = db.Column(db.Integer, db.ForeignKey("post.id"), nullable=False, index=True)
+    rank = db.Column(db.Integer, nullable=False)
+    __table_args__ = (
+        db.Index("ix_user_recommendation_user_rank", "user_id", "rank"),
+        db.UniqueConstraint("user_id", "post_id", name="uq_recommendation_user_post"),
+    )
+
+
+class PostNeighbor(db.Model):
+    """Top-K похожих постов по совместным лайкам (строится build_post_neighbors)."""
+    id = db.Column(db.Integer, primary_key=True)
+    post_id = db.Column(db.Integer, db.ForeignKey("post.id"), nullable=False)
+    neighbor_id = db.Column(db.Integer, db.ForeignKey("post.id"), nullable=False, index=True)
+    score = db.Column(db.Float, nullable=False)
+    rank = db.Column(db.Integer, nullable=False)
+    __table_args__ = (db.Index("ix_post_neighbor_post_rank", "post_id", "rank"),)
+
+
+class TimelineEntry(db.Model):
+    """Пост автора в ленте подписчика (fan-out при публикации, см. timeline.py)."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    post_id = db.Column(db.Integer, db.ForeignKey("post.id"), nullable=False, index=True)
+    author_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)  # копия post.created_at для сортировки
+    __table_args__ = (
+        db.Index("ix_timeline_user_created", "user_id", "created_at", "post_id"),
+        db.Index("ix_timeline_user_author", "user_id", "author_id"),
+        db.UniqueConstraint("user_id", "post_id", name="uq_timeline_user_post"),
+    )
+
+
+def delete_post_rows(post_ids) -> None:
+    """Пачкой удаляет служебные строки постов (см. Post); вызывать до удаления самих постов."""
+    ids = list(post_ids)
+    if not ids:
+        return
+    for model in (PostLshBucket, PostSimhashBand, UserRecommendation, TimelineEntry, PostNeighbor):
+        db.session.execute(
+            delete(model).where(model.post_id.in_(ids)).execution_options(synchronize_session=False)
+        )
+    db.session.execute(
+        delete(PostNeighbor).where(PostNeighbor.neighbor_id.in_(ids)).execution_options(synchronize_session=False)
+    )
+
+
 class Achievement(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     code = db.Column(db.String(64), unique=True, nullable=False, index=True)
@@ -198,6 +310,21 @@ class ModerationSettings(db.Model):
     auto_enabled = db.Column(db.Boolean, default=True, nullable=False)
 
 
+class BadWord(db.Model):
+    """Запрещённые слова автомодерации (формат записей — см. word_filter)."""
+    id = db.Column(db.Integer, primary_key=True)
+    word = db.Column(db.String(64), unique=True, nullable=False)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+
+
+class ConfigVersion(db.Model):
+    """Монотонно растущие версии настроек, которые процессы кэшируют у себя."""
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(32), unique=True, nullable=False, index=True)
+    version = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+
+
 class ModeratedTag(db.Model):
     """Теги, требующие модерации."""
     id = db.Column(db.Integer, primary_key=True)
@@ -206,6 +333,43 @@ class ModeratedTag(db.Model):
     tag = db.relationship("Tag")
 
 
+class TagCategory(db.Model):
+    """Тег → категория: посты с тегом автоматически попадают в категорию (см. tags.py)."""
+    id = db.Column(db.Integer, primary_key=True)
+    tag_slug = db.Column(db.String(32), nullable=False, unique=True, index=True)
+    category_id = db.Column(db.Integer, db.ForeignKey("category.id"), nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    category = db.relationship("Category")
+
+
+class MediaBlob(db.Model):
+    """Загруженный файл, хранящийся один раз по хешу содержимого (см. media.py)."""
+    id = db.Column(db.Integer, primary_key=True)
+    hash = db.Column(db.String(64), nullable=False, unique=True, index=True)
+    path = db.Column(db.String(255), nullable=False, unique=True, index=True)
+    size = db.Column(db.Integer, nullable=False, default=0)
+    # Сколько постов и аватаров ссылаются на файл; с нулём ссылок файл удаляет gc_media
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    last_used_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False, index=True)
+
+
+class UploadSession(db.Model):
+    """Загрузка файла частями (см. uploads.py): принято received из size байт."""
+    id = db.Column(db.Integer, primary_key=True)
+    token = db.Column(db.String(32), nullable=False, unique=True, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False, index=True)
+    filename = db.Column(db.String(255), nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    received = db.Column(db.Integer, nullable=False, default=0)
+    # Ожидаемый SHA-256 всего файла (необязателен, проверяется при завершении)
+    checksum = db.Column(db.String(64), nullable=True)
+    # Заполняется после завершения: файл уже в хранилище и ждёт прикрепления к посту
+    media_path = db.Column(db.String(255), nullable=True, index=True)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False, index=True)
+
+
 class ModerationLog(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False, index=True)
@@ -0,0 +1,143 @@
+"""
+Keyset-пагинация лент (курсор вместо OFFSET).
+
+Следующая страница выбирается условием «строго после последней показанной
+записи» по ключу сортировки, например (created_at, id), поэтому сотая страница
+стоит столько же, сколько первая: это тот же диапазонный проход по индексу.
+Курсор — непрозрачная строка (base64 от значений ключа последней записи);
+испорченный или чужой курсор (в том числе со значениями не того типа) просто
+открывает ленту с начала.
+
+Ключ HOTTEST_FIRST не неподвижен: пост, получивший реакцию или комментарий
+между загрузками страниц, поднимается по hot_score и может перескочить границу
+курсора — тогда он не попадёт на следующие страницы (уже был выше) или
+покажется второй раз (был ниже, поднялся выше). Для «горячей» ленты это
+допустимо; строгий порядок без пропусков даёт только NEWEST_FIRST.
+
+    page = paginate(query, NEWEST_FIRST, cursor=request.args.get("cursor"))
+    page.items, page.next_cursor
+"""
+import base64
+import json
+from collections import namedtuple
+from datetime import datetime
+
+from flask import jsonify, render_template, request, url_for
+from sqlalchemy import and_, or_
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.expression import UnaryExpression
+
+from .extensions import db
+from .models import Post
+
+DEFAULT_PER_PAGE = 50
+MAX_PER_PAGE = 100
+
+# Ключ сортировки: столбцы по убыванию, последний — уникальный (id)
+NEWEST_FIRST = (Post.created_at, Post.id)
+HOTTEST_FIRST = (Post.hot_score, Post.id)
+
+Page = namedtuple("Page", "items next_cursor")
+
+
+def _encode_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _decode_value(column, value):
+    """Значение ключа из JSON; ValueError, если тип не подходит столбцу."""
+    python_type = column.type.python_type
+    if python_type is datetime and isinstance(value, str):
+        return datetime.fromisoformat(value)
+    # bool — подкласс int, но в ключах сортировки не встречается
+    if python_type is int and isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if python_type is float and isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    raise ValueError(f"Неверное значение курсора для {column.key}: {value!r}")
+
+
+def encode_cursor(key, item) -> str:
+    values = [_encode_value(getattr(item, column.key)) for column in key]
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(key, cursor):
+    """Значения ключа из курсора или None, если курсор пустой или испорчен."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(key):
+            return None
+        return [_decode_value(column, value) for column, value in zip(key, values)]
+    except (ValueError, TypeError):
+        return None
+
+
+def _after(key, values):
+    """
+    Условие «после values» при сортировке по убыванию всех столбцов ключа.
+    Первый столбец вынесен отдельным col <= value, чтобы SQLite использовал
+    по нему диапазонный поиск в индексе.
+    """
+    first, first_value = key[0], values[0]
+    branches = []
+    for i in range(len(key)):
+        equal = [column == value for column, value in zip(key[:i], values[:i])]
+        branches.append(and_(*equal, key[i] < values[i]))
+    return and_(first <= first_value, or_(*branches))
+
+
+def _without_index(column):
+    """+column в SQLite: то же значение, но планировщик не берёт по нему индекс."""
+    return UnaryExpression(column, operator=operators.custom_op("+"), type_=column.type)
+
+
+def fetch_after(query, key, values, limit: int, selective=False) -> list:
+    """
+    До limit записей после значений ключа values (None — с начала).
+    selective=True — запрос уже сужен избирательным фильтром (полнотекстовый
+    поиск): SQLite тогда не должен идти по индексу сортировки через всю таблицу,
+    дешевле отсортировать найденное.
+    """
+    if selective and db.engine.dialect.name == "sqlite":
+        key = tuple(_without_index(column) for column in key)
+    if values is not None:
+        query = query.filter(_after(key, values))
+    return query.order_by(*[column.desc() for column in key]).limit(limit).all()
+
+
+def paginate(query, key=NEWEST_FIRST, cursor=None, per_page=DEFAULT_PER_PAGE, selective=False) -> Page:
+    """Страница записей после cursor; запрос не должен быть уже отсортирован."""
+    per_page = max(1, min(per_page, MAX_PER_PAGE))
+    items = fetch_after(query, key, decode_cursor(key, cursor), per_page + 1, selective=selective)
+    return make_page(key, items, per_page)
+
+
+def make_page(key, items: list, per_page: int) -> Page:
+    """Page из per_page + 1 выбранных записей: лишняя означает, что есть следующая страница."""
+    next_cursor = encode_cursor(key, items[per_page - 1]) if len(items) > per_page else None
+    return Page(items[:per_page], next_cursor)
+
+
+def wants_fragment() -> bool:
+    """Запрос «Показать ещё» из JS: нужен только фрагмент со следующими записями."""
+    return request.headers.get("X-Requested-With") == "XMLHttpRequest"
+
+
+def next_page_url(page: Page, param: str = "cursor"):
+    """Адрес текущей страницы с курсором следующей (None, если записей больше нет)."""
+    if not page.next_cursor:
+        return None
+    args = request.args.to_dict()
+    args[param] = page.next_cursor
+    return url_for(request.endpoint, **(request.view_args or {}), **args)
+
+
+def fragment_response(template: str, page: Page, param: str = "cursor", **context):
+    """JSON для «Показать ещё»: HTML следующих записей и адрес следующей страницы."""
+    html = render_template(template, posts=page.items, **context)
+    return jsonify({"html": html, "next_url": next_page_url(page, param)})
@@ -0,0 +1,151 @@
+"""
+Статистика SQL-запросов по каждому HTTP-запросу (включается QUERY_STATS=1).
+
+Считает число запросов, суммарное время в БД и повторы одного и того же
+оператора — «отпечатка» SQL без значений параметров. Много повторов одного
+отпечатка — типичный N+1: шаблон в цикле дёргает ленивую связь (post.author,
+comment.post), и на каждую строку уходит отдельный SELECT.
+
+Результат:
+  - заголовки ответа X-Query-Stats и Server-Timing (видно во вкладке Network);
+  - строка в логе приложения; предупреждение, если превышен порог
+    QUERY_STATS_MAX_QUERIES или отпечаток повторился больше
+    QUERY_STATS_MAX_REPEATS раз;
+  - при QUERY_STATS_STRICT=1 превышение порога — исключение QueryBudgetExceeded
+    (для тестов: страница с N+1 падает, а не тихо замедляется).
+
+Вне HTTP-запроса (скрипты, тесты) запросы можно посчитать так:
+
+    with collect_queries() as stats:
+        ...
+    print(stats.count, stats.repeated())
+"""
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import current_app, g, request
+from sqlalchemy import event
+
+from .extensions import db
+
+# Сколько самых частых повторов показывать в логе
+REPORT_REPEATS = 3
+
+_current = ContextVar("query_stats", default=None)
+_IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE_RE = re.compile(r"\s+")
+
+
+class QueryBudgetExceeded(RuntimeError):
+    """Страница выполнила больше запросов (или повторов), чем разрешено."""
+
+
+def fingerprint(statement: str) -> str:
+    """SQL без различий в пробелах и длине списков IN (?, ?, ...)."""
+    statement = _SPACE_RE.sub(" ", statement).strip()
+    return _IN_LIST_RE.sub("(?…)", statement)
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+
+    def add(self, statement: str, duration: float) -> None:
+        self.count += 1
+        self.duration += duration
+        self.fingerprints[fingerprint(statement)] += 1
+
+    def repeated(self, threshold: int = 1) -> list:
+        """[(отпечаток, сколько раз)] для операторов, выполненных больше threshold раз."""
+        return [(sql, times) for sql, times in self.fingerprints.most_common() if times > threshold]
+
+    def summary(self) -> str:
+        return f"{self.count} queries, {self.duration * 1000:.1f} ms, {len(self.repeated())} repeated"
+
+
+@contextmanager
+def collect_queries():
+    """Считает запросы внутри блока (вложенные блоки считаются отдельно)."""
+    stats = QueryStats()
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("query_stats_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    if stats is None:
+        return
+    started = conn.info.get("query_stats_started")
+    if started:
+        stats.add(statement, time.perf_counter() - started.pop())
+
+
+def _start_request():
+    g.query_stats_token = _current.set(QueryStats())
+
+
+def _finish_request(response):
+    stats = _current.get()
+    if stats is None:
+        return response
+    response.headers["X-Query-Stats"] = stats.summary()
+    response.headers["Server-Timing"] = f'db;dur={stats.duration * 1000:.1f};desc="{stats.count} queries"'
+
+    config = current_app.config
+    max_queries = config["QUERY_STATS_MAX_QUERIES"]
+    max_repeats = config["QUERY_STATS_MAX_REPEATS"]
+    problems = []
+    if max_queries and stats.count > max_queries:
+        problems.append(f"больше {max_queries} запросов")
+    repeats = stats.repeated(max_repeats) if max_repeats else []
+    if repeats:
+        problems.append(f"повторы больше {max_repeats} раз (похоже на N+1)")
+
+    path = request.full_path.rstrip("?")
+    line = f"{request.method} {path} {response.status_code}: {stats.summary()}"
+    if not problems:
+        current_app.logger.info(line)
+        return response
+    details = "".join(f"\n  {times}× {sql[:200]}" for sql, times in repeats[:REPORT_REPEATS])
+    message = f"{line} — {'; '.join(problems)}{details}"
+    if config["QUERY_STATS_STRICT"]:
+        raise QueryBudgetExceeded(message)
+    current_app.logger.warning(message)
+    return response
+
+
+def _reset_request(exc=None):
+    token = g.pop("query_stats_token", None)
+    if token is not None:
+        _current.reset(token)
+
+
+def init_query_stats(app) -> None:
+    """Подключает сбор статистики, если он включён в конфигурации."""
+    if not app.config["QUERY_STATS"]:
+        return
+    with app.app_context():
+        engine = db.engine
+        if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+            event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    if app.logger.level == logging.NOTSET:
+        # Иначе строки уровня INFO видны только в режиме отладки
+        app.logger.setLevel(logging.INFO)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_reset_request)
@@ -0,0 +1,27 @@
+"""
+Перестроение полнотекстового индекса постов (см. portal/search.py).
+Нужно после массовых правок постов в обход приложения или после смены
+настроек токенизатора. Обычно индекс поддерживается триггерами сам.
+Использование: python -m portal.rebuild_search_index
+"""
+import time
+
+from portal import create_app
+from portal.extensions import db
+from portal.models import Post
+from portal.search import rebuild_search_index
+
+app = create_app()
+
+
+def main():
+    with app.app_context():
+        print("🔍 Перестраиваю поисковый индекс...")
+        started = time.monotonic()
+        rebuild_search_index()
+        total = db.session.query(Post.id).count()
+        print(f"✅ Готово! Постов в индексе: {total}, {time.monotonic() - started:.1f} с")
+
+
+if __name__ == "__main__":
+    main()
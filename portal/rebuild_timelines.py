@@ -0,0 +1,32 @@
+"""
+Пересборка лент подписок (timeline_entry, см. portal/timeline.py) по текущим
+подпискам и постам. Нужна после ручных правок в БД, смены TIMELINE_MAX_ENTRIES
+или когда популярный автор опустился ниже TIMELINE_FANOUT_LIMIT.
+Использование: python -m portal.rebuild_timelines [--batch-size 500]
+"""
+import argparse
+
+from sqlalchemy import func
+
+from portal import create_app
+from portal.extensions import db
+from portal.models import TimelineEntry
+from portal.timeline import rebuild_all_timelines
+
+app = create_app()
+
+
+def rebuild_timelines(batch_size=500):
+    with app.app_context():
+        print("🔄 Пересобираю ленты подписок...")
+        users = rebuild_all_timelines(batch_size=batch_size)
+        entries = db.session.query(func.count(TimelineEntry.id)).scalar() or 0
+        print(f"  Лент: {users}, записей: {entries}")
+        print("✅ Готово!")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Пересборка лент подписок.")
+    parser.add_argument("--batch-size", type=int, default=500, help="Пользователей в одной пачке")
+    args = parser.parse_args()
+    rebuild_timelines(batch_size=max(1, args.batch_size))
@@ -0,0 +1,360 @@
+"""
+Пакетный расчёт рекомендаций по тегам.
+
+Взаимодействия пользователей (просмотры, комментарии, реакции) собираются в
+разреженную матрицу пользователь × пост, из неё берутся лучшие посты каждого
+пользователя, их теги дают вектор предпочтений пользователь × тег, а близость
+кандидатов считается одной операцией над парами пост–тег. Так за один проход
+можно посчитать ленты сразу для пачки пользователей (фоновый пересчёт).
+
+К этой ленте подмешиваются соседи понравившихся постов из post_neighbor
+(совместные лайки, см. build_post_neighbors) — несколько индексных чтений по K строк.
+
+Если установлен numpy, вычисления векторные; без него используется
+эквивалентная реализация на словарях.
+"""
+from collections import namedtuple
+from itertools import chain, zip_longest
+
+from sqlalchemy import select
+
+from .extensions import db
+from .models import Comment, Post, PostLike, PostNeighbor, PostView, post_tags
+
+try:
+    import numpy as np
+except ImportError:  # numpy необязателен: работает и без него, но медленнее
+    np = None
+
+# Веса взаимодействий (как в исходном calculate_recommendations)
+VIEW_TIME_FULL = 300.0  # 5 минут просмотра = 1.0
+VIEW_TIME_WEIGHT = 2.0
+PROGRESS_WEIGHT = 1.0
+COMPLETE_BONUS = 0.5
+COMMENT_WEIGHT = 3.0
+LIKE_WEIGHT = 5.0
+DISLIKE_WEIGHT = -2.0
+
+# Сколько лучших постов пользователя дают теги-предпочтения
+TOP_POSTS = 10
+# Сколько понравившихся постов пользователя дают соседей (item-to-item)
+NEIGHBOR_SEEDS = 20
+# Сколько свежих постов с подходящими тегами рассматривается при пакетном расчёте
+CANDIDATE_POOL = 5000
+QUERY_CHUNK = 500
+
+UserScores = namedtuple("UserScores", "post_ids interacted_ids")
+
+
+def _chunks(items: list, size: int = QUERY_CHUNK):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _load_interactions(user_ids: list) -> tuple:
+    views, comments, likes = [], [], []
+    for chunk in _chunks(user_ids):
+        views += db.session.query(
+            PostView.user_id, PostView.post_id, PostView.view_duration, PostView.progress, PostView.is_complete
+        ).filter(PostView.user_id.in_(chunk)).all()
+        comments += db.session.query(Comment.author_id, Comment.post_id).filter(Comment.author_id.in_(chunk)).all()
+        likes += db.session.query(PostLike.user_id, PostLike.post_id, PostLike.reaction).filter(
+            PostLike.user_id.in_(chunk)
+        ).order_by(PostLike.id.asc()).all()
+    return views, comments, likes
+
+
+def _load_post_tags(post_ids: list, tag_ids: list = None) -> list:
+    """Пары (post_id, tag_id); tag_ids ограничивает пары нужными тегами."""
+    pairs = []
+    for chunk in _chunks(post_ids):
+        query = db.session.query(post_tags.c.post_id, post_tags.c.tag_id).filter(post_tags.c.post_id.in_(chunk))
+        if tag_ids is not None:
+            query = query.filter(post_tags.c.tag_id.in_(tag_ids))
+        pairs += query.all()
+    return pairs
+
+
+def _load_candidates(tag_ids: list, pool_size: int) -> list:
+    """Свежие опубликованные посты хотя бы с одним из тегов, от новых к старым."""
+    # EXISTS вместо JOIN + GROUP BY: база идёт по индексу created_at и останавливается на лимите
+    has_tag = (
+        select(post_tags.c.post_id)
+        .where(post_tags.c.post_id == Post.id, post_tags.c.tag_id.in_(tag_ids))
+        .exists()
+    )
+    rows = (
+        db.session.query(Post.id)
+        .filter(Post.is_published.is_(True))
+        .filter(has_tag)
+        .order_by(Post.created_at.desc(), Post.id.desc())
+        .limit(pool_size)
+        .all()
+    )
+    return [pid for (pid,) in rows]
+
+
+def _pool_size(user_count: int, limit: int, max_interacted: int) -> int:
+    # Для одного пользователя пул гарантированно содержит limit * 2 непросмотренных постов
+    size = limit * 2 + max_interacted
+    if user_count > 1:
+        size = max(size, CANDIDATE_POOL)
+    return size
+
+
+def _score_python(user_ids: list, views: list, comments: list, likes: list, limit: int) -> dict:
+    scores = {uid: {} for uid in user_ids}
+    interacted = {uid: set() for uid in user_ids}
+
+    for user_id, post_id, duration, progress, is_complete in views:
+        time_score = min(1.0, duration / VIEW_TIME_FULL) if duration else 0.0
+        weight = time_score * VIEW_TIME_WEIGHT + (progress or 0.0) * PROGRESS_WEIGHT
+        weight += COMPLETE_BONUS if is_complete else 0.0
+        scores[user_id][post_id] = scores[user_id].get(post_id, 0.0) + weight
+        interacted[user_id].add(post_id)
+    for user_id, post_id in comments:
+        scores[user_id][post_id] = scores[user_id].get(post_id, 0.0) + COMMENT_WEIGHT
+        interacted[user_id].add(post_id)
+    for user_id, post_id, reaction in likes:
+        weight = LIKE_WEIGHT if reaction == "like" else DISLIKE_WEIGHT if reaction == "dislike" else 0.0
+        scores[user_id][post_id] = scores[user_id].get(post_id, 0.0) + weight
+        if reaction == "like":
+            interacted[user_id].add(post_id)
+
+    top_posts = {}
+    for user_id, post_scores in scores.items():
+        ranked = sorted(post_scores.items(), key=lambda item: (-item[1], item[0]))[:TOP_POSTS]
+        top_posts[user_id] = [pid for pid, score in ranked if score > 0]
+
+    results = {uid: UserScores([], interacted[uid]) for uid in user_ids}
+    all_top = sorted({pid for pids in top_posts.values() for pid in pids})
+    if not all_top:
+        return results
+
+    tags_of = {}
+    for post_id, tag_id in _load_post_tags(all_top):
+        tags_of.setdefault(post_id, set()).add(tag_id)
+    preferred = {uid: set().union(*(tags_of.get(pid, ()) for pid in pids)) for uid, pids in top_posts.items()}
+    union_tags = sorted(set().union(*preferred.values()))
+    if not union_tags:
+        return results
+
+    max_interacted = max(len(ids) for ids in interacted.values())
+    candidates = _load_candidates(union_tags, _pool_size(len(user_ids), limit, max_interacted))
+    candidate_tags = {}
+    for post_id, tag_id in _load_post_tags(candidates, union_tags):
+        candidate_tags.setdefault(post_id, set()).add(tag_id)
+
+    for user_id in user_ids:
+        user_tags = preferred[user_id]
+        if not user_tags:
+            continue
+        eligible = []
+        for post_id in candidates:
+            if post_id in interacted[user_id]:
+                continue
+            affinity = len(candidate_tags.get(post_id, set()) & user_tags)
+            if affinity:
+                eligible.append((post_id, affinity))
+                if len(eligible) >= limit * 2:
+                    break
+        # Кандидаты уже отсортированы по свежести, устойчивая сортировка сохраняет её при равной близости
+        eligible.sort(key=lambda item: item[1], reverse=True)
+        results[user_id] = UserScores([pid for pid, _ in eligible[:limit]], interacted[user_id])
+    return results
+
+
+def _pairs_array(rows: list):
+    """Пары (post_id, tag_id) как массив n × 2 (np.array по строкам Row заметно медленнее)."""
+    return np.fromiter(chain.from_iterable(rows), dtype=np.int64, count=len(rows) * 2).reshape(-1, 2)
+
+
+def _group_starts(groups):
+    """Начала групп в отсортированном массиве и позиция каждого элемента в своей группе."""
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]]) if len(groups) else np.zeros(0, dtype=np.int64)
+    sizes = np.diff(np.r_[starts, len(groups)])
+    return starts, np.arange(len(groups)) - np.repeat(starts, sizes)
+
+
+def _expand(keys, sorted_keys):
+    """
+    Соединение по ключу: для каждого keys[i] — все позиции j, где sorted_keys[j] == keys[i].
+    Возвращает (i, j) двумя массивами; sorted_keys должен быть отсортирован.
+    """
+    first = np.searchsorted(sorted_keys, keys, side="left")
+    counts = np.searchsorted(sorted_keys, keys, side="right") - first
+    left = np.repeat(np.arange(len(keys)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return left, np.repeat(first, counts) + offsets
+
+
+def _score_numpy(user_ids: list, views: list, comments: list, likes: list, limit: int) -> dict:
+    user_index = {uid: i for i, uid in enumerate(user_ids)}
+
+    # Взаимодействия в координатной форме: (пользователь, пост, вес); плотных матриц
+    # пользователь × пост нет — память растёт с числом взаимодействий, а не с их произведением
+    v_user = np.fromiter((user_index[row[0]] for row in views), dtype=np.int64, count=len(views))
+    v_post = np.fromiter((row[1] for row in views), dtype=np.int64, count=len(views))
+    duration = np.fromiter((row[2] or 0.0 for row in views), dtype=np.float64, count=len(views))
+    progress = np.fromiter((row[3] or 0.0 for row in views), dtype=np.float64, count=len(views))
+    complete = np.fromiter((bool(row[4]) for row in views), dtype=bool, count=len(views))
+    v_weight = (
+        np.minimum(1.0, duration / VIEW_TIME_FULL) * VIEW_TIME_WEIGHT
+        + progress * PROGRESS_WEIGHT
+        + complete * COMPLETE_BONUS
+    )
+
+    c_user = np.fromiter((user_index[row[0]] for row in comments), dtype=np.int64, count=len(comments))
+    c_post = np.fromiter((row[1] for row in comments), dtype=np.int64, count=len(comments))
+
+    l_user = np.fromiter((user_index[row[0]] for row in likes), dtype=np.int64, count=len(likes))
+    l_post = np.fromiter((row[1] for row in likes), dtype=np.int64, count=len(likes))
+    reactions = np.array([row[2] for row in likes], dtype=object)
+    is_like = reactions == "like"
+    l_weight = np.where(is_like, LIKE_WEIGHT, np.where(reactions == "dislike", DISLIKE_WEIGHT, 0.0))
+
+    e_user = np.concatenate([v_user, c_user, l_user])
+    e_post = np.concatenate([v_post, c_post, l_post])
+    e_weight = np.concatenate([v_weight, np.full(len(comments), COMMENT_WEIGHT), l_weight])
+    e_interacted = np.concatenate([np.ones(len(views), dtype=bool), np.ones(len(comments), dtype=bool), is_like])
+
+    results = {uid: UserScores([], set()) for uid in user_ids}
+    if not len(e_post):
+        return results
+
+    # Сумма весов по парам (пользователь, пост); ключи отсортированы по пользователю, затем по посту
+    post_ids, e_col = np.unique(e_post, return_inverse=True)
+    pair_keys, pair_of = np.unique(e_user * len(post_ids) + e_col, return_inverse=True)
+    score = np.bincount(pair_of, weights=e_weight, minlength=len(pair_keys))
+    interacted = np.bincount(pair_of, weights=e_interacted, minlength=len(pair_keys)) > 0
+    s_user, s_col = np.divmod(pair_keys, len(post_ids))
+
+    seen_user, seen_post = s_user[interacted], post_ids[s_col[interacted]]
+    starts, _ = _group_starts(seen_user)
+    for user, post_group in zip(seen_user[starts], np.split(seen_post, starts[1:])):
+        results[user_ids[user]] = UserScores([], set(post_group.tolist()))
+
+    # Лучшие TOP_POSTS постов каждого пользователя с положительным баллом
+    order = np.lexsort((s_col, -score, s_user))
+    _, rank = _group_starts(s_user[order])
+    best = order[(rank < TOP_POSTS) & (score[order] > 0)]
+    top_user, top_post = s_user[best], post_ids[s_col[best]]
+    if not len(top_post):
+        return results
+
+    pairs = _pairs_array(_load_post_tags(np.unique(top_post).tolist()))
+    if not len(pairs):
+        return results
+    pairs = pairs[np.argsort(pairs[:, 0], kind="stable")]
+    tag_ids = np.unique(pairs[:, 1])
+    # Предпочтения пользователь × тег: теги его лучших постов, без повторов
+    left, right = _expand(top_post, pairs[:, 0])
+    n_tags = len(tag_ids)
+    preferred = np.unique(top_user[left] * n_tags + np.searchsorted(tag_ids, pairs[right, 1]))
+    pref_user, pref_tag = np.divmod(preferred, n_tags)
+
+    max_interacted = max(len(scores.interacted_ids) for scores in results.values())
+    candidates = np.array(
+        _load_candidates(tag_ids.tolist(), _pool_size(len(user_ids), limit, max_interacted)), dtype=np.int64
+    )
+    if not len(candidates):
+        return results
+    cand_pairs = _pairs_array(_load_post_tags(candidates.tolist(), tag_ids.tolist()))
+    if not len(cand_pairs):
+        return results
+
+    # Близость (пользователь, кандидат): число предпочитаемых тегов кандидата.
+    # Считается только для пар с общим тегом; кандидат задаётся позицией в пуле (свежесть)
+    cand_sorted = np.argsort(candidates, kind="stable")
+    cand_index = cand_sorted[np.searchsorted(candidates[cand_sorted], cand_pairs[:, 0])]
+    cand_tag = np.searchsorted(tag_ids, cand_pairs[:, 1])
+    by_tag = np.argsort(cand_tag, kind="stable")
+    left, right = _expand(pref_tag, cand_tag[by_tag])
+    n_cands = len(candidates)
+    hit_keys, affinity = np.unique(pref_user[left] * n_cands + cand_index[by_tag[right]], return_counts=True)
+    hit_user, hit_cand = np.divmod(hit_keys, n_cands)
+
+    # Посты, с которыми пользователь уже взаимодействовал, не рекомендуем
+    max_post = int(max(post_ids.max(), candidates.max())) + 1
+    known = np.isin(hit_user * max_post + candidates[hit_cand], seen_user * max_post + seen_post)
+    hit_user, hit_cand, affinity = hit_user[~known], hit_cand[~known], affinity[~known]
+
+    # Первые limit * 2 подходящих по свежести, затем устойчиво по убыванию близости
+    _, rank = _group_starts(hit_user)
+    eligible = rank < limit * 2
+    hit_user, hit_cand, affinity = hit_user[eligible], hit_cand[eligible], affinity[eligible]
+    order = np.lexsort((hit_cand, -affinity, hit_user))
+    starts, rank = _group_starts(hit_user[order])
+    chosen = order[rank < limit]
+    chosen_user = hit_user[chosen]
+    starts, _ = _group_starts(chosen_user)
+    for user, cand_group in zip(chosen_user[starts], np.split(hit_cand[chosen], starts[1:])):
+        uid = user_ids[user]
+        results[uid] = UserScores(candidates[cand_group].tolist(), results[uid].interacted_ids)
+    return results
+
+
+def score_users(user_ids, limit: int = 20) -> dict:
+    """
+    Считает рекомендации по тегам для пачки пользователей.
+    Возвращает {user_id: UserScores(post_ids, interacted_ids)}; пустой post_ids —
+    по тегам рекомендовать нечего (вызывающий код использует запасной вариант).
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    if not user_ids:
+        return {}
+    views, comments, likes = _load_interactions(user_ids)
+    if np is not None:
+        results = _score_numpy(user_ids, views, comments, likes, limit)
+    else:
+        results = _score_python(user_ids, views, comments, likes, limit)
+
+    liked = {}
+    for user_id, post_id, reaction in likes:
+        if reaction == "like":
+            liked.setdefault(user_id, []).append(post_id)
+    for user_id, neighbor_ids in _neighbor_recommendations(liked, results, limit).items():
+        scores = results[user_id]
+        results[user_id] = scores._replace(post_ids=_interleave(neighbor_ids, scores.post_ids, limit))
+    return results
+
+
+def _neighbor_recommendations(liked: dict, results: dict, limit: int) -> dict:
+    """Соседи понравившихся постов из post_neighbor: {user_id: [post_id, ...]} по сумме близости."""
+    seeds = {uid: post_ids[-NEIGHBOR_SEEDS:] for uid, post_ids in liked.items()}
+    seed_ids = sorted({pid for post_ids in seeds.values() for pid in post_ids})
+    neighbors_of = {}
+    for chunk in _chunks(seed_ids):
+        rows = (
+            db.session.query(PostNeighbor.post_id, PostNeighbor.neighbor_id, PostNeighbor.score)
+            .join(Post, Post.id == PostNeighbor.neighbor_id)
+            .filter(PostNeighbor.post_id.in_(chunk))
+            .filter(Post.is_published.is_(True))
+        )
+        for post_id, neighbor_id, score in rows:
+            neighbors_of.setdefault(post_id, []).append((neighbor_id, score))
+
+    recommendations = {}
+    for user_id, post_ids in seeds.items():
+        interacted = results[user_id].interacted_ids
+        totals = {}
+        for post_id in post_ids:
+            for neighbor_id, score in neighbors_of.get(post_id, ()):
+                if neighbor_id not in interacted:
+                    totals[neighbor_id] = totals.get(neighbor_id, 0.0) + score
+        if totals:
+            ranked = sorted(totals.items(), key=lambda item: (-item[1], -item[0]))[:limit]
+            recommendations[user_id] = [pid for pid, _ in ranked]
+    return recommendations
+
+
+def _interleave(first: list, second: list, limit: int) -> list:
+    """Чередует два списка рекомендаций без повторов."""
+    merged = []
+    seen = set()
+    for pair in zip_longest(first, second):
+        for post_id in pair:
+            if post_id is not None and post_id not in seen:
+                seen.add(post_id)
+                merged.append(post_id)
+    return merged[:limit]
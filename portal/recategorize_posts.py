@@ -0,0 +1,42 @@
+"""
+Применяет таблицу «тег → категория» (TagCategory, см. portal/tags.py) к уже
+опубликованным постам: добавляет недостающие категории по тегам. С --prune ещё
+и убирает у постов с тегами категории, которые их теги больше не дают (после
+удаления привязки в админке). Посты без тегов не трогаются.
+Работает пачками по диапазонам id постов, каждая пачка — отдельная транзакция.
+Использование: python -m portal.recategorize_posts [--prune] [--batch-size 5000]
+"""
+import argparse
+
+from sqlalchemy import func
+
+from portal import create_app
+from portal.extensions import db
+from portal.models import Post
+from portal.tags import recategorize_posts
+
+app = create_app()
+
+
+def recategorize(prune=False, batch_size=5000):
+    with app.app_context():
+        print("🔄 Пересчитываю категории постов по тегам...")
+        last_id = db.session.query(func.max(Post.id)).scalar() or 0
+        added = removed = 0
+        for first_id in range(1, last_id + 1, batch_size):
+            batch_added, batch_removed = recategorize_posts(
+                first_post_id=first_id, last_post_id=first_id + batch_size - 1, prune=prune
+            )
+            db.session.commit()
+            added += batch_added
+            removed += batch_removed
+        print(f"  Добавлено связей: {added}, удалено: {removed}")
+        print("✅ Готово!")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Категории постов по таблице тег → категория.")
+    parser.add_argument("--prune", action="store_true", help="Убрать категории, которые теги больше не дают")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Диапазон id постов в одной пачке")
+    args = parser.parse_args()
+    recategorize(prune=args.prune, batch_size=max(1, args.batch_size))
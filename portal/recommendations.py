@@ -0,0 +1,260 @@
+"""
+Рекомендации постов для пользователя.
+
+calculate_recommendations считает ленту по всей истории взаимодействий (просмотры,
+комментарии, реакции) — это несколько запросов и сортировка в Python. Поэтому
+результат сохраняется в таблицу user_recommendation, а главная страница читает
+его одним индексированным запросом. Реакция, комментарий или просмотр убирают
+пост из сохранённой ленты и помечают её устаревшей.
+
+Главная страница ничего не пишет: устаревшую ленту (или старше
+RECOMMENDATIONS_TTL секунд) она показывает как есть и ставит пользователя в
+очередь фонового пересчёта — пачкой раз в RECOMMENDATIONS_REFRESH_SECONDS
+(0 — только python -m portal.refresh_recommendations по расписанию). Пока
+ленты ещё нет, рекомендации считаются в запросе без сохранения — её сохранит
+фоновый пересчёт; если он выключен, первая лента сохраняется в запросе.
+
+Пересчёт снимает отметку «устарела» до расчёта: взаимодействие, пришедшее
+во время расчёта, снова её ставит, и лента будет пересчитана ещё раз.
+"""
+import threading
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+from sqlalchemy import delete, func, insert, update
+
+from .background import PeriodicFlusher
+from .extensions import db
+from .models import Post, PostLike, PostNeighbor, User, UserRecommendation
+from .rec_engine import score_users
+
+# Сколько постов хранится в ленте пользователя
+STORED_RECOMMENDATIONS = 20
+# Пользователей в одном проходе rec_engine при фоновом пересчёте (ограничивает память)
+REFRESH_BATCH_SIZE = 200
+
+_refresher_lock = threading.Lock()
+
+
+def calculate_recommendations(user_id: int, limit: int = 20) -> list:
+    """
+    Рассчитывает рекомендации постов на основе взаимодействия пользователя:
+    - Время просмотра поста
+    - Комментарии пользователя
+    - Реакции (лайки/дизлайки)
+    """
+    # Баллы взаимодействий и близость кандидатов по тегам считает rec_engine
+    scores = score_users([user_id], limit=limit)[user_id]
+    if scores.post_ids:
+        return _posts_in_order(scores.post_ids)
+    return _fallback_recommendations(scores.interacted_ids, limit)
+
+
+def _posts_in_order(post_ids: list) -> list:
+    posts = {post.id: post for post in Post.query.filter(Post.id.in_(post_ids)).all()}
+    return [posts[pid] for pid in post_ids if pid in posts]
+
+
+def _fallback_recommendations(all_interacted_ids: set, limit: int) -> list:
+    # Fallback: если нет данных о взаимодействии, показываем популярные посты с лайками
+    # или просто свежие посты, которые пользователь еще не видел
+    if not all_interacted_ids:
+        # Для новых пользователей показываем популярные посты
+        popular_posts = (
+            Post.query.join(PostLike)
+            .filter(Post.is_published.is_(True))
+            .filter(PostLike.reaction == "like")
+            .group_by(Post.id)
+            .order_by(func.count(PostLike.id).desc(), Post.created_at.desc())
+            .limit(limit)
+            .all()
+        )
+        if popular_posts:
+            return popular_posts
+    
+    # Если все еще нет рекомендаций, показываем свежие посты, которые пользователь не видел
+    fresh_posts = (
+        Post.query.filter_by(is_published=True)
+        .filter(~Post.id.in_(all_interacted_ids) if all_interacted_ids else True)
+        .order_by(Post.created_at.desc())
+        .limit(limit)
+        .all()
+    )
+    
+    return fresh_posts
+
+
+def get_post_neighbors(post_id: int, limit: int = 5) -> list:
+    """Посты, которые нравятся тем же людям, что и этот (из post_neighbor)."""
+    return (
+        Post.query.join(PostNeighbor, PostNeighbor.neighbor_id == Post.id)
+        .filter(PostNeighbor.post_id == post_id)
+        .filter(Post.is_published.is_(True))
+        .order_by(PostNeighbor.rank.asc())
+        .limit(limit)
+        .all()
+    )
+
+
+def mark_recommendations_stale(user_id: int, post_id: int = None) -> None:
+    """
+    Вызывается при реакции, комментарии или просмотре (до commit()).
+    Пост, с которым пользователь уже взаимодействовал, сразу убирается из ленты.
+    """
+    if post_id is not None:
+        db.session.execute(
+            delete(UserRecommendation).where(
+                UserRecommendation.user_id == user_id,
+                UserRecommendation.post_id == post_id,
+            )
+        )
+    db.session.execute(
+        update(User)
+        .where(User.id == user_id, User.recommendations_stale.is_(False))
+        .values(recommendations_stale=True)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _store_recommendations(user_id: int, post_ids: list) -> None:
+    db.session.execute(delete(UserRecommendation).where(UserRecommendation.user_id == user_id))
+    if post_ids:
+        db.session.execute(
+            insert(UserRecommendation),
+            [{"user_id": user_id, "post_id": pid, "rank": rank} for rank, pid in enumerate(post_ids)],
+        )
+
+
+def _is_expired(user: User) -> bool:
+    refreshed_at = user.recommendations_refreshed_at
+    if refreshed_at is None:
+        return True
+    if refreshed_at.tzinfo is None:
+        refreshed_at = refreshed_at.replace(tzinfo=timezone.utc)
+    ttl = current_app.config.get("RECOMMENDATIONS_TTL", 900)
+    return datetime.now(timezone.utc) - refreshed_at > timedelta(seconds=ttl)
+
+
+def get_recommendations(user: User, limit: int = 10) -> list:
+    """Лента рекомендаций без записи в БД: сохранённая, устаревшая пересчитывается в фоне."""
+    if user.recommendations_refreshed_at is None and not get_recommendation_refresher().enabled:
+        # Фонового пересчёта нет — сохраняем первую ленту сразу, иначе её считал бы каждый запрос
+        refresh_recommendations_batch([user.id])
+    elif user.recommendations_stale or _is_expired(user):
+        schedule_refresh(user.id)
+    if user.recommendations_refreshed_at is None:
+        # Ленту ещё ни разу не сохраняли — считаем в запросе, сохранит фоновый пересчёт
+        posts = calculate_recommendations(user.id, limit=STORED_RECOMMENDATIONS)
+        return [post for post in posts if post.is_published][:limit]
+    return (
+        Post.query.join(UserRecommendation, UserRecommendation.post_id == Post.id)
+        .filter(UserRecommendation.user_id == user.id)
+        .filter(Post.is_published.is_(True))
+        .order_by(UserRecommendation.rank.asc())
+        .limit(limit)
+        .all()
+    )
+
+
+def refresh_recommendations_batch(user_ids: list) -> None:
+    """Пересчитывает ленты пачки пользователей за один проход rec_engine (фоновое обновление)."""
+    # Отметка снимается до расчёта отдельной транзакцией: взаимодействие во время
+    # расчёта поставит её снова (mark_recommendations_stale), и оно не потеряется
+    _set_stale(user_ids, False)
+    db.session.commit()
+    try:
+        results = score_users(user_ids, limit=STORED_RECOMMENDATIONS)
+        for user_id, scores in results.items():
+            post_ids = scores.post_ids
+            if not post_ids:
+                post_ids = [post.id for post in _fallback_recommendations(scores.interacted_ids, STORED_RECOMMENDATIONS)]
+            _store_recommendations(user_id, post_ids)
+        db.session.execute(
+            update(User)
+            .where(User.id.in_(list(results)))
+            .values(recommendations_refreshed_at=datetime.now(timezone.utc))
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        _set_stale(user_ids, True)
+        db.session.commit()
+        raise
+
+
+def _set_stale(user_ids: list, stale: bool) -> None:
+    db.session.execute(
+        update(User)
+        .where(User.id.in_(user_ids))
+        .values(recommendations_stale=stale)
+        .execution_options(synchronize_session=False)
+    )
+
+
+class RecommendationRefresher:
+    """Пользователи, чьи ленты пора пересчитать в фоне (см. get_recommendation_refresher)."""
+
+    def __init__(self, app, interval: float):
+        self.app = app
+        self.interval = interval
+        self._user_ids = set()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flusher = PeriodicFlusher(self.flush, interval, "recommendations-refresher") if interval > 0 else None
+
+    @property
+    def enabled(self) -> bool:
+        return self._flusher is not None
+
+    def add(self, user_id: int) -> None:
+        if self._flusher is None:
+            return
+        with self._lock:
+            self._user_ids.add(user_id)
+        self._flusher.ensure_started()
+
+    def flush(self) -> int:
+        """Пересчитывает ленты накопленных пользователей пачками по REFRESH_BATCH_SIZE; возвращает их число."""
+        with self._flush_lock:
+            with self._lock:
+                user_ids, self._user_ids = self._user_ids, set()
+            if not user_ids:
+                return 0
+            pending = sorted(user_ids)
+            refreshed = 0
+            with self.app.app_context():
+                try:
+                    while pending:
+                        refresh_recommendations_batch(pending[:REFRESH_BATCH_SIZE])
+                        refreshed += len(pending[:REFRESH_BATCH_SIZE])
+                        pending = pending[REFRESH_BATCH_SIZE:]
+                    return refreshed
+                except Exception:
+                    db.session.rollback()
+                    with self._lock:
+                        self._user_ids.update(pending)
+                    current_app.logger.exception("Не удалось пересчитать рекомендации, повтор при следующем проходе")
+                    return refreshed
+                finally:
+                    db.session.remove()
+
+
+def get_recommendation_refresher() -> RecommendationRefresher:
+    """Фоновый пересчёт рекомендаций текущего приложения (создаётся при первом обращении)."""
+    app = current_app._get_current_object()
+    refresher = app.extensions.get("recommendation_refresher")
+    if refresher is not None:
+        return refresher
+    with _refresher_lock:
+        refresher = app.extensions.get("recommendation_refresher")
+        if refresher is None:
+            refresher = app.extensions["recommendation_refresher"] = RecommendationRefresher(
+                app, interval=app.config.get("RECOMMENDATIONS_REFRESH_SECONDS", 10)
+            )
+    return refresher
+
+
+def schedule_refresh(user_id: int) -> None:
+    """Ставит ленту пользователя в очередь фонового пересчёта."""
+    get_recommendation_refresher().add(user_id)
@@ -0,0 +1,65 @@
+"""
+Сверка денормализованных счётчиков постов и пользователей (см. portal/counters.py).
+Пересчитывает их по исходным таблицам пачками по первичному ключу — на случай
+ручных правок в БД или сбоев. Показывает, сколько строк расходилось.
+Использование: python -m portal.reconcile_counters [--batch-size 5000]
+"""
+import argparse
+
+from sqlalchemy import func
+
+from portal import create_app
+from portal.counters import REACTION_COUNTERS, recount_posts, recount_users
+from portal.extensions import db
+from portal.models import Post, User
+
+app = create_app()
+
+POST_COUNTERS = ["comments_count", "viewers_count", *REACTION_COUNTERS.values()]
+USER_COUNTERS = ["posts_count", "comments_count", "followers_count", "following_count"]
+
+
+def _snapshot(model, columns, ids):
+    rows = db.session.query(model.id, *[getattr(model, name) for name in columns]).filter(model.id.in_(ids))
+    return {row[0]: tuple(row[1:]) for row in rows}
+
+
+def _reconcile(model, columns, recount, batch_size):
+    total = db.session.query(func.count(model.id)).scalar() or 0
+    changed = 0
+    last_id = 0
+    while True:
+        ids = [
+            object_id
+            for (object_id,) in db.session.query(model.id)
+            .filter(model.id > last_id)
+            .order_by(model.id.asc())
+            .limit(batch_size)
+        ]
+        if not ids:
+            break
+        before = _snapshot(model, columns, ids)
+        recount(ids)
+        after = _snapshot(model, columns, ids)
+        db.session.commit()
+        changed += sum(1 for object_id in ids if before.get(object_id) != after.get(object_id))
+        last_id = ids[-1]
+    return total, changed
+
+
+def reconcile_counters(batch_size=5000):
+    with app.app_context():
+        print("🔍 Сверяю счётчики постов...")
+        total, changed = _reconcile(Post, POST_COUNTERS, recount_posts, batch_size)
+        print(f"  Постов: {total}, исправлено: {changed}")
+        print("🔍 Сверяю счётчики пользователей...")
+        total, changed = _reconcile(User, USER_COUNTERS, recount_users, batch_size)
+        print(f"  Пользователей: {total}, исправлено: {changed}")
+        print("✅ Готово!")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Пересчёт денормализованных счётчиков.")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Строк в одной пачке")
+    args = parser.parse_args()
+    reconcile_counters(batch_size=max(1, args.batch_size))
@@ -0,0 +1,51 @@
+"""
+Фоновый пересчёт сохранённых рекомендаций пользователей.
+Ленты считаются пачками: rec_engine обрабатывает всех пользователей пачки
+за один проход. Можно запускать по расписанию (cron), чтобы главная страница
+почти никогда не пересчитывала рекомендации сама.
+Использование: python -m portal.refresh_recommendations [--all] [--batch-size 200]
+
+  --all  пересчитать ленты всех пользователей, а не только устаревшие
+"""
+import argparse
+
+from portal import create_app
+from portal.extensions import db
+from portal.models import User
+from portal.recommendations import refresh_recommendations_batch
+
+app = create_app()
+
+
+def refresh_all(include_fresh=False, batch_size=200):
+    """Пересчитывает ленты устаревших (или всех) пользователей пачками."""
+    with app.app_context():
+        base_query = db.session.query(User.id)
+        if not include_fresh:
+            base_query = base_query.filter(User.recommendations_stale.is_(True))
+        total = base_query.count()
+        print(f"🔍 Пересчитываю рекомендации для {total} пользователей...")
+
+        processed = 0
+        last_id = 0
+        while True:
+            user_ids = [
+                uid for (uid,) in base_query.filter(User.id > last_id).order_by(User.id.asc()).limit(batch_size)
+            ]
+            if not user_ids:
+                break
+            refresh_recommendations_batch(user_ids)
+            last_id = user_ids[-1]
+            processed += len(user_ids)
+            db.session.expunge_all()
+            print(f"  Обработано: {processed}/{total}")
+
+        print(f"✅ Готово! Обновлено лент: {processed}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Фоновый пересчёт рекомендаций пользователей.")
+    parser.add_argument("--all", action="store_true", help="Пересчитать все ленты, а не только устаревшие")
+    parser.add_argument("--batch-size", type=int, default=200, help="Пользователей в одной пачке")
+    args = parser.parse_args()
+    refresh_all(include_fresh=args.all, batch_size=max(1, args.batch_size))
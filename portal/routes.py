@@ -1,22 +1,46 @@
 from functools import wraps
 from datetime import datetime, timezone
-import os
 import re
-import uuid
+import time
 
 from flask import Blueprint, current_app, flash, jsonify, redirect, render_template, request, url_for
 from flask_login import current_user, login_required, login_user, logout_user
 from sqlalchemy import func
+from sqlalchemy.orm import joinedload, selectinload
 from werkzeug.security import generate_password_hash
 from werkzeug.utils import secure_filename
 
-from .duplicate_checker import check_duplicate, find_similar_posts
+from .config_versions import bump_config_version, get_config_version
+from .counters import (
+    REACTION_COUNTERS, adjust_post_counters, adjust_reaction_counters, adjust_user_counters,
+    affected_by_user_delete, recount_posts, recount_users, users_affected_by_post_delete,
+)
+from .duplicate_checker import check_duplicate, find_similar_posts, index_post
 from .extensions import db
-from .forms import CategoryForm, CommentForm, LoginForm, PostForm, ProfileEditForm, RegisterForm, SearchForm
+from .forms import (
+    CategoryForm, CommentForm, LoginForm, PostForm, ProfileEditForm, RegisterForm, SearchForm, TagCategoryForm,
+)
+from .hotness import HOT_COMMENT_WEIGHT, bump_hot_score, drop_hot_score, hot_order, reaction_weight
+from .media import release_media, store_upload
 from .models import (
-    Category, Comment, Follow, ModerationLog, ModerationSettings, ModeratedTag, 
-    Post, PostLike, PostView, Tag, Track, User, UserTagPreference
+    BadWord, Category, Comment, Follow, ModerationLog, ModerationSettings, ModeratedTag, 
+    Post, PostLike, PostView, Tag, TagCategory, Track, User, UserTagPreference, delete_post_rows,
+)
+from .recommendations import get_post_neighbors, get_recommendations, mark_recommendations_stale
+from .pagination import (
+    DEFAULT_PER_PAGE, HOTTEST_FIRST, NEWEST_FIRST, Page, fragment_response, next_page_url, paginate, wants_fragment,
 )
+from .search import filter_posts, search_snippets
+from .sidebar_cache import get_sidebar_data, invalidate_sidebar, sidebar_state
+from .tags import create_categories_from_tags, get_or_create_tags, invalidate_tags, recategorize_posts, slugify_tag
+from .thumbnails import schedule_derivatives
+from .timeline import backfill_author, fan_out_post, following_page, remove_author
+from .uploads import (
+    UploadError, attach_upload, cancel_upload, complete_upload, get_upload, start_upload, upload_state, write_chunk,
+)
+from .view_buffer import get_view_buffer
+from .view_counter import count_post_view
+from .word_filter import get_matcher
 
 bp = Blueprint("main", __name__)
 
@@ -26,148 +50,53 @@ REACTIONS = {
 }
 
 # Простая авто‑модерация: список стоп‑слов (можно расширять)
-BAD_WORDS = {
+# Формат записей — см. word_filter: "слово", "основа*", "*подстрока*"
+# Список хранится в таблице bad_word; здесь — локальная копия процесса
+BAD_WORDS = set()
+# Версия списка из config_version: автомат пересобирается только при её изменении
+BAD_WORDS_VERSION = None
+BAD_WORDS_CONFIG_KEY = "bad_words"
+_bad_words_checked_at = 0.0
 
-}
 
-# Функция для получения списка тегов, требующих модерации
-def get_moderated_tags() -> set:
-    """Получает список slug тегов, требующих модерации."""
-    moderated = ModeratedTag.query.join(Tag).all()
-    return {mt.tag.slug for mt in moderated}
+def refresh_bad_words(force: bool = False) -> None:
+    """
+    Сверяет версию списка с БД (не чаще раза в BAD_WORDS_REFRESH_SECONDS)
+    и перечитывает слова только если версия изменилась.
+    """
+    global BAD_WORDS, BAD_WORDS_VERSION, _bad_words_checked_at
+    now = time.monotonic()
+    interval = current_app.config.get("BAD_WORDS_REFRESH_SECONDS", 5)
+    if not force and BAD_WORDS_VERSION is not None and now - _bad_words_checked_at < interval:
+        return
+    _bad_words_checked_at = now
+    version = get_config_version(BAD_WORDS_CONFIG_KEY)
+    if version != BAD_WORDS_VERSION:
+        BAD_WORDS = {word for (word,) in db.session.query(BadWord.word)}
+        BAD_WORDS_VERSION = version
+
+
+def get_bad_words() -> set:
+    """Актуальный список запрещённых слов."""
+    refresh_bad_words()
+    return BAD_WORDS
 
 ALLOWED_IMAGE_EXT = {"jpg", "jpeg", "png", "gif", "webp"}
 ALLOWED_VIDEO_EXT = {"mp4", "webm", "mov"}
 ALLOWED_MEDIA_EXT = ALLOWED_IMAGE_EXT | ALLOWED_VIDEO_EXT
 
 
-def slugify_tag(name: str) -> str:
-    """Создает slug из названия тега."""
-    name = name.lower().strip()
-    name = re.sub(r"[^\wа-яё-]+", "-", name)
-    name = re.sub(r"-+", "-", name)
-    return name.strip("-")
-
-
-def get_or_create_tags(tag_names: str) -> tuple:
-    """Получает или создает теги из строки с запятыми. Возвращает (tags, requires_moderation)."""
-    if not tag_names:
-        return [], False
-    tags = []
-    requires_moderation = False
-    for name in tag_names.split(","):
-        name = name.strip()
-        if not name:
-            continue
-        slug = slugify_tag(name)
-        if not slug:
-            continue
-        # Проверка на модерацию по тегам
-        moderated_tags = get_moderated_tags()
-        if slug in moderated_tags or name.lower() in moderated_tags:
-            requires_moderation = True
-        tag = Tag.query.filter_by(slug=slug).first()
-        if not tag:
-            tag = Tag(name=name, slug=slug)
-            db.session.add(tag)
-        tags.append(tag)
-    return tags, requires_moderation
-
-
-def create_categories_from_tags(tags: list) -> list:
-    """Автоматически создает категории на основе тегов поста."""
-    if not tags:
-        return []
-    
-    categories = []
-    # Маппинг тегов к категориям (можно расширить)
-    tag_to_category = {
-        # Мемы и юмор
-        "мемы": ("memes", "Мемы"),
-        "мем": ("memes", "Мемы"),
-        "юмор": ("humor", "Юмор"),
-        "шутка": ("humor", "Юмор"),
-        "вирусное": ("memes", "Мемы"),
-        "тренд": ("memes", "Мемы"),
-        
-        # Кино
-        "кино": ("movies", "Кино"),
-        "фильм": ("movies", "Кино"),
-        "сериал": ("movies", "Кино"),
-        "сериалы": ("movies", "Кино"),
-        "тв": ("movies", "Кино"),
-        "трейлер": ("movies", "Кино"),
-        "рецензия": ("movies", "Кино"),
-        "комедия": ("movies", "Кино"),
-        "драма": ("movies", "Кино"),
-        "фантастика": ("movies", "Кино"),
-        "хоррор": ("movies", "Кино"),
-        "приключения": ("movies", "Кино"),
-        "аниме": ("movies", "Кино"),
-        "стриминг": ("movies", "Кино"),
-        
-        # Игры
-        "игры": ("games", "Игры"),
-        "игра": ("games", "Игры"),
-        "cs2": ("games", "Игры"),
-        "dota": ("games", "Игры"),
-        "valorant": ("games", "Игры"),
-        "fps": ("games", "Игры"),
-        "rpg": ("games", "Игры"),
-        "mmo": ("games", "Игры"),
-        "инди": ("games", "Игры"),
-        "pc": ("games", "Игры"),
-        "консоль": ("games", "Игры"),
-        "мобильные": ("games", "Игры"),
-        
-        # Музыка
-        "музыка": ("music", "Музыка"),
-        "рок": ("music", "Музыка"),
-        "поп": ("music", "Музыка"),
-        "электроника": ("music", "Музыка"),
-        "хип-хоп": ("music", "Музыка"),
-        "джаз": ("music", "Музыка"),
-        "альбом": ("music", "Музыка"),
-        "сингл": ("music", "Музыка"),
-        "концерт": ("music", "Музыка"),
-        "фестиваль": ("music", "Музыка"),
-        
-        # Технологии
-        "технологии": ("tech", "Техно‑фан"),
-        "техно": ("tech", "Техно‑фан"),
-        "программирование": ("tech", "Техно‑фан"),
-        "разработка": ("tech", "Техно‑фан"),
-        "дизайн": ("tech", "Техно‑фан"),
-        "веб": ("tech", "Техно‑фан"),
-    }
-    
-    # Собираем уникальные категории из тегов
-    category_slugs = set()
-    for tag in tags:
-        tag_name_lower = tag.name.lower()
-        if tag_name_lower in tag_to_category:
-            slug, title = tag_to_category[tag_name_lower]
-            category_slugs.add((slug, title))
-    
-    # Создаем или получаем категории
-    for slug, title in category_slugs:
-        category = Category.query.filter_by(slug=slug).first()
-        if not category:
-            category = Category(slug=slug, title=title)
-            db.session.add(category)
-        categories.append(category)
-    
-    return categories
-
-
 def contains_bad_words(text: str) -> bool:
     if not text:
         return False
-    lowered = text.lower()
-    # Убираем знаки препинания
-    cleaned = re.sub(r"[^\wа-яё]+", " ", lowered, flags=re.IGNORECASE)
-    words = set(cleaned.split())
-    return any(bad in words for bad in BAD_WORDS)
+    return get_matcher(BAD_WORDS, BAD_WORDS_VERSION).contains(text)
+
+
+def bad_word_matches(text: str) -> list:
+    """Запрещённые слова (записи списка), найденные в тексте."""
+    if not text:
+        return []
+    return get_matcher(BAD_WORDS, BAD_WORDS_VERSION).find_all(text)
 
 
 def is_allowed_media(filename: str) -> bool:
@@ -183,7 +112,10 @@ def is_auto_mod_enabled() -> bool:
     return not settings or bool(settings.auto_enabled)
 
 
-def log_moderation(kind: str, *, user_id=None, post_id=None, comment_id=None, reason: str = "", text: str = "") -> None:
+def moderation_log_values(
+    kind: str, *, user_id=None, post_id=None, comment_id=None, reason: str = "", text: str = "", terms=None
+) -> dict:
+    """Поля записи ModerationLog (используется и для массовой вставки)."""
     # Очищаем текст от HTML-тегов для snippet
     import re
     clean_text = re.sub(r'<[^>]+>', '', text or "")  # Удаляем HTML-теги
@@ -193,13 +125,49 @@ def log_moderation(kind: str, *, user_id=None, post_id=None, comment_id=None, re
     snippet = clean_text
     if len(snippet) > 180:
         snippet = snippet[:177] + "..."
+    # Найденные запрещённые слова дописываем к причине
+    if terms:
+        reason = f"{reason}: {', '.join(terms)}" if reason else ", ".join(terms)
+        if len(reason) > 120:
+            reason = reason[:117] + "..."
+    return {
+        "kind": kind,
+        "reason": reason or None,
+        "snippet": snippet or None,
+        "user_id": user_id,
+        "post_id": post_id,
+        "comment_id": comment_id,
+    }
+
+
+def attach_uploaded_media(post: Post, token: str) -> None:
+    """Прикрепляет к посту файл, загруженный частями (см. uploads.py)."""
+    media_path = attach_upload(current_user, token)
+    if media_path is None:
+        flash("Загрузка файла не найдена или не завершена — пост сохранён без него.", "warning")
+        return
+    # Старый файл теряет ссылку, ссылка загрузки переходит к посту
+    release_media(post.media_path)
+    post.media_path = media_path
+    ext = media_path.rsplit(".", 1)[-1].lower()
+    post.media_type = "video" if ext in ALLOWED_VIDEO_EXT else "image"
+    if post.media_type == "image":
+        schedule_derivatives(post.media_path, "post")
+
+
+def log_moderation(
+    kind: str, *, user_id=None, post_id=None, comment_id=None, reason: str = "", text: str = "", terms=None
+) -> None:
     log = ModerationLog(
-        kind=kind,
-        reason=reason or None,
-        snippet=snippet or None,
-        user_id=user_id,
-        post_id=post_id,
-        comment_id=comment_id,
+        **moderation_log_values(
+            kind,
+            user_id=user_id,
+            post_id=post_id,
+            comment_id=comment_id,
+            reason=reason,
+            text=text,
+            terms=terms,
+        )
     )
     db.session.add(log)
 
@@ -211,6 +179,11 @@ def handle_large_request(_error):
     return redirect(request.referrer or url_for("main.post_new"))
 
 
+@bp.before_app_request
+def check_bad_words_version():
+    refresh_bad_words()
+
+
 def admin_required(view):
     @wraps(view)
     def wrapped(*args, **kwargs):
@@ -224,180 +197,53 @@ def admin_required(view):
 
 @bp.context_processor
 def inject_globals():
-    # Популярные теги для облака
-    popular_tags = (
-        db.session.query(Tag, func.count(Post.id).label("count"))
-        .join(Post.tags)
-        .filter(Post.is_published.is_(True))
-        .group_by(Tag.id)
-        .order_by(func.count(Post.id).desc())
-        .limit(20)
-        .all()
-    )
+    # Категории и популярные теги для облака — из кэша (см. sidebar_cache)
+    all_categories, popular_tags = get_sidebar_data()
     return {
-        "all_categories": Category.query.order_by(Category.title.asc()).all(),
-        "popular_tags": [t[0] for t in popular_tags],
+        "all_categories": all_categories,
+        "popular_tags": popular_tags,
         "search_form": SearchForm(),
     }
 
 
-def calculate_recommendations(user_id: int, limit: int = 20) -> list:
-    """
-    Рассчитывает рекомендации постов на основе взаимодействия пользователя:
-    - Время просмотра поста
-    - Комментарии пользователя
-    - Реакции (лайки/дизлайки)
-    """
-    # Получаем все посты, с которыми пользователь взаимодействовал
-    user_views = PostView.query.filter_by(user_id=user_id).all()
-    user_comments = Comment.query.filter_by(author_id=user_id).all()
-    user_likes = PostLike.query.filter_by(user_id=user_id).all()
-    
-    # Собираем данные о взаимодействии по постам
-    post_scores = {}  # {post_id: score}
-    
-    # 1. Время просмотра (чем дольше смотрел, тем выше интерес)
-    for view in user_views:
-        post_id = view.post_id
-        if post_id not in post_scores:
-            post_scores[post_id] = 0.0
-        
-        # Нормализуем время просмотра (максимум 5 минут = 300 секунд = 1.0 балл)
-        time_score = min(1.0, view.view_duration / 300.0) if view.view_duration else 0.0
-        # Учитываем прогресс просмотра
-        progress_score = view.progress or 0.0
-        # Если просмотрен полностью - бонус
-        complete_bonus = 0.5 if view.is_complete else 0.0
-        
-        post_scores[post_id] += (time_score * 2.0) + (progress_score * 1.0) + complete_bonus
-    
-    # 2. Комментарии (если писал комментарии - высокий интерес)
-    for comment in user_comments:
-        post_id = comment.post_id
-        if post_id not in post_scores:
-            post_scores[post_id] = 0.0
-        # Каждый комментарий добавляет 3.0 балла
-        post_scores[post_id] += 3.0
-    
-    # 3. Реакции
-    for like in user_likes:
-        post_id = like.post_id
-        if post_id not in post_scores:
-            post_scores[post_id] = 0.0
-        
-        if like.reaction == "like":
-            # Лайк добавляет 5.0 балла
-            post_scores[post_id] += 5.0
-        elif like.reaction == "dislike":
-            # Дизлайк уменьшает интерес, но не убирает полностью
-            post_scores[post_id] -= 2.0
-    
-    # Получаем ID всех постов, с которыми пользователь взаимодействовал
-    viewed_post_ids = {view.post_id for view in user_views}
-    liked_post_ids = {like.post_id for like in user_likes if like.reaction == "like"}
-    commented_post_ids = {comment.post_id for comment in user_comments}
-    all_interacted_ids = viewed_post_ids | liked_post_ids | commented_post_ids
-    
-    # Если есть хоть какое-то взаимодействие, используем его для рекомендаций
-    if post_scores:
-        # Берем посты с любым положительным рейтингом (не только > 2.0)
-        # Сортируем по рейтингу и берем топ-10
-        sorted_posts = sorted(post_scores.items(), key=lambda x: x[1], reverse=True)
-        top_posts = [pid for pid, score in sorted_posts[:10] if score > 0]
-        
-        if top_posts:
-            # Получаем теги из этих постов
-            preferred_tags = (
-                db.session.query(Tag.id, Tag.name)
-                .join(Post.tags)
-                .filter(Post.id.in_(top_posts))
-                .group_by(Tag.id, Tag.name)
-                .all()
-            )
-            
-            if preferred_tags:
-                preferred_tag_ids = [tag_id for tag_id, _ in preferred_tags]
-                
-                # Находим посты с похожими тегами, которые пользователь еще не видел
-                recommended_query = (
-                    Post.query.join(Post.tags)
-                    .filter(Post.is_published.is_(True))
-                    .filter(Tag.id.in_(preferred_tag_ids))
-                    .filter(~Post.id.in_(all_interacted_ids) if all_interacted_ids else True)
-                    .order_by(Post.created_at.desc())
-                    .limit(limit * 2)
-                    .all()
-                )
-                
-                if recommended_query:
-                    # Сортируем по релевантности (количество совпадающих тегов)
-                    post_relevance = {}
-                    for post in recommended_query:
-                        post_tags = {tag.id for tag in post.tags}
-                        matching_tags = len(post_tags.intersection(set(preferred_tag_ids)))
-                        post_relevance[post.id] = matching_tags
-                    
-                    # Сортируем по релевантности и свежести
-                    recommended_posts = sorted(
-                        recommended_query,
-                        key=lambda p: (post_relevance.get(p.id, 0), p.created_at),
-                        reverse=True
-                    )[:limit]
-                    
-                    if recommended_posts:
-                        return recommended_posts
-    
-    # Fallback: если нет данных о взаимодействии, показываем популярные посты с лайками
-    # или просто свежие посты, которые пользователь еще не видел
-    if not all_interacted_ids:
-        # Для новых пользователей показываем популярные посты
-        popular_posts = (
-            Post.query.join(PostLike)
-            .filter(Post.is_published.is_(True))
-            .filter(PostLike.reaction == "like")
-            .group_by(Post.id)
-            .order_by(func.count(PostLike.id).desc(), Post.created_at.desc())
-            .limit(limit)
-            .all()
-        )
-        if popular_posts:
-            return popular_posts
-    
-    # Если все еще нет рекомендаций, показываем свежие посты, которые пользователь не видел
-    fresh_posts = (
-        Post.query.filter_by(is_published=True)
-        .filter(~Post.id.in_(all_interacted_ids) if all_interacted_ids else True)
-        .order_by(Post.created_at.desc())
-        .limit(limit)
-        .all()
-    )
-    
-    return fresh_posts
-
-
 @bp.get("/")
 def index():
     category = request.args.get("category")
     tag_slug = request.args.get("tag")
     q = request.args.get("q")
+    sort = "hot" if request.args.get("sort") == "hot" else "new"
+
+    cursor = request.args.get("cursor")
+
+    # Если пользователь авторизован, показываем рекомендации на основе взаимодействия
+    recommended_posts = []
+    if current_user.is_authenticated and not category and not tag_slug and not q and not cursor:
+        recommended_posts = get_recommendations(current_user, limit=10)
 
-    query = Post.query.filter_by(is_published=True).order_by(Post.created_at.desc())
+    query = Post.query.filter_by(is_published=True)
 
     if category:
         query = query.join(Post.categories).filter(Category.slug == category)
     if tag_slug:
         query = query.join(Post.tags).filter(Tag.slug == tag_slug)
-    if q:
-        like = f"%{q.strip()}%"
-        query = query.filter((Post.title.ilike(like)) | (Post.body.ilike(like)))
+    searching = bool(q and q.strip())
+    if searching and sort != "hot":
+        # Полнотекстовый поиск по релевантности (см. search.py): только первая страница,
+        # у ранга bm25 нет ключа для курсора
+        page = Page(filter_posts(query, q).limit(DEFAULT_PER_PAGE).all(), None)
+    else:
+        if searching:
+            query = filter_posts(query, q, ranked=False)
+        # Курсорная пагинация: глубокие страницы не дороже первой (см. pagination.py)
+        page = paginate(query, HOTTEST_FIRST if sort == "hot" else NEWEST_FIRST, cursor=cursor, selective=searching)
+    posts = page.items
 
-    # Если пользователь авторизован, показываем рекомендации на основе взаимодействия
-    recommended_posts = []
-    if current_user.is_authenticated and not category and not tag_slug and not q:
-        recommended_posts = calculate_recommendations(current_user.id, limit=10)
+    # Фрагменты текста с подсветкой найденных слов
+    snippets = search_snippets(posts, q) if searching else {}
+
+    if wants_fragment():
+        return fragment_response("_feed_posts.html", page, snippets=snippets)
 
-    posts = query.limit(50).all()
-    
     # Если есть рекомендации, добавляем их в начало
     if recommended_posts:
         # Исключаем дубликаты
@@ -405,16 +251,8 @@ def index():
         new_recommended = [p for p in recommended_posts if p.id not in existing_ids]
         posts = new_recommended[:10] + posts
 
-    trending_rows = (
-        db.session.query(Post, func.count(Comment.id).label("comments_count"))
-        .outerjoin(Comment, Comment.post_id == Post.id)
-        .filter(Post.is_published.is_(True))
-        .group_by(Post.id)
-        .order_by(func.count(Comment.id).desc(), Post.created_at.desc())
-        .limit(5)
-        .all()
-    )
-    trending_posts = [row[0] for row in trending_rows]
+    # Обсуждаемое — top-N по горячести (индекс is_published, hot_score)
+    trending_posts = Post.query.filter_by(is_published=True).order_by(*hot_order()).limit(5).all()
 
     return render_template(
         "index.html",
@@ -422,7 +260,11 @@ def index():
         recommended_posts=recommended_posts,
         trending_posts=trending_posts,
         active_category=category,
+        active_tag=tag_slug,
+        sort=sort,
         q=q,
+        snippets=snippets,
+        next_url=next_page_url(page),
         has_recommendations=bool(recommended_posts),
     )
 
@@ -455,22 +297,15 @@ def post_detail(post_id: int):
         flash("Пост скрыт.", "warning")
         return redirect(url_for("main.index"))
 
-    # Просмотры отслеживаются через PostView, не накручиваем счетчик
+    # Открытие страницы копится в памяти и пишется в Post.views пачкой (см. view_counter.py);
+    # повторы в той же сессии не считаются
+    views_count = count_post_view(post)
 
     form = CommentForm()
     comments = Comment.query.filter_by(post_id=post.id).order_by(Comment.created_at.asc()).all()
 
-    # Reactions summary
-    reactions_counts = {code: 0 for code in REACTIONS.keys()}
-    rows = (
-        db.session.query(PostLike.reaction, func.count(PostLike.id))
-        .filter_by(post_id=post.id)
-        .group_by(PostLike.reaction)
-        .all()
-    )
-    for reaction, count in rows:
-        if reaction in reactions_counts:
-            reactions_counts[reaction] = count
+    # Reactions summary (счётчики на посте, см. counters.py)
+    reactions_counts = {code: getattr(post, REACTION_COUNTERS[code], 0) for code in REACTIONS.keys()}
 
     user_reaction = None
     user_view = None
@@ -502,6 +337,9 @@ def post_detail(post_id: int):
         # Получаем информацию о просмотре
         user_view = PostView.query.filter_by(post_id=post.id, user_id=current_user.id).first()
 
+    # Похожие по совместным лайкам (top-K из post_neighbor)
+    neighbor_posts = get_post_neighbors(post.id, limit=5)
+
     return render_template(
         "post_detail.html",
         post=post,
@@ -512,6 +350,8 @@ def post_detail(post_id: int):
         user_reaction=user_reaction,
         user_view=user_view,
         similar_tags=similar_tags,
+        neighbor_posts=neighbor_posts,
+        views_count=views_count,
     )
 
 
@@ -528,6 +368,8 @@ def post_react(post_id: int, reaction_code: str):
     # Если пользователь уже поставил эту реакцию - убираем её
     if like and like.reaction == reaction_code:
         db.session.delete(like)
+        adjust_reaction_counters(post.id, reaction_code, None)
+        drop_hot_score(post, reaction_weight(reaction_code), like.created_at)
         # Удаляем предпочтения по тегам при отмене лайка
         if reaction_code == "like":
             for tag in post.tags:
@@ -541,7 +383,7 @@ def post_react(post_id: int, reaction_code: str):
         old_reaction = like.reaction if like else None
         
         if not like:
-            like = PostLike(post_id=post.id, user_id=current_user.id)
+            like = PostLike(post_id=post.id, user_id=current_user.id, created_at=datetime.now(timezone.utc))
             db.session.add(like)
         
         # Удаляем старые предпочтения при смене с лайка на дизлайк
@@ -554,6 +396,11 @@ def post_react(post_id: int, reaction_code: str):
                         db.session.delete(pref)
         
         like.reaction = reaction_code
+        adjust_reaction_counters(post.id, old_reaction, reaction_code)
+        # Реакция — одно событие в момент created_at: при смене меняется только её вес
+        if old_reaction:
+            drop_hot_score(post, reaction_weight(old_reaction), like.created_at)
+        bump_hot_score(post, reaction_weight(reaction_code), like.created_at)
         
         # Обновляем предпочтения по тегам при лайке
         if reaction_code == "like":
@@ -566,6 +413,7 @@ def post_react(post_id: int, reaction_code: str):
                     pref = UserTagPreference(user_id=current_user.id, tag_id=tag.id, score=1.0)
                     db.session.add(pref)
 
+    mark_recommendations_stale(current_user.id, post.id)
     db.session.commit()
     return redirect(url_for("main.post_detail", post_id=post.id))
 
@@ -581,19 +429,25 @@ def add_comment(post_id: int):
     form = CommentForm()
     if form.validate_on_submit():
         text = form.body.data or ""
-        if is_auto_mod_enabled() and contains_bad_words(text):
+        bad_terms = bad_word_matches(text) if is_auto_mod_enabled() else []
+        if bad_terms:
             log_moderation(
                 "comment_blocked",
                 user_id=current_user.id,
                 post_id=post.id,
                 reason="bad_words",
                 text=text,
+                terms=bad_terms,
             )
             db.session.commit()
             flash("В комментарии обнаружены запрещённые слова. Исправьте текст и попробуйте снова.", "warning")
         else:
             c = Comment(body=text, author_id=current_user.id, post_id=post.id)
             db.session.add(c)
+            adjust_post_counters(post.id, comments_count=1)
+            adjust_user_counters(current_user.id, comments_count=1)
+            bump_hot_score(post, HOT_COMMENT_WEIGHT)
+            mark_recommendations_stale(current_user.id, post.id)
             db.session.commit()
             flash("Комментарий добавлен.", "success")
     else:
@@ -616,7 +470,8 @@ def post_new():
         )
         
         # Проверяем на запрещенные слова (удаление поста)
-        has_bad_words = is_auto_mod_enabled() and contains_bad_words(text_blob)
+        bad_terms = bad_word_matches(text_blob) if is_auto_mod_enabled() else []
+        has_bad_words = bool(bad_terms)
         
         # Проверка на дубликаты с улучшенным сообщением
         duplicate = check_duplicate(0, form.title.data, form.body.data, threshold=0.75)
@@ -644,6 +499,7 @@ def post_new():
                 post_id=None,
                 reason="bad_words",
                 text=text_blob[:200] if text_blob else "",
+                terms=bad_terms,
             )
             db.session.commit()
             flash(
@@ -689,20 +545,23 @@ def post_new():
                         post_id=None,
                         reason="bad_extension_or_name",
                         text=filename,
+                        terms=bad_word_matches(filename),
                     )
                     flash("Файл отклонён: недопустимое расширение или запрещённые слова в названии.", "warning")
                 else:
                     ext = filename.rsplit(".", 1)[-1].lower()
-                    upload_dir = os.path.join(current_app.root_path, "static", "uploads")
-                    os.makedirs(upload_dir, exist_ok=True)
-                    save_name = f"{post.author_id}_{uuid.uuid4().hex}.{ext}"
-                    filepath = os.path.join(upload_dir, save_name)
-                    file.save(filepath)
-                    post.media_path = f"uploads/{save_name}"
+                    post.media_path = store_upload(file, ext)
                     post.media_type = "video" if ext in ALLOWED_VIDEO_EXT else "image"
+                    if post.media_type == "image":
+                        schedule_derivatives(post.media_path, "post")
+        elif form.upload_token.data:
+            attach_uploaded_media(post, form.upload_token.data)
 
         db.session.add(post)
-        db.session.flush()  # Получаем post.id для логирования
+        adjust_user_counters(current_user.id, posts_count=1)
+        db.session.flush()  # Получаем post.id для индекса и логирования
+        index_post(post, replace=False)
+        fan_out_post(post)
         
         if requires_tag_moderation:
             # Логируем модерацию тегов
@@ -734,6 +593,8 @@ def post_new():
                 )
                 db.session.add(track)
 
+        if sidebar_state(post):
+            invalidate_sidebar()
         db.session.commit()
 
         if requires_tag_moderation:
@@ -763,6 +624,8 @@ def post_edit(post_id: int):
         form.tags.data = ", ".join([t.name for t in post.tags])
 
     if form.validate_on_submit():
+        # Боковую панель сбрасываем, только если меняются теги опубликованного поста или публикация
+        old_sidebar_state = sidebar_state(post)
         text_blob = " ".join(
             [
                 form.title.data or "",
@@ -772,7 +635,8 @@ def post_edit(post_id: int):
         )
         
         # Проверяем на запрещенные слова (удаление поста)
-        has_bad_words = is_auto_mod_enabled() and contains_bad_words(text_blob)
+        bad_terms = bad_word_matches(text_blob) if is_auto_mod_enabled() else []
+        has_bad_words = bool(bad_terms)
         
         # Проверка на дубликаты при редактировании
         duplicate = check_duplicate(post.id, form.title.data, form.body.data, threshold=0.75)
@@ -794,19 +658,14 @@ def post_edit(post_id: int):
         # Если есть запрещенные слова - удаляем пост и показываем предупреждение
         if has_bad_words:
             post_id = post.id
+            affected_users = users_affected_by_post_delete([post_id])
             # Удаляем связанные данные
             Track.query.filter_by(post_id=post_id).delete()
             Comment.query.filter_by(post_id=post_id).delete()
             PostLike.query.filter_by(post_id=post_id).delete()
             PostView.query.filter_by(post_id=post_id).delete()
-            # Удаляем медиафайл если есть
-            if post.media_path:
-                try:
-                    media_path = os.path.join(current_app.root_path, "static", post.media_path)
-                    if os.path.exists(media_path):
-                        os.remove(media_path)
-                except Exception:
-                    pass
+            delete_post_rows([post_id])
+            release_media(post.media_path)
             # Логируем удаление
             log_moderation(
                 "post_deleted",
@@ -814,8 +673,12 @@ def post_edit(post_id: int):
                 post_id=post_id,
                 reason="bad_words_edit",
                 text=text_blob[:200] if text_blob else "",
+                terms=bad_terms,
             )
             db.session.delete(post)
+            recount_users(affected_users)
+            if old_sidebar_state:
+                invalidate_sidebar()
             db.session.commit()
             flash(
                 "🚫 Пост удалён. В тексте обнаружены запрещённые слова. "
@@ -828,6 +691,7 @@ def post_edit(post_id: int):
         post.summary = form.summary.data or None
         post.cover_emoji = (form.cover_emoji.data or "").strip() or None
         post.body = form.body.data
+        index_post(post)
         
         # Обработка тегов
         requires_tag_moderation = False
@@ -857,28 +721,23 @@ def post_edit(post_id: int):
                         post_id=post.id,
                         reason="bad_extension_or_name",
                         text=filename,
+                        terms=bad_word_matches(filename),
                     )
                     flash("Файл отклонён: недопустимое расширение или запрещённые слова в названии.", "warning")
                 else:
-                    # Удаляем старый файл если есть
-                    if post.media_path:
-                        try:
-                            old_media_path = os.path.join(current_app.root_path, "static", post.media_path)
-                            if os.path.exists(old_media_path):
-                                os.remove(old_media_path)
-                        except Exception:
-                            pass
+                    # Старый файл теряет ссылку (удалит gc_media, если он больше нигде не нужен)
+                    release_media(post.media_path)
                     ext = filename.rsplit(".", 1)[-1].lower()
-                    upload_dir = os.path.join(current_app.root_path, "static", "uploads")
-                    os.makedirs(upload_dir, exist_ok=True)
-                    save_name = f"{post.author_id}_{uuid.uuid4().hex}.{ext}"
-                    filepath = os.path.join(upload_dir, save_name)
-                    file.save(filepath)
-                    post.media_path = f"uploads/{save_name}"
+                    post.media_path = store_upload(file, ext)
                     post.media_type = "video" if ext in ALLOWED_VIDEO_EXT else "image"
+                    if post.media_type == "image":
+                        schedule_derivatives(post.media_path, "post")
+        elif form.upload_token.data:
+            attach_uploaded_media(post, form.upload_token.data)
 
         post.touch()
         db.session.flush()  # Получаем актуальный post.id
+        fan_out_post(post)
         
         if requires_tag_moderation:
             log_moderation(
@@ -913,6 +772,8 @@ def post_edit(post_id: int):
                 db.session.add(track)
 
         post.touch()
+        if sidebar_state(post) != old_sidebar_state:
+            invalidate_sidebar()
         db.session.commit()
 
         if requires_tag_moderation:
@@ -935,7 +796,13 @@ def post_delete(post_id: int):
     if not current_user.is_admin and post.author_id != current_user.id:
         flash("Нельзя удалять чужой пост.", "warning")
         return redirect(url_for("main.post_detail", post_id=post.id))
+    affected_users = users_affected_by_post_delete([post.id])
+    if sidebar_state(post):
+        invalidate_sidebar()
+    release_media(post.media_path)
+    delete_post_rows([post.id])
     db.session.delete(post)
+    recount_users(affected_users)
     db.session.commit()
     flash("Пост удалён.", "success")
     return redirect(url_for("main.index"))
@@ -944,21 +811,26 @@ def post_delete(post_id: int):
 @bp.get("/u/<string:username>")
 def profile(username: str):
     user = User.query.filter_by(username=username).first_or_404()
-    posts_query = Post.query.filter_by(author_id=user.id).order_by(Post.created_at.desc())
+    posts_query = Post.query.filter_by(author_id=user.id)
     if not (current_user.is_authenticated and (current_user.is_admin or current_user.id == user.id)):
         posts_query = posts_query.filter_by(is_published=True)
-    posts = posts_query.limit(50).all()
+    page = paginate(posts_query, NEWEST_FIRST, cursor=request.args.get("cursor"))
+    if wants_fragment():
+        return fragment_response("_profile_posts.html", page)
+    posts = page.items
 
     comments = (
         Comment.query.filter_by(author_id=user.id)
+        .options(joinedload(Comment.post))
         .order_by(Comment.created_at.desc())
         .limit(30)
         .all()
     )
-    posts_count = Post.query.filter_by(author_id=user.id).count()
-    comments_count = Comment.query.filter_by(author_id=user.id).count()
-    followers_count = Follow.query.filter_by(followed_id=user.id).count()
-    following_count = Follow.query.filter_by(follower_id=user.id).count()
+    # Счётчики денормализованы (см. counters.py)
+    posts_count = user.posts_count
+    comments_count = user.comments_count
+    followers_count = user.followers_count
+    following_count = user.following_count
 
     is_following = False
     if current_user.is_authenticated and current_user.id != user.id:
@@ -968,6 +840,7 @@ def profile(username: str):
         "profile.html",
         user=user,
         posts=posts,
+        next_url=next_page_url(page),
         comments=comments,
         posts_count=posts_count,
         comments_count=comments_count,
@@ -1039,22 +912,30 @@ def admin():
     post_search = request.args.get("post_search", "").strip()
     
     # Админ видит все посты и всех пользователей
-    posts_query = Post.query
+    posts_query = Post.query.options(selectinload(Post.author))
     if post_search:
-        search_like = f"%{post_search}%"
-        posts_query = posts_query.filter(
-            (Post.title.ilike(search_like)) | 
-            (Post.body.ilike(search_like)) |
-            (Post.summary.ilike(search_like))
-        )
-    posts = posts_query.order_by(Post.created_at.desc()).limit(100).all()
+        posts_query = filter_posts(posts_query, post_search, ranked=False)
+    page = paginate(posts_query, NEWEST_FIRST, cursor=request.args.get("cursor"), per_page=100, selective=bool(post_search))
+    if wants_fragment():
+        return fragment_response("_admin_posts.html", page)
+    posts = page.items
     
     users = User.query.order_by(User.created_at.desc()).all()
     # Создаем словарь пользователей для быстрого доступа в шаблоне
     users_dict = {u.id: u for u in users}
     categories = Category.query.order_by(Category.title.asc()).all()
-    comments = Comment.query.order_by(Comment.created_at.desc()).limit(50).all()
+    comments = (
+        Comment.query.options(joinedload(Comment.author), joinedload(Comment.post))
+        .order_by(Comment.created_at.desc())
+        .limit(50)
+        .all()
+    )
     category_form = CategoryForm()
+    tag_categories = (
+        TagCategory.query.options(joinedload(TagCategory.category)).order_by(TagCategory.tag_slug.asc()).all()
+    )
+    tag_category_form = TagCategoryForm()
+    tag_category_form.category_id.choices = [(c.id, c.title) for c in categories]
     auto_settings = ModerationSettings.query.first()
     auto_enabled = not auto_settings or bool(auto_settings.auto_enabled)
     moderation_logs = (
@@ -1073,12 +954,15 @@ def admin():
         categories=categories,
         comments=comments,
         category_form=category_form,
-        bad_words_sorted=sorted(BAD_WORDS),
+        tag_categories=tag_categories,
+        tag_category_form=tag_category_form,
+        bad_words_sorted=sorted(get_bad_words()),
         auto_enabled=auto_enabled,
         moderation_logs=moderation_logs,
         all_tags=all_tags,
         moderated_tag_ids=moderated_tag_ids,
         post_search=post_search,
+        next_url=next_page_url(page),
     )
 
 
@@ -1089,6 +973,10 @@ def admin_toggle_post(post_id: int):
     post = Post.query.get_or_404(post_id)
     post.is_published = not post.is_published
     post.touch()
+    db.session.flush()
+    fan_out_post(post)
+    if post.tags:
+        invalidate_sidebar()
     db.session.commit()
     flash("Статус поста обновлён.", "success")
     return redirect(url_for("main.admin"))
@@ -1099,7 +987,13 @@ def admin_toggle_post(post_id: int):
 @admin_required
 def admin_delete_post(post_id: int):
     post = Post.query.get_or_404(post_id)
+    affected_users = users_affected_by_post_delete([post.id])
+    if sidebar_state(post):
+        invalidate_sidebar()
+    release_media(post.media_path)
+    delete_post_rows([post.id])
     db.session.delete(post)
+    recount_users(affected_users)
     db.session.commit()
     flash("Пост удалён.", "success")
     return redirect(url_for("main.admin"))
@@ -1127,7 +1021,16 @@ def admin_delete_user(user_id: int):
     if current_user.id == u.id:
         flash("Нельзя удалить самого себя.", "warning")
         return redirect(url_for("main.admin"))
+    affected_posts, affected_users = affected_by_user_delete(u.id)
+    own_posts = db.session.query(Post.id, Post.media_path).filter(Post.author_id == u.id).all()
+    for _, media_path in own_posts:
+        release_media(media_path)
+    release_media(u.avatar_path)
+    delete_post_rows(pid for pid, _ in own_posts)
     db.session.delete(u)
+    recount_posts(affected_posts)
+    recount_users(affected_users)
+    invalidate_sidebar()
     db.session.commit()
     flash("Пользователь и его контент удалены.", "success")
     return redirect(url_for("main.admin"))
@@ -1138,6 +1041,8 @@ def admin_delete_user(user_id: int):
 def admin_delete_comment(comment_id: int):
     c = Comment.query.get_or_404(comment_id)
     db.session.delete(c)
+    adjust_post_counters(c.post_id, comments_count=-1)
+    adjust_user_counters(c.author_id, comments_count=-1)
     db.session.commit()
     flash("Комментарий удалён.", "success")
     return redirect(url_for("main.admin"))
@@ -1162,6 +1067,8 @@ def admin_create_category():
         return redirect(url_for("main.admin"))
 
     db.session.add(Category(slug=slug, title=title))
+    invalidate_sidebar()
+    invalidate_tags()
     db.session.commit()
     flash("Категория создана.", "success")
     return redirect(url_for("main.admin"))
@@ -1176,12 +1083,60 @@ def admin_delete_category(category_id: int):
     for p in Post.query.join(Post.categories).filter(Category.id == c.id).all():
         p.categories = [cat for cat in p.categories if cat.id != c.id]
         p.touch()
+    TagCategory.query.filter_by(category_id=c.id).delete(synchronize_session=False)
     db.session.delete(c)
+    invalidate_sidebar()
+    invalidate_tags()
     db.session.commit()
     flash("Категория удалена.", "success")
     return redirect(url_for("main.admin"))
 
 
+@bp.post("/admin/tag-category/create")
+@login_required
+@admin_required
+def admin_create_tag_category():
+    form = TagCategoryForm()
+    form.category_id.choices = [(c.id, c.title) for c in Category.query.order_by(Category.title.asc())]
+    if not form.validate_on_submit():
+        flash("Проверьте тег и категорию.", "danger")
+        return redirect(url_for("main.admin"))
+
+    tag_slug = slugify_tag(form.tag.data or "")
+    if not tag_slug:
+        flash("Пустой тег.", "danger")
+        return redirect(url_for("main.admin"))
+
+    mapping = TagCategory.query.filter_by(tag_slug=tag_slug).first()
+    if mapping:
+        mapping.category_id = form.category_id.data
+    else:
+        db.session.add(TagCategory(tag_slug=tag_slug, category_id=form.category_id.data))
+    db.session.flush()
+    # Уже опубликованные посты с этим тегом тоже попадают в категорию
+    added, _ = recategorize_posts(tag_slugs=[tag_slug])
+    invalidate_tags()
+    db.session.commit()
+    flash(f"Тег #{tag_slug} привязан к категории. Добавлено постов: {added}.", "success")
+    return redirect(url_for("main.admin"))
+
+
+@bp.post("/admin/tag-category/<int:mapping_id>/delete")
+@login_required
+@admin_required
+def admin_delete_tag_category(mapping_id: int):
+    mapping = TagCategory.query.get_or_404(mapping_id)
+    db.session.delete(mapping)
+    invalidate_tags()
+    db.session.commit()
+    flash(
+        f"Привязка тега #{mapping.tag_slug} удалена. Новые посты в категорию не попадут; "
+        "убрать её у старых: python -m portal.recategorize_posts --prune",
+        "success",
+    )
+    return redirect(url_for("main.admin"))
+
+
 @bp.post("/admin/bad-words")
 @login_required
 @admin_required
@@ -1197,9 +1152,13 @@ def admin_update_bad_words():
         flash("Список не может быть полностью пустым.", "warning")
         return redirect(url_for("main.admin"))
 
-    global BAD_WORDS
-    BAD_WORDS = new_set
-    flash("Список запрещённых слов обновлён (до перезапуска приложения).", "success")
+    BadWord.query.delete()
+    db.session.add_all([BadWord(word=word) for word in sorted(new_set)])
+    # Остальные процессы увидят новую версию при следующей проверке
+    bump_config_version(BAD_WORDS_CONFIG_KEY)
+    db.session.commit()
+    refresh_bad_words(force=True)
+    flash("Список запрещённых слов обновлён.", "success")
     return redirect(url_for("main.admin"))
 
 
@@ -1246,7 +1205,11 @@ def admin_toggle_tag_moderation(tag_id: int):
             flash(f"Тег #{tag.name} теперь требует модерации. {hidden_count} существующих постов скрыто и требует проверки.", "warning")
         else:
             flash(f"Тег #{tag.name} теперь требует модерации. Новые посты с этим тегом будут автоматически скрыты.", "success")
+        # Скрытые посты больше не учитываются в облаке тегов
+        if hidden_count > 0:
+            invalidate_sidebar()
     
+    invalidate_tags()
     db.session.commit()
     return redirect(url_for("main.admin"))
 
@@ -1266,6 +1229,10 @@ def follow_user(user_id: int):
     else:
         follow = Follow(follower_id=current_user.id, followed_id=user_id)
         db.session.add(follow)
+        adjust_user_counters(current_user.id, following_count=1)
+        adjust_user_counters(user_id, followers_count=1)
+        db.session.flush()
+        backfill_author(current_user, user_to_follow)
         db.session.commit()
         flash(f"Вы подписались на {user_to_follow.username}.", "success")
     return redirect(url_for("main.profile", username=user_to_follow.username))
@@ -1278,6 +1245,9 @@ def unfollow_user(user_id: int):
     follow = Follow.query.filter_by(follower_id=current_user.id, followed_id=user_id).first()
     if follow:
         db.session.delete(follow)
+        adjust_user_counters(current_user.id, following_count=-1)
+        adjust_user_counters(user_id, followers_count=-1)
+        remove_author(current_user, user_to_unfollow)
         db.session.commit()
         flash(f"Вы отписались от {user_to_unfollow.username}.", "info")
     return redirect(url_for("main.profile", username=user_to_unfollow.username))
@@ -1286,25 +1256,25 @@ def unfollow_user(user_id: int):
 @bp.get("/following")
 @login_required
 def following_feed():
-    """Лента постов от подписок и список подписок."""
-    following_list = current_user.following.all()
-    following_ids = [f.followed_id for f in following_list]
-    
-    # Получаем пользователей, на которых подписан
-    following_users = User.query.filter(User.id.in_(following_ids)).all() if following_ids else []
-    
-    # Получаем посты от подписок
-    posts = []
-    if following_ids:
-        posts = (
-            Post.query.filter(Post.author_id.in_(following_ids))
-            .filter_by(is_published=True)
-            .order_by(Post.created_at.desc())
-            .limit(50)
-            .all()
-        )
-    
-    return render_template("following.html", posts=posts, following_users=following_users, is_following_feed=True)
+    """Лента постов от подписок (см. timeline.py) и список подписок."""
+    page = following_page(current_user, request.args.get("cursor"))
+    if wants_fragment():
+        return fragment_response("_following_posts.html", page)
+
+    # Пользователи, на которых подписан
+    following_users = (
+        User.query.join(Follow, Follow.followed_id == User.id)
+        .filter(Follow.follower_id == current_user.id)
+        .all()
+    )
+
+    return render_template(
+        "following.html",
+        posts=page.items,
+        next_url=next_page_url(page),
+        following_users=following_users,
+        is_following_feed=True,
+    )
 
 
 # Редактирование профиля
@@ -1326,12 +1296,9 @@ def profile_edit():
             filename = secure_filename(file.filename or "")
             if filename and filename.rsplit(".", 1)[-1].lower() in ALLOWED_IMAGE_EXT:
                 ext = filename.rsplit(".", 1)[-1].lower()
-                upload_dir = os.path.join(current_app.root_path, "static", "uploads")
-                os.makedirs(upload_dir, exist_ok=True)
-                save_name = f"avatar_{current_user.id}_{uuid.uuid4().hex}.{ext}"
-                filepath = os.path.join(upload_dir, save_name)
-                file.save(filepath)
-                current_user.avatar_path = f"uploads/{save_name}"
+                release_media(current_user.avatar_path)
+                current_user.avatar_path = store_upload(file, ext)
+                schedule_derivatives(current_user.avatar_path, "avatar")
         
         db.session.commit()
         flash("Профиль обновлён.", "success")
@@ -1431,9 +1398,10 @@ def tag_recommendations():
 @bp.post("/api/post/<int:post_id>/view")
 @login_required
 def track_post_view(post_id: int):
-    """Отслеживание прогресса просмотра поста."""
-    post = Post.query.get_or_404(post_id)
-    
+    """Отслеживание прогресса просмотра поста (запись в БД — через буфер, см. view_buffer.py)."""
+    # Только id по первичному ключу: сам пост не загружается, но на удалённый или
+    # несуществующий пост по-прежнему 404, а не «успех» с отброшенной записью
+    Post.query.with_entities(Post.id).filter_by(id=post_id).first_or_404()
     # Обрабатываем как JSON, так и sendBeacon (Blob)
     if request.is_json:
         data = request.json
@@ -1447,22 +1415,96 @@ def track_post_view(post_id: int):
     is_complete = bool(data.get("is_complete", False))
     view_duration = float(data.get("view_duration", 0.0))  # Время просмотра в секундах
     
-    view = PostView.query.filter_by(post_id=post_id, user_id=current_user.id).first()
-    
-    if not view:
-        view = PostView(
-            post_id=post_id, 
-            user_id=current_user.id, 
-            progress=progress, 
-            is_complete=is_complete,
-            view_duration=view_duration
+    progress, is_complete = get_view_buffer().record(
+        current_user.id, post_id, progress, is_complete, view_duration
+    )
+    return jsonify({"success": True, "progress": progress, "is_complete": is_complete})
+
+
+def _upload_error(error: UploadError):
+    return jsonify({"error": str(error), "offset": error.offset}), error.status
+
+
+@bp.post("/api/uploads")
+@login_required
+def upload_start():
+    """Открывает загрузку файла частями (см. uploads.py)."""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        data = {}
+    filename = secure_filename(str(data.get("filename") or ""))
+    if not is_allowed_media(filename):
+        return jsonify({"error": "Недопустимое расширение файла."}), 400
+    if is_auto_mod_enabled() and contains_bad_words(filename):
+        log_moderation(
+            "file_blocked",
+            user_id=current_user.id,
+            post_id=None,
+            reason="bad_extension_or_name",
+            text=filename,
+            terms=bad_word_matches(filename),
         )
-        db.session.add(view)
-    else:
-        view.progress = max(view.progress, progress)  # Сохраняем максимальный прогресс
-        view.is_complete = is_complete or view.is_complete
-        view.view_duration = max(view.view_duration, view_duration)  # Сохраняем максимальное время
-        view.viewed_at = datetime.now(timezone.utc)
-    
+        db.session.commit()
+        return jsonify({"error": "Файл отклонён: запрещённые слова в названии."}), 400
+    try:
+        upload = start_upload(current_user, filename, data.get("size"), data.get("checksum"))
+    except UploadError as e:
+        return _upload_error(e)
+    db.session.commit()
+    return jsonify(upload_state(upload)), 201
+
+
+@bp.get("/api/uploads/<string:token>")
+@login_required
+def upload_status(token: str):
+    try:
+        upload = get_upload(current_user, token)
+    except UploadError as e:
+        return _upload_error(e)
+    return jsonify(upload_state(upload))
+
+
+@bp.put("/api/uploads/<string:token>")
+@login_required
+def upload_chunk(token: str):
+    try:
+        upload = get_upload(current_user, token)
+        write_chunk(
+            upload,
+            request.args.get("offset", -1, type=int),
+            request.stream,
+            request.content_length or 0,
+            request.headers.get("X-Chunk-SHA256"),
+        )
+    except UploadError as e:
+        return _upload_error(e)
+    db.session.commit()
+    return jsonify(upload_state(upload))
+
+
+@bp.post("/api/uploads/<string:token>/complete")
+@login_required
+def upload_complete(token: str):
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        data = {}
+    try:
+        upload = get_upload(current_user, token)
+        complete_upload(upload, data.get("checksum"))
+    except UploadError as e:
+        # Сброс загрузки при несовпадении суммы тоже сохраняем
+        db.session.commit()
+        return _upload_error(e)
+    db.session.commit()
+    return jsonify(upload_state(upload))
+
+
+@bp.delete("/api/uploads/<string:token>")
+@login_required
+def upload_cancel(token: str):
+    try:
+        cancel_upload(get_upload(current_user, token))
+    except UploadError as e:
+        return _upload_error(e)
     db.session.commit()
-    return jsonify({"success": True, "progress": view.progress, "is_complete": view.is_complete})
+    return jsonify({"success": True})
@@ -0,0 +1,292 @@
+"""
+Полнотекстовый поиск по постам.
+
+SQLite: виртуальная таблица FTS5 post_fts с внешним содержимым, токенизатор
+unicode61 (регистр и диакритика латиницы не важны), ранжирование bm25 с весами
+заголовок > описание > текст. Буквы ё и й unicode61 не сворачивает, поэтому
+индексируется текст с ё → е, й → и (представление post_fts_source над post),
+и так же приводится запрос: «елка» находит «Ёлка». Индекс поддерживают триггеры
+на post — только при изменении title/summary/body, поэтому частые обновления
+счётчиков его не трогают. Встроенного русского стеммера в FTS5 нет, поэтому
+слова запроса от PREFIX_MIN_LENGTH букв ищутся как префиксы («фильм» находит
+«фильмы», «фильмов»).
+
+PostgreSQL (DATABASE_URL=postgresql://...): tsvector с конфигурацией russian,
+GIN-индекс по выражению, ранжирование ts_rank_cd.
+
+Индекс создаёт миграция; запрос только проверяет, что он есть (удачная
+проверка запоминается в процессе). Если индекса нет (SQLite собран без FTS5)
+или проверка не удалась, поиск откатывается на ilike.
+Перестроение индекса: python -m portal.rebuild_search_index
+"""
+import re
+import unicodedata
+
+from flask import current_app
+from markupsafe import Markup, escape
+from sqlalchemy import column, func, literal_column, or_, table, text
+
+from .extensions import db
+from .models import Post
+
+FTS_TABLE = "post_fts"
+FTS_SOURCE_VIEW = "post_fts_source"
+PG_INDEX = "ix_post_fts"
+# Веса bm25 для столбцов title, summary, body
+BM25_WEIGHTS = (10.0, 4.0, 1.0)
+# Слова короче ищутся целиком, длиннее — как префиксы («фильм» → «фильмы»)
+PREFIX_MIN_LENGTH = 4
+# Длина фрагмента с подсветкой в результатах (слов)
+SNIPPET_TOKENS = 24
+
+PG_CONFIG = "russian"
+_pg_document = (
+    f"to_tsvector('{PG_CONFIG}', coalesce(post.title, '') || ' ' || "
+    "coalesce(post.summary, '') || ' ' || coalesce(post.body, ''))"
+)
+
+_fts_table = table(FTS_TABLE, column("rowid"))
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+# Буквы, которые unicode61 не сворачивает сам: так же приводятся индексируемый текст и запрос
+_FOLDED_LETTERS = {"ё": "е", "Ё": "Е", "й": "и", "Й": "И"}
+_FOLD_TABLE = str.maketrans(_FOLDED_LETTERS)
+_TRIGGERS = ("post_fts_ai", "post_fts_ad", "post_fts_au")
+# Диалекты, где индекс уже найден: удачная проверка не повторяется
+_available = set()
+
+
+def _dialect() -> str:
+    return db.engine.dialect.name
+
+
+def _sql_fold(expression: str) -> str:
+    """SQL-выражение с заменой ё → е, й → и (см. _FOLDED_LETTERS)."""
+    for letter, replacement in _FOLDED_LETTERS.items():
+        expression = f"replace({expression}, '{letter}', '{replacement}')"
+    return expression
+
+
+def _fts_values(row: str) -> str:
+    return ", ".join(_sql_fold(f"{row}.{name}") for name in ("title", "summary", "body"))
+
+
+def _create_sqlite_index() -> None:
+    # Внешнее содержимое — представление: 'rebuild' читает из него уже приведённый текст
+    db.session.execute(text(f"""
+        CREATE VIEW IF NOT EXISTS {FTS_SOURCE_VIEW} AS
+        SELECT id, {_sql_fold("title")} AS title, {_sql_fold("summary")} AS summary, {_sql_fold("body")} AS body
+        FROM post;
+    """))
+    db.session.execute(text(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+            title, summary, body,
+            content='{FTS_SOURCE_VIEW}', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3'
+        );
+    """))
+    db.session.execute(text(f"""
+        CREATE TRIGGER IF NOT EXISTS post_fts_ai AFTER INSERT ON post BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, title, summary, body)
+            VALUES (new.id, {_fts_values("new")});
+        END;
+    """))
+    db.session.execute(text(f"""
+        CREATE TRIGGER IF NOT EXISTS post_fts_ad AFTER DELETE ON post BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, summary, body)
+            VALUES ('delete', old.id, {_fts_values("old")});
+        END;
+    """))
+    db.session.execute(text(f"""
+        CREATE TRIGGER IF NOT EXISTS post_fts_au AFTER UPDATE OF title, summary, body ON post BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, summary, body)
+            VALUES ('delete', old.id, {_fts_values("old")});
+            INSERT INTO {FTS_TABLE}(rowid, title, summary, body)
+            VALUES (new.id, {_fts_values("new")});
+        END;
+    """))
+
+
+def drop_search_index() -> None:
+    """Удаляет индекс SQLite вместе с представлением и триггерами (перед пересозданием)."""
+    if _dialect() != "sqlite":
+        return
+    db.session.execute(text(f"DROP TABLE IF EXISTS {FTS_TABLE};"))
+    db.session.execute(text(f"DROP VIEW IF EXISTS {FTS_SOURCE_VIEW};"))
+    for trigger in _TRIGGERS:
+        db.session.execute(text(f"DROP TRIGGER IF EXISTS {trigger};"))
+
+
+def _create_postgres_index() -> None:
+    db.session.execute(text(f"CREATE INDEX IF NOT EXISTS {PG_INDEX} ON post USING GIN ({_pg_document});"))
+
+
+def _index_exists(connection) -> bool:
+    dialect = connection.dialect.name
+    if dialect == "sqlite":
+        query = text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name")
+        return connection.execute(query, {"name": FTS_TABLE}).first() is not None
+    if dialect == "postgresql":
+        return connection.execute(text("SELECT to_regclass(:name)"), {"name": PG_INDEX}).scalar() is not None
+    return False
+
+
+def ensure_search_index() -> bool:
+    """
+    Создаёт поисковый индекс, если его ещё нет (вызывается из миграций; commit —
+    за вызывающим). False — FTS недоступен, поиск будет работать через ilike.
+    """
+    dialect = _dialect()
+    if dialect not in ("sqlite", "postgresql"):
+        return False
+    try:
+        # SAVEPOINT: без FTS5 откатывается только создание индекса, а не вся миграция
+        with db.session.begin_nested():
+            if dialect == "sqlite":
+                exists = _index_exists(db.session.connection())
+                _create_sqlite_index()
+                if not exists:
+                    # Таблица только что появилась — индексируем существующие посты
+                    db.session.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild');"))
+            else:
+                _create_postgres_index()
+    except Exception:
+        return False
+    return True
+
+
+def rebuild_search_index() -> None:
+    """Перестраивает индекс с нуля."""
+    if _dialect() == "sqlite":
+        drop_search_index()
+        if ensure_search_index():
+            db.session.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize');"))
+        db.session.commit()
+    elif _dialect() == "postgresql":
+        _create_postgres_index()
+        db.session.execute(text(f"REINDEX INDEX {PG_INDEX};"))
+        db.session.commit()
+
+
+def _search_available() -> bool:
+    """
+    Есть ли поисковый индекс. Проверка только читает, в отдельном соединении,
+    чтобы не затронуть транзакцию запроса; отсутствие индекса и ошибки проверки
+    не запоминаются — следующий поиск проверит снова.
+    """
+    dialect = _dialect()
+    if dialect in _available:
+        return True
+    try:
+        with db.engine.connect() as connection:
+            exists = _index_exists(connection)
+    except Exception:
+        current_app.logger.warning("Не удалось проверить поисковый индекс, поиск через ilike", exc_info=True)
+        return False
+    if exists:
+        _available.add(dialect)
+    return exists
+
+
+def _fold_letters(value: str) -> str:
+    """Нижний регистр и ё → е, й → и — как в индексируемом тексте."""
+    return value.lower().translate(_FOLD_TABLE)
+
+
+def _fold(value: str) -> str:
+    """Нижний регистр без диакритики — как токенизатор unicode61 после замены ё и й."""
+    decomposed = unicodedata.normalize("NFD", _fold_letters(value))
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def _words(q: str) -> list:
+    return _WORD_RE.findall(q.lower())
+
+
+def _fts_query(words: list) -> str:
+    """
+    Запрос FTS5: все слова обязательны, слова от PREFIX_MIN_LENGTH букв ищутся
+    как префиксы. Короткий префикс совпадает почти со всем и делает поиск медленным.
+    """
+    words = [_fold_letters(word) for word in words]
+    return " ".join(f'"{word}"*' if len(word) >= PREFIX_MIN_LENGTH else f'"{word}"' for word in words)
+
+
+def _ilike_filter(q: str, columns):
+    like = f"%{q.strip()}%"
+    return or_(*[column.ilike(like) for column in columns])
+
+
+def filter_posts(query, q: str, ranked: bool = True):
+    """
+    Оставляет в запросе постов только найденные по q.
+    ranked=True — сортировать по релевантности (вместо прежнего order_by).
+    """
+    words = _words(q)
+    if not words or not _search_available():
+        return query.filter(_ilike_filter(q, (Post.title, Post.summary, Post.body)))
+
+    if _dialect() == "postgresql":
+        ts_query = func.websearch_to_tsquery(PG_CONFIG, " ".join(words))
+        document = literal_column(_pg_document)
+        query = query.filter(document.op("@@")(ts_query))
+        if ranked:
+            query = query.order_by(None).order_by(func.ts_rank_cd(document, ts_query).desc(), Post.created_at.desc())
+        return query
+
+    # JOIN, а не IN (subquery): так SQLite начинает с FTS-индекса, а не со всех постов
+    fts = literal_column(FTS_TABLE)
+    query = query.join(_fts_table, _fts_table.c.rowid == Post.id).filter(fts.op("MATCH")(_fts_query(words)))
+    if ranked:
+        query = query.order_by(None).order_by(func.bm25(fts, *BM25_WEIGHTS), Post.created_at.desc())
+    return query
+
+
+def _snippet(text_value: str, words: list):
+    tokens = list(_WORD_RE.finditer(text_value))
+    folded = [_fold(word) for word in words]
+
+    def matches(token) -> bool:
+        value = _fold(token.group())
+        return any(
+            value.startswith(word) if len(word) >= PREFIX_MIN_LENGTH else value == word
+            for word in folded
+        )
+
+    hits = [index for index, token in enumerate(tokens) if matches(token)]
+    if not hits:
+        return None
+    first = max(0, hits[0] - SNIPPET_TOKENS // 4)
+    last = min(len(tokens), first + SNIPPET_TOKENS)
+    start = tokens[first].start()
+    end = tokens[last - 1].end()
+
+    parts = ["…" if first > 0 else ""]
+    position = start
+    for index in hits:
+        if index < first or index >= last:
+            continue
+        token = tokens[index]
+        parts.append(escape(text_value[position:token.start()]))
+        parts.append(Markup("<mark>%s</mark>") % token.group())
+        position = token.end()
+    parts.append(escape(text_value[position:end]))
+    parts.append("…" if last < len(tokens) else "")
+    return Markup("").join(parts)
+
+
+def search_snippets(posts, q: str) -> dict:
+    """
+    {post_id: Markup} — фрагмент текста поста с подсвеченными словами запроса.
+    Строится по уже загруженным постам, без запроса к БД: snippet() в FTS5
+    заново вычисляет совпадения и на префиксных запросах заметно медленнее.
+    """
+    words = _words(q or "")
+    if not words:
+        return {}
+    snippets = {}
+    for post in posts:
+        snippet = _snippet(post.body or "", words) or _snippet(post.summary or "", words)
+        if snippet is not None:
+            snippets[post.id] = snippet
+    return snippets
@@ -1,10 +1,120 @@
+"""
+Начальные данные: категории, теги, привязка тегов к категориям, стартовые посты,
+достижения и вопросы квиза.
+
+Каждая таблица — одна выборка существующих ключей и один многострочный
+INSERT недостающих строк. Применённая версия набора хранится в config_version
+(ключ SEED_KEY): пока она не меньше SEED_VERSION, ensure_seed_data сразу
+выходит. Изменили набор — увеличьте SEED_VERSION и добавьте шаг в migrations.py.
+"""
 import os
 
-from .extensions import db
-from .models import Achievement, Category, Post, QuizQuestion, Tag, User
+from sqlalchemy import insert, or_, update
+
+from .config_versions import bump_config_version, get_config_version, set_config_version
+from .counters import recount_users
+from .duplicate_checker import index_posts
+from .extensions import db, upsert_insert
+from .models import Achievement, Category, Post, QuizQuestion, Tag, TagCategory, User
+from .tags import TAGS_CONFIG_KEY
+
+SEED_KEY = "seed_data"
+SEED_VERSION = 2
+
+# Тег → slug категории: начальное наполнение TagCategory (дальше правится в админке)
+DEFAULT_TAG_CATEGORIES = {
+    # Мемы и юмор
+    "мемы": "memes",
+    "мем": "memes",
+    "юмор": "humor",
+    "шутка": "humor",
+    "вирусное": "memes",
+    "тренд": "memes",
+
+    # Кино
+    "кино": "movies",
+    "фильм": "movies",
+    "сериал": "movies",
+    "сериалы": "movies",
+    "тв": "movies",
+    "трейлер": "movies",
+    "рецензия": "movies",
+    "комедия": "movies",
+    "драма": "movies",
+    "фантастика": "movies",
+    "хоррор": "movies",
+    "приключения": "movies",
+    "аниме": "movies",
+    "стриминг": "movies",
+
+    # Игры
+    "игры": "games",
+    "игра": "games",
+    "cs2": "games",
+    "dota": "games",
+    "valorant": "games",
+    "fps": "games",
+    "rpg": "games",
+    "mmo": "games",
+    "инди": "games",
+    "pc": "games",
+    "консоль": "games",
+    "мобильные": "games",
+
+    # Музыка
+    "музыка": "music",
+    "рок": "music",
+    "поп": "music",
+    "электроника": "music",
+    "хип-хоп": "music",
+    "джаз": "music",
+    "альбом": "music",
+    "сингл": "music",
+    "концерт": "music",
+    "фестиваль": "music",
+
+    # Технологии
+    "технологии": "tech",
+    "техно": "tech",
+    "программирование": "tech",
+    "разработка": "tech",
+    "дизайн": "tech",
+    "веб": "tech",
+}
 
 
-def ensure_seed_data() -> None:
+def promote_admins() -> None:
+    """
+    Admin by email (ADMIN_EMAIL, optional) and user "tw1xty", если уже существуют.
+    Выполняется на каждом старте — одним UPDATE.
+    """
+    conditions = [User.username == "tw1xty"]
+    admin_email = os.getenv("ADMIN_EMAIL")
+    if admin_email:
+        conditions.append(User.email == admin_email)
+    db.session.execute(
+        update(User)
+        .where(or_(*conditions), User.is_admin.is_(False))
+        .values(is_admin=True)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+
+def _insert_missing(model, key: str, rows: list) -> int:
+    """Добавляет строки, которых ещё нет по ключу key: одна выборка ключей и один INSERT."""
+    existing = {value for (value,) in db.session.query(getattr(model, key))}
+    missing = list({row[key]: row for row in rows if row[key] not in existing}.values())
+    if missing:
+        # DO NOTHING: строка могла совпасть по другому уникальному полю (например, title категории)
+        db.session.execute(upsert_insert(model).values(missing).on_conflict_do_nothing())
+    return len(missing)
+
+
+def ensure_seed_data(force: bool = False) -> None:
+    if not force and get_config_version(SEED_KEY) >= SEED_VERSION:
+        return
+
     # Categories
     base_categories = [
         ("memes", "Мемы"),
@@ -14,10 +124,7 @@ def ensure_seed_data() -> None:
         ("humor", "Юмор"),
         ("tech", "Техно‑фан"),
     ]
-    for slug, title in base_categories:
-        if not Category.query.filter_by(slug=slug).first():
-            db.session.add(Category(slug=slug, title=title))
-    db.session.commit()
+    _insert_missing(Category, "slug", [{"slug": slug, "title": title} for slug, title in base_categories])
 
     # Initial tags - расширенный список
     initial_tags = [
@@ -34,30 +141,37 @@ def ensure_seed_data() -> None:
         "альбом", "сингл", "концерт", "фестиваль",
         "шутка", "мем", "вирусное", "тренд",
     ]
-    for tag_name in initial_tags:
-        slug = tag_name.lower().strip().replace(" ", "-")
-        if not Tag.query.filter_by(slug=slug).first():
-            db.session.add(Tag(name=tag_name, slug=slug))
+    _insert_missing(
+        Tag,
+        "slug",
+        [{"name": name, "slug": name.lower().strip().replace(" ", "-")} for name in initial_tags],
+    )
+
+    _ensure_tag_categories()
+    _ensure_starter_posts()
+    _ensure_gamification()
+    set_config_version(SEED_KEY, SEED_VERSION)
     db.session.commit()
 
-    # Admin by email (optional)
-    admin_email = os.getenv("ADMIN_EMAIL")
-    if admin_email:
-        u = User.query.filter_by(email=admin_email).first()
-        if u and not u.is_admin:
-            u.is_admin = True
-            db.session.commit()
-
-    # Force user with nickname "tw1xty" to be admin, если уже существует
-    tw = User.query.filter_by(username="tw1xty").first()
-    if tw and not tw.is_admin:
-        tw.is_admin = True
-        db.session.commit()
 
+def _ensure_tag_categories() -> None:
+    category_ids = dict(db.session.query(Category.slug, Category.id))
+    added = _insert_missing(
+        TagCategory,
+        "tag_slug",
+        [
+            {"tag_slug": tag_slug, "category_id": category_ids[category_slug]}
+            for tag_slug, category_slug in DEFAULT_TAG_CATEGORIES.items()
+            if category_slug in category_ids
+        ],
+    )
+    if added:
+        bump_config_version(TAGS_CONFIG_KEY)
+
+
+def _ensure_starter_posts() -> None:
     # Starter content (only if no posts exist)
-    if Post.query.count() > 0:
-        # Still ensure achievements & quiz exist
-        _ensure_gamification()
+    if db.session.query(Post.id).first() is not None:
         return
 
     system_user = User.query.filter_by(email="system@portal.local").first()
@@ -109,6 +223,7 @@ def ensure_seed_data() -> None:
         },
     ]
 
+    posts = []
     for p in starter_posts:
         post = Post(
             title=p["title"],
@@ -120,11 +235,13 @@ def ensure_seed_data() -> None:
         )
         post.categories = [cats[s] for s in p["categories"] if s in cats]
         db.session.add(post)
+        posts.append(post)
+    db.session.flush()
+    index_posts(posts, replace=False)
 
+    recount_users([system_user.id])
     db.session.commit()
 
-    _ensure_gamification()
-
 
 def _ensure_gamification() -> None:
     achievements = [
@@ -134,12 +251,16 @@ def _ensure_gamification() -> None:
         ("quiz_rookie", "Квиз-новичок", "Прошёл квиз хотя бы раз", "🧠"),
         ("quiz_ace", "Квиз-ас", "Набрал максимум в квизе", "🏅"),
     ]
-    for code, title, desc, icon in achievements:
-        if not Achievement.query.filter_by(code=code).first():
-            db.session.add(Achievement(code=code, title=title, description=desc, icon=icon))
-    db.session.commit()
+    _insert_missing(
+        Achievement,
+        "code",
+        [
+            {"code": code, "title": title, "description": desc, "icon": icon}
+            for code, title, desc, icon in achievements
+        ],
+    )
 
-    if QuizQuestion.query.count() > 0:
+    if db.session.query(QuizQuestion.id).first() is not None:
         return
 
     questions = [
@@ -199,18 +320,19 @@ def _ensure_gamification() -> None:
         },
     ]
 
-    for q in questions:
-        db.session.add(
-            QuizQuestion(
-                topic=q["topic"],
-                prompt=q["prompt"],
-                choice_a=q["a"],
-                choice_b=q["b"],
-                choice_c=q["c"],
-                choice_d=q["d"],
-                correct=q["correct"],
-            )
+    db.session.execute(
+        insert(QuizQuestion).values(
+            [
+                {
+                    "topic": q["topic"],
+                    "prompt": q["prompt"],
+                    "choice_a": q["a"],
+                    "choice_b": q["b"],
+                    "choice_c": q["c"],
+                    "choice_d": q["d"],
+                    "correct": q["correct"],
+                }
+                for q in questions
+            ]
         )
-    db.session.commit()
-
-
+    )
@@ -0,0 +1,99 @@
+"""
+Кэш данных боковой панели (категории и облако популярных тегов).
+
+inject_globals вызывается при каждом рендере шаблона, поэтому данные хранятся
+в памяти процесса как простые кортежи, а не ORM-объекты. Запись, меняющая теги,
+категории или публикацию постов, вызывает invalidate_sidebar() (правка поста —
+только если изменилось sidebar_state(post)): локальный кэш
+сбрасывается сразу, а остальные процессы замечают новую версию в config_version
+(проверка не чаще раза в SIDEBAR_VERSION_CHECK_SECONDS). Независимо от версии
+данные перечитываются раз в SIDEBAR_CACHE_TTL секунд.
+"""
+import threading
+import time
+from collections import namedtuple
+
+from flask import current_app
+from sqlalchemy import func
+
+from .config_versions import bump_config_version, get_config_version
+from .extensions import db
+from .models import Category, Post, Tag
+
+SIDEBAR_CONFIG_KEY = "sidebar"
+POPULAR_TAGS_LIMIT = 20
+
+SidebarCategory = namedtuple("SidebarCategory", "id slug title")
+SidebarTag = namedtuple("SidebarTag", "id slug name count")
+
+_lock = threading.Lock()
+_cache = {
+    "version": None,
+    "loaded_at": 0.0,
+    "checked_at": 0.0,
+    "categories": [],
+    "popular_tags": [],
+}
+
+
+def _load() -> tuple:
+    categories = [
+        SidebarCategory(*row)
+        for row in db.session.query(Category.id, Category.slug, Category.title).order_by(Category.title.asc())
+    ]
+    popular_tags = [
+        SidebarTag(*row)
+        for row in (
+            db.session.query(Tag.id, Tag.slug, Tag.name, func.count(Post.id).label("count"))
+            .join(Post.tags)
+            .filter(Post.is_published.is_(True))
+            .group_by(Tag.id)
+            .order_by(func.count(Post.id).desc())
+            .limit(POPULAR_TAGS_LIMIT)
+        )
+    ]
+    return categories, popular_tags
+
+
+def get_sidebar_data() -> tuple:
+    """Возвращает (categories, popular_tags), обращаясь к БД только при устаревании кэша."""
+    now = time.monotonic()
+    config = current_app.config
+    with _lock:
+        fresh = _cache["version"] is not None and now - _cache["loaded_at"] < config.get("SIDEBAR_CACHE_TTL", 300)
+        if fresh and now - _cache["checked_at"] < config.get("SIDEBAR_VERSION_CHECK_SECONDS", 5):
+            return _cache["categories"], _cache["popular_tags"]
+
+    version = get_config_version(SIDEBAR_CONFIG_KEY)
+    with _lock:
+        _cache["checked_at"] = now
+        if fresh and version == _cache["version"]:
+            return _cache["categories"], _cache["popular_tags"]
+
+    categories, popular_tags = _load()
+    with _lock:
+        _cache.update(
+            version=version,
+            loaded_at=now,
+            categories=categories,
+            popular_tags=popular_tags,
+        )
+    return categories, popular_tags
+
+
+def sidebar_state(post: Post) -> frozenset:
+    """
+    Вклад поста в боковую панель: теги, если пост опубликован. Категории панели —
+    весь справочник, от постов он не зависит.
+    """
+    return frozenset(tag.slug for tag in post.tags) if post.is_published else frozenset()
+
+
+def invalidate_sidebar() -> None:
+    """
+    Помечает данные боковой панели устаревшими. Вызывать до commit():
+    версия увеличивается в той же транзакции, что и сама запись.
+    """
+    bump_config_version(SIDEBAR_CONFIG_KEY)
+    with _lock:
+        _cache["version"] = None
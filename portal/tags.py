@@ -0,0 +1,198 @@
+"""
+Разбор тегов поста и автоматические категории.
+
+Все имена из строки «тег1, тег2, ...» сначала превращаются в slug, затем
+существующие теги выбираются одним запросом slug IN (...), недостающие
+добавляются одним INSERT. Поэтому сохранение поста стоит постоянное число
+запросов, сколько бы тегов в нём ни было.
+
+Редко меняющиеся справочники — slug тегов на модерации и таблица
+«тег → категория» (TagCategory, правится в админке) — живут в памяти процесса
+как неизменяемые объекты. Запись, которая их меняет, вызывает
+invalidate_tags(): локальный кэш сбрасывается сразу, остальные процессы
+замечают новую версию в config_version (проверка не чаще раза
+в TAG_CACHE_CHECK_SECONDS).
+
+Изменения таблицы к уже опубликованным постам применяет recategorize_posts()
+(python -m portal.recategorize_posts) — INSERT ... SELECT и DELETE по
+post_categories, без загрузки постов.
+"""
+import re
+import threading
+import time
+from types import MappingProxyType
+
+from flask import current_app
+from sqlalchemy import delete, exists, select, true
+
+from .config_versions import bump_config_version, get_config_version
+from .extensions import db, upsert_insert
+from .models import Category, ModeratedTag, Tag, TagCategory, post_categories, post_tags
+
+TAGS_CONFIG_KEY = "tags"
+
+_lock = threading.Lock()
+_cache = {
+    "version": None,
+    "checked_at": 0.0,
+    "moderated": frozenset(),
+    "tag_categories": MappingProxyType({}),
+}
+
+
+def slugify_tag(name: str) -> str:
+    """Создает slug из названия тега."""
+    name = name.lower().strip()
+    name = re.sub(r"[^\wа-яё-]+", "-", name)
+    name = re.sub(r"-+", "-", name)
+    return name.strip("-")
+
+
+def parse_tag_names(tag_names: str) -> dict:
+    """{slug: имя} из строки с запятыми, в порядке появления, без повторов."""
+    parsed = {}
+    for name in (tag_names or "").split(","):
+        name = name.strip()
+        slug = slugify_tag(name) if name else ""
+        if slug and slug not in parsed:
+            parsed[slug] = name
+    return parsed
+
+
+def _load() -> tuple:
+    moderated = frozenset(
+        slug for (slug,) in db.session.query(Tag.slug).join(ModeratedTag, ModeratedTag.tag_id == Tag.id)
+    )
+    tag_categories = MappingProxyType(dict(db.session.query(TagCategory.tag_slug, TagCategory.category_id)))
+    return moderated, tag_categories
+
+
+def _cached() -> tuple:
+    """(moderated, tag_categories) из кэша; версия в БД проверяется не чаще раза в TAG_CACHE_CHECK_SECONDS."""
+    now = time.monotonic()
+    interval = current_app.config.get("TAG_CACHE_CHECK_SECONDS", 5)
+    with _lock:
+        if _cache["version"] is not None and now - _cache["checked_at"] < interval:
+            return _cache["moderated"], _cache["tag_categories"]
+
+    version = get_config_version(TAGS_CONFIG_KEY)
+    with _lock:
+        _cache["checked_at"] = now
+        if version == _cache["version"]:
+            return _cache["moderated"], _cache["tag_categories"]
+
+    moderated, tag_categories = _load()
+    with _lock:
+        _cache.update(version=version, moderated=moderated, tag_categories=tag_categories)
+    return moderated, tag_categories
+
+
+def invalidate_tags() -> None:
+    """
+    Сбрасывает кэш тегов на модерации и таблицы «тег → категория». Вызывать до commit():
+    версия увеличивается в той же транзакции, что и сама запись.
+    """
+    bump_config_version(TAGS_CONFIG_KEY)
+    with _lock:
+        _cache["version"] = None
+
+
+def get_moderated_tags() -> set:
+    """Получает список slug тегов, требующих модерации."""
+    return _cached()[0]
+
+
+def get_tag_categories():
+    """Неизменяемый словарь {slug тега: id категории}."""
+    return _cached()[1]
+
+
+def _fetch_or_insert(model, key: str, rows: list) -> dict:
+    """
+    {ключ: объект} для строк rows (словари со значениями столбцов): существующие —
+    одним запросом key IN (...), недостающие — одним INSERT и ещё одним запросом.
+    """
+    column = getattr(model, key)
+    keys = [row[key] for row in rows]
+    found = {getattr(obj, key): obj for obj in model.query.filter(column.in_(keys))}
+    missing = [row for row in rows if row[key] not in found]
+    if missing:
+        # DO NOTHING: строку мог только что добавить параллельный запрос
+        db.session.execute(upsert_insert(model).values(missing).on_conflict_do_nothing())
+        found.update(
+            (getattr(obj, key), obj)
+            for obj in model.query.filter(column.in_([row[key] for row in missing]))
+        )
+    return found
+
+
+def get_or_create_tags(tag_names: str) -> tuple:
+    """Получает или создает теги из строки с запятыми. Возвращает (tags, requires_moderation)."""
+    parsed = parse_tag_names(tag_names)
+    if not parsed:
+        return [], False
+
+    moderated = get_moderated_tags()
+    requires_moderation = any(slug in moderated or name.lower() in moderated for slug, name in parsed.items())
+
+    found = _fetch_or_insert(Tag, "slug", [{"slug": slug, "name": name} for slug, name in parsed.items()])
+    # Тег, не добавленный из-за совпадения имени с другим slug, пропускаем
+    return [found[slug] for slug in parsed if slug in found], requires_moderation
+
+
+def create_categories_from_tags(tags: list) -> list:
+    """Категории поста по его тегам (таблица TagCategory)."""
+    tag_categories = get_tag_categories()
+    category_ids = {tag_categories[tag.slug] for tag in tags if tag.slug in tag_categories}
+    if not category_ids:
+        return []
+    return Category.query.filter(Category.id.in_(category_ids)).all()
+
+
+def recategorize_posts(tag_slugs=None, first_post_id=None, last_post_id=None, prune=False) -> tuple:
+    """
+    Приводит категории постов в соответствие с TagCategory; возвращает (добавлено, удалено) связей.
+    tag_slugs — только посты с этими тегами; first_post_id/last_post_id — диапазон id постов.
+    prune=True — ещё и убрать у постов с тегами категории, которые их теги больше не дают
+    (посты без тегов не трогаются: их категории выбраны вручную).
+    """
+    def in_scope(query):
+        query = query.where(true())  # INSERT ... SELECT ... ON CONFLICT в SQLite требует WHERE
+        if first_post_id is not None:
+            query = query.where(post_tags.c.post_id >= first_post_id)
+        if last_post_id is not None:
+            query = query.where(post_tags.c.post_id <= last_post_id)
+        return query
+
+    mapped = in_scope(
+        select(post_tags.c.post_id, TagCategory.category_id)
+        .select_from(post_tags)
+        .join(Tag, Tag.id == post_tags.c.tag_id)
+        .join(TagCategory, TagCategory.tag_slug == Tag.slug)
+        .distinct()
+    )
+    if tag_slugs is not None:
+        mapped = mapped.where(Tag.slug.in_(tag_slugs))
+    added = db.session.execute(
+        upsert_insert(post_categories)
+        .from_select(["post_id", "category_id"], mapped)
+        .on_conflict_do_nothing()
+    ).rowcount
+
+    removed = 0
+    if prune:
+        tagged_posts = in_scope(select(post_tags.c.post_id))
+        implied = exists(
+            select(post_tags.c.post_id)
+            .select_from(post_tags)
+            .join(Tag, Tag.id == post_tags.c.tag_id)
+            .join(TagCategory, TagCategory.tag_slug == Tag.slug)
+            .where(
+                post_tags.c.post_id == post_categories.c.post_id,
+                TagCategory.category_id == post_categories.c.category_id,
+            )
+        )
+        removed = db.session.execute(
+            delete(post_categories).where(post_categories.c.post_id.in_(tagged_posts), ~implied)
+        ).rowcount
+    return added, removed
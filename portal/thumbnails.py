@@ -0,0 +1,222 @@
+"""
+Уменьшенные копии картинок для карточек ленты, страницы поста и аватаров.
+
+Рядом с оригиналом (uploads/media/xx/<хеш>.jpg) кладутся копии нужной ширины
+в WebP и JPEG (PNG, если у картинки есть прозрачность): <хеш>.640w.webp,
+<хеш>.640w.jpg. Файлы хранилища адресуются по содержимому, поэтому копии
+строятся один раз на файл, сколько бы постов на него ни ссылалось.
+
+Копии строит пул потоков (THUMBNAIL_WORKERS) после загрузки — запрос их не
+ждёт. Пока копий нет, responsive_image() в шаблоне отдаёт оригинал; наличие
+копий проверяется по файлам и запоминается в процессе (отсутствие —
+на THUMBNAIL_CHECK_SECONDS). Уже загруженные картинки:
+python -m portal.build_thumbnails
+
+Pillow необязателен: без него копии не строятся, шаблоны показывают оригиналы.
+"""
+import glob
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, url_for
+from markupsafe import Markup
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow необязателен: без него картинки отдаются как есть
+    Image = None
+
+# Вид картинки на странице: (ширины копий, атрибут sizes)
+PRESETS = {
+    "card": ((320, 640, 960), "(max-width: 768px) 100vw, 240px"),
+    "detail": ((640, 1280, 1920), "(max-width: 992px) 100vw, 860px"),
+    "avatar": ((128, 256), "100px"),
+}
+# Какие виды нужны картинке поста и аватару
+KIND_PRESETS = {
+    "post": ("card", "detail"),
+    "avatar": ("avatar",),
+}
+IMAGE_EXT = {"jpg", "jpeg", "png", "gif", "webp"}
+WEBP_QUALITY = 80
+JPEG_QUALITY = 82
+# Сколько путей помнит кэш наличия копий
+CACHE_MAX_ENTRIES = 10000
+
+_lock = threading.Lock()
+_executor = None
+# {путь: (проверено в, (ширины, расширение запасного формата) или None)}
+_available = {}
+
+
+def is_supported() -> bool:
+    return Image is not None
+
+
+def kind_widths(kind: str) -> tuple:
+    """Все ширины копий для картинки поста ("post") или аватара ("avatar")."""
+    return tuple(sorted({width for preset in KIND_PRESETS[kind] for width in PRESETS[preset][0]}))
+
+
+def variant_path(path: str, width: int, ext: str) -> str:
+    """uploads/media/ab/<хеш>.jpg → uploads/media/ab/<хеш>.640w.webp"""
+    return f"{path.rsplit('.', 1)[0]}.{width}w.{ext}"
+
+
+def _has_alpha(image) -> bool:
+    return image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+
+
+def _save(image, target: str, ext: str) -> None:
+    # Через временный файл: шаблон не должен увидеть недописанную копию
+    tmp_path = f"{target}.tmp"
+    if ext == "webp":
+        image.save(tmp_path, "WEBP", quality=WEBP_QUALITY, method=4)
+    elif ext == "png":
+        image.save(tmp_path, "PNG", optimize=True)
+    else:
+        image.save(tmp_path, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+    os.replace(tmp_path, target)
+
+
+def build_derivatives(static_root: str, path: str, widths) -> int:
+    """
+    Строит недостающие копии картинки static_root/path; возвращает число новых файлов.
+    Копии шире оригинала не делаются, анимированные GIF пропускаются.
+    Не требует контекста приложения (вызывается из пула потоков и процессов).
+    """
+    if Image is None or path.rsplit(".", 1)[-1].lower() not in IMAGE_EXT:
+        return 0
+    source = os.path.join(static_root, path)
+    created = 0
+    with Image.open(source) as original:
+        if getattr(original, "is_animated", False):
+            return 0
+        image = ImageOps.exif_transpose(original)
+        fallback = "png" if _has_alpha(image) else "jpg"
+        image = image.convert("RGBA" if fallback == "png" else "RGB")
+        for width in widths:
+            if width >= image.width:
+                break
+            targets = {ext: os.path.join(static_root, variant_path(path, width, ext)) for ext in ("webp", fallback)}
+            if all(os.path.exists(target) for target in targets.values()):
+                continue
+            height = max(1, round(image.height * width / image.width))
+            resized = image.resize((width, height), Image.LANCZOS, reducing_gap=3.0)
+            # Запасной формат пишется последним: по нему проверяется готовность копии
+            for ext in ("webp", fallback):
+                _save(resized, targets[ext], ext)
+                created += 1
+    return created
+
+
+def remove_derivatives(absolute_path: str) -> None:
+    """Удаляет копии картинки (вызывается вместе с удалением оригинала)."""
+    stem = glob.escape(absolute_path.rsplit(".", 1)[0])
+    for variant in glob.glob(f"{stem}.*w.*"):
+        try:
+            os.remove(variant)
+        except FileNotFoundError:
+            pass
+    with _lock:
+        _available.clear()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            workers = max(1, current_app.config.get("THUMBNAIL_WORKERS", 2))
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="thumbnails")
+        return _executor
+
+
+def _build_logged(static_root: str, path: str, widths, logger) -> None:
+    try:
+        build_derivatives(static_root, path, widths)
+    except Exception:
+        logger.exception("Не удалось построить копии %s", path)
+    with _lock:
+        _available.pop(path, None)
+
+
+def schedule_derivatives(path: str, kind: str) -> None:
+    """Ставит построение копий в пул потоков; запрос не ждёт результата."""
+    if Image is None or not path or current_app.config.get("THUMBNAIL_WORKERS", 2) <= 0:
+        return
+    _get_executor().submit(
+        _build_logged, current_app.static_folder, path, kind_widths(kind), current_app.logger
+    )
+
+
+def _lookup(path: str):
+    """(ширины, запасной формат) готовых копий или None; результат кэшируется в процессе."""
+    now = time.monotonic()
+    with _lock:
+        cached = _available.get(path)
+    if cached is not None:
+        checked_at, found = cached
+        if found is not None or now - checked_at < current_app.config.get("THUMBNAIL_CHECK_SECONDS", 30):
+            return found
+
+    static_root = current_app.static_folder
+    found = None
+    for fallback in ("jpg", "png"):
+        widths = tuple(
+            width
+            for width in kind_widths("post") + kind_widths("avatar")
+            if os.path.exists(os.path.join(static_root, variant_path(path, width, fallback)))
+        )
+        if widths:
+            found = (widths, fallback)
+            break
+    with _lock:
+        if len(_available) >= CACHE_MAX_ENTRIES:
+            _available.clear()
+        _available[path] = (now, found)
+    return found
+
+
+def _srcset(path: str, widths, ext: str) -> str:
+    return ", ".join(f"{url_for('static', filename=variant_path(path, width, ext))} {width}w" for width in widths)
+
+
+def responsive_image(path: str, preset: str, alt: str = "", class_: str = "", lazy: bool = True, **attrs) -> Markup:
+    """
+    <picture> с WebP и JPEG/PNG нужных ширин (srcset/sizes) или, пока копий нет, <img> с оригиналом.
+    lazy=False — для картинок в первом экране (главная картинка поста).
+    """
+    attrs.update(alt=alt, decoding="async")
+    if class_:
+        attrs["class"] = class_
+    if lazy:
+        attrs["loading"] = "lazy"
+
+    original = url_for("static", filename=path)
+    found = _lookup(path)
+    preset_widths, sizes = PRESETS[preset]
+    widths = [width for width in preset_widths if found and width in found[0]]
+    if not widths:
+        attrs["src"] = original
+        return Markup("<img %s>") % _attributes(attrs)
+
+    fallback = found[1]
+    # Самая большая копия вида — в src для браузеров без srcset
+    attrs.update(src=url_for("static", filename=variant_path(path, widths[-1], fallback)))
+    attrs.update(srcset=_srcset(path, widths, fallback), sizes=sizes)
+    return Markup('<picture class="portal-picture"><source type="image/webp" srcset="%s" sizes="%s"><img %s></picture>') % (
+        _srcset(path, widths, "webp"),
+        sizes,
+        _attributes(attrs),
+    )
+
+
+def _attributes(attrs: dict) -> Markup:
+    return Markup(" ").join(Markup('%s="%s"') % (name.replace("_", "-"), value) for name, value in attrs.items())
+
+
+def init_thumbnails(app) -> None:
+    """Делает responsive_image доступной в шаблонах."""
+    app.jinja_env.globals["responsive_image"] = responsive_image
@@ -0,0 +1,363 @@
+"""
+Лента подписок (fan-out при записи).
+
+Когда автор публикует пост, в timeline_entry каждого подписчика добавляется
+строка (user_id, post_id, created_at) — одним INSERT ... SELECT по follow.
+Чтение ленты — диапазонный проход по индексу (user_id, created_at, post_id)
+с курсором, без списка подписок и author_id IN (...).
+
+Гибрид для популярных авторов: у кого подписчиков не меньше
+TIMELINE_FANOUT_LIMIT, посты не раскладываются по лентам, а подмешиваются при
+чтении (их немного, и у каждого свой индекс author_id, created_at).
+
+Лента пользователя хранится не целиком: не больше TIMELINE_MAX_ENTRIES
+записей. Граница User.timeline_since означает «все посты подписок новее неё
+есть в ленте»; более старые посты читаются напрямую из post, когда лента
+кончилась. При подписке лента дозаполняется постами автора новее границы,
+при отписке его записи удаляются.
+
+После fan-out ленты подписчиков обрезаются фоновым потоком раз в
+TIMELINE_TRIM_SECONDS — одним проходом по всем авторам, опубликовавшим посты
+за это время (0 — обрезать сразу, в транзакции публикации). До обрезки лента
+может ненадолго превышать лимит.
+
+Когда автор опускается ниже порога, его посты раскладываются по лентам
+оставшихся подписчиков. Пересборка всех лент: python -m portal.rebuild_timelines
+"""
+import heapq
+import threading
+
+from flask import current_app
+from sqlalchemy import bindparam, delete, literal, or_, select, true, update
+from sqlalchemy.orm import selectinload
+
+from .background import PeriodicFlusher
+from .extensions import db, upsert_insert
+from .models import Follow, Post, TimelineEntry, User
+from .pagination import DEFAULT_PER_PAGE, NEWEST_FIRST, decode_cursor, fetch_after, make_page
+
+# Ключ курсора в ленте: тот же (created_at, id поста), но по столбцам timeline_entry
+TIMELINE_KEY = (TimelineEntry.created_at, TimelineEntry.post_id)
+
+_timeline_table = TimelineEntry.__table__
+_user_table = User.__table__
+
+_trimmer_lock = threading.Lock()
+
+
+def _fanout_limit() -> int:
+    return current_app.config.get("TIMELINE_FANOUT_LIMIT", 5000)
+
+
+def _max_entries() -> int:
+    return current_app.config.get("TIMELINE_MAX_ENTRIES", 1000)
+
+
+def _upsert_statement():
+    return upsert_insert(_timeline_table).on_conflict_do_nothing(index_elements=["user_id", "post_id"])
+
+
+def _insert_rows(rows: list) -> None:
+    """Добавляет записи (user_id, post_id, author_id, created_at), дубликаты пропускаются."""
+    if rows:
+        db.session.execute(
+            _upsert_statement(),
+            [
+                {"user_id": user_id, "post_id": post_id, "author_id": author_id, "created_at": created_at}
+                for user_id, post_id, author_id, created_at in rows
+            ],
+        )
+
+
+def is_fanout_author(author: User) -> bool:
+    return author.followers_count < _fanout_limit()
+
+
+def fan_out_post(post: Post) -> None:
+    """Раскладывает опубликованный пост по лентам подписчиков (вызывать после flush, до commit)."""
+    if not post.is_published or not is_fanout_author(post.author):
+        return
+    followers = select(
+        Follow.follower_id,
+        literal(post.id),
+        literal(post.author_id),
+        literal(post.created_at, Post.created_at.type),
+    ).where(Follow.followed_id == post.author_id)
+    db.session.execute(
+        _upsert_statement().from_select(["user_id", "post_id", "author_id", "created_at"], followers)
+    )
+    _schedule_trim(post.author_id)
+
+
+def _schedule_trim(author_id: int) -> None:
+    """Обрезка лент подписчиков автора: фоном, а без фонового обрезчика — сразу."""
+    trimmer = get_timeline_trimmer()
+    if trimmer.interval > 0:
+        trimmer.add(author_id)
+    else:
+        trim_followers([author_id])
+
+
+def trim_followers(author_ids) -> int:
+    """
+    Обрезает до TIMELINE_MAX_ENTRIES ленты подписчиков авторов (как _trim, но
+    пачкой: граница каждой ленты — один подзапрос по индексу). Возвращает число
+    обрезанных лент.
+    """
+    limit = _max_entries()
+    boundary = (
+        select(TimelineEntry.created_at)
+        .where(TimelineEntry.user_id == User.id)
+        .order_by(TimelineEntry.created_at.desc(), TimelineEntry.post_id.desc())
+        .offset(limit)
+        .limit(1)
+        .correlate(User)
+        .scalar_subquery()
+    )
+    followers = select(Follow.follower_id).where(Follow.followed_id.in_(list(author_ids)))
+    rows = db.session.execute(
+        select(User.id, User.timeline_since, boundary).where(User.id.in_(followers))
+    ).all()
+    over = [(user_id, since, created_at) for user_id, since, created_at in rows if created_at is not None]
+    if not over:
+        return 0
+    db.session.execute(
+        _timeline_table.delete().where(
+            _timeline_table.c.user_id == bindparam("uid"), _timeline_table.c.created_at <= bindparam("boundary")
+        ),
+        [{"uid": user_id, "boundary": created_at} for user_id, _, created_at in over],
+    )
+    raised = [
+        {"uid": user_id, "since": created_at}
+        for user_id, since, created_at in over
+        if since is None or created_at > since
+    ]
+    if raised:
+        db.session.execute(
+            update(_user_table).where(_user_table.c.id == bindparam("uid")).values(timeline_since=bindparam("since")),
+            raised,
+        )
+    return len(over)
+
+
+class TimelineTrimmer:
+    """Авторы с новыми постами, чьих подписчиков пора обрезать (см. get_timeline_trimmer)."""
+
+    def __init__(self, app, interval: float):
+        self.app = app
+        self.interval = interval
+        self._authors = set()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flusher = PeriodicFlusher(self.flush, interval, "timeline-trimmer") if interval > 0 else None
+
+    def add(self, author_id: int) -> None:
+        with self._lock:
+            self._authors.add(author_id)
+        self._flusher.ensure_started()
+
+    def flush(self) -> int:
+        """Обрезает ленты подписчиков накопленных авторов; возвращает число обрезанных лент."""
+        with self._flush_lock:
+            with self._lock:
+                authors, self._authors = self._authors, set()
+            if not authors:
+                return 0
+            with self.app.app_context():
+                try:
+                    trimmed = trim_followers(authors)
+                    db.session.commit()
+                    return trimmed
+                except Exception:
+                    db.session.rollback()
+                    with self._lock:
+                        self._authors |= authors
+                    current_app.logger.exception("Не удалось обрезать ленты подписок, повтор при следующем проходе")
+                    return 0
+                finally:
+                    db.session.remove()
+
+
+def get_timeline_trimmer() -> TimelineTrimmer:
+    """Обрезчик лент текущего приложения (создаётся при первом обращении)."""
+    app = current_app._get_current_object()
+    trimmer = app.extensions.get("timeline_trimmer")
+    if trimmer is not None:
+        return trimmer
+    with _trimmer_lock:
+        trimmer = app.extensions.get("timeline_trimmer")
+        if trimmer is None:
+            trimmer = app.extensions["timeline_trimmer"] = TimelineTrimmer(
+                app, interval=app.config.get("TIMELINE_TRIM_SECONDS", 30)
+            )
+    return trimmer
+
+
+def _trim(user: User) -> None:
+    """Оставляет в ленте TIMELINE_MAX_ENTRIES новых записей и поднимает границу timeline_since."""
+    limit = _max_entries()
+    boundary = db.session.execute(
+        select(TimelineEntry.created_at, TimelineEntry.post_id)
+        .where(TimelineEntry.user_id == user.id)
+        .order_by(TimelineEntry.created_at.desc(), TimelineEntry.post_id.desc())
+        .offset(limit)
+        .limit(1)
+    ).first()
+    if boundary is None:
+        return
+    created_at = boundary[0]
+    db.session.execute(
+        delete(TimelineEntry).where(TimelineEntry.user_id == user.id, TimelineEntry.created_at <= created_at)
+    )
+    _raise_horizon(user, created_at)
+
+
+def _raise_horizon(user: User, created_at) -> None:
+    if user.timeline_since is None or created_at > user.timeline_since:
+        user.timeline_since = created_at
+
+
+def backfill_author(user: User, author: User) -> None:
+    """После подписки (счётчики уже обновлены): посты автора новее границы ленты, затем обрезка до лимита."""
+    db.session.refresh(author, ["followers_count"])
+    if not is_fanout_author(author):
+        return
+    limit = _max_entries()
+    posts = select(Post.id, Post.created_at).where(Post.author_id == author.id)
+    if user.timeline_since is not None:
+        posts = posts.where(Post.created_at > user.timeline_since)
+    rows = db.session.execute(posts.order_by(Post.created_at.desc(), Post.id.desc()).limit(limit + 1)).all()
+    if len(rows) > limit:
+        # У автора больше постов, чем помещается в ленту: граница поднимается до первого не вошедшего
+        _raise_horizon(user, rows[limit].created_at)
+        rows = [row for row in rows[:limit] if row.created_at > user.timeline_since]
+    _insert_rows([(user.id, post_id, author.id, created_at) for post_id, created_at in rows])
+    _trim(user)
+
+
+def remove_author(user: User, author: User) -> None:
+    """После отписки (счётчики уже обновлены): убирает посты автора из ленты."""
+    db.session.execute(
+        delete(TimelineEntry).where(TimelineEntry.user_id == user.id, TimelineEntry.author_id == author.id)
+    )
+    db.session.refresh(author, ["followers_count"])
+    if author.followers_count == _fanout_limit() - 1:
+        # Автор только что перестал быть популярным: его посты больше не подмешиваются
+        # при чтении, поэтому раскладываем их по лентам оставшихся подписчиков одним
+        # INSERT … SELECT. Берём на пост больше лимита: обрезка удалит лишний и поднимет
+        # по нему timeline_since, как _raise_horizon в backfill_author
+        recent = (
+            select(Post.id, Post.created_at)
+            .where(Post.author_id == author.id)
+            .order_by(Post.created_at.desc(), Post.id.desc())
+            .limit(_max_entries() + 1)
+            .subquery()
+        )
+        rows = (
+            select(Follow.follower_id, recent.c.id, literal(author.id), recent.c.created_at)
+            .join(User, User.id == Follow.follower_id)
+            .join(recent, true())
+            .where(
+                Follow.followed_id == author.id,
+                or_(User.timeline_since.is_(None), recent.c.created_at > User.timeline_since),
+            )
+        )
+        db.session.execute(
+            _upsert_statement().from_select(["user_id", "post_id", "author_id", "created_at"], rows)
+        )
+        _schedule_trim(author.id)
+
+
+def rebuild_timeline(user: User) -> int:
+    """Собирает ленту пользователя заново; возвращает число записей."""
+    db.session.execute(delete(TimelineEntry).where(TimelineEntry.user_id == user.id))
+    user.timeline_since = None
+    limit = _max_entries()
+    fanout_authors = (
+        select(Follow.followed_id)
+        .join(User, User.id == Follow.followed_id)
+        .where(Follow.follower_id == user.id, User.followers_count < _fanout_limit())
+    )
+    rows = db.session.execute(
+        select(Post.id, Post.author_id, Post.created_at)
+        .where(Post.author_id.in_(fanout_authors))
+        .order_by(Post.created_at.desc(), Post.id.desc())
+        .limit(limit + 1)
+    ).all()
+    if len(rows) > limit:
+        user.timeline_since = rows[limit].created_at
+        rows = [row for row in rows[:limit] if row.created_at > user.timeline_since]
+    _insert_rows([(user.id, row.id, row.author_id, row.created_at) for row in rows])
+    return len(rows)
+
+
+def rebuild_all_timelines(batch_size: int = 500) -> int:
+    """Пересобирает ленты всех пользователей пачками; возвращает число лент."""
+    rebuilt = 0
+    last_id = 0
+    while True:
+        users = User.query.filter(User.id > last_id).order_by(User.id).limit(batch_size).all()
+        if not users:
+            return rebuilt
+        for user in users:
+            rebuild_timeline(user)
+        db.session.commit()
+        rebuilt += len(users)
+        last_id = users[-1].id
+
+
+def _followed_popular_ids(user: User) -> list:
+    """Популярные авторы из подписок (их посты подмешиваются при чтении)."""
+    return [
+        author_id
+        for (author_id,) in db.session.query(Follow.followed_id)
+        .join(User, User.id == Follow.followed_id)
+        .filter(Follow.follower_id == user.id, User.followers_count >= _fanout_limit())
+    ]
+
+
+def following_page(user: User, cursor=None, per_page: int = DEFAULT_PER_PAGE):
+    """Страница ленты подписок (Page с постами и курсором следующей страницы)."""
+    values = decode_cursor(NEWEST_FIRST, cursor)
+    popular_ids = _followed_popular_ids(user)
+    need = per_page + 1
+
+    # Автор нужен карточке ленты — грузим авторов страницы одним запросом
+    posts = Post.query.options(selectinload(Post.author))
+    entries = (
+        posts.join(TimelineEntry, TimelineEntry.post_id == Post.id)
+        .filter(TimelineEntry.user_id == user.id, Post.is_published.is_(True))
+    )
+    if user.timeline_since is not None:
+        entries = entries.filter(TimelineEntry.created_at > user.timeline_since)
+    if popular_ids:
+        # Записи, разложенные до того, как автор стал популярным, не должны задвоиться
+        entries = entries.filter(TimelineEntry.author_id.notin_(popular_ids))
+    streams = [fetch_after(entries, TIMELINE_KEY, values, need)]
+
+    if popular_ids:
+        popular = posts.filter(Post.author_id.in_(popular_ids), Post.is_published.is_(True))
+        streams.append(fetch_after(popular, NEWEST_FIRST, values, need))
+
+    if user.timeline_since is not None and len(streams[0]) < need:
+        # Лента кончилась: посты старше границы читаем напрямую
+        followed = select(Follow.followed_id).where(Follow.follower_id == user.id)
+        history = posts.filter(
+            Post.author_id.in_(followed),
+            Post.is_published.is_(True),
+            Post.created_at <= user.timeline_since,
+        )
+        if popular_ids:
+            history = history.filter(Post.author_id.notin_(popular_ids))
+        streams.append(fetch_after(history, NEWEST_FIRST, values, need))
+
+    items = []
+    seen = set()
+    for post in heapq.merge(*streams, key=lambda post: (post.created_at, post.id), reverse=True):
+        if post.id in seen:
+            continue
+        seen.add(post.id)
+        items.append(post)
+        if len(items) == need:
+            break
+    return make_page(NEWEST_FIRST, items, per_page)
@@ -0,0 +1,248 @@
+"""
+Загрузка больших файлов частями с докачкой.
+
+Клиент открывает загрузку (POST /api/uploads: имя файла, размер, необязательный
+SHA-256), затем шлёт части не больше UPLOAD_CHUNK_SIZE: PUT /api/uploads/<token>
+?offset=N с телом-частью. Части дописываются в промежуточный файл в
+instance/upload_staging; каждый запрос короткий, и оборванное соединение
+теряет только одну часть. После сбоя клиент спрашивает GET /api/uploads/<token>,
+сколько уже принято, и продолжает с этого места. Часть можно прислать
+повторно (offset меньше принятого) — файл обрезается по её концу.
+
+POST /api/uploads/<token>/complete сверяет размер и контрольную сумму и кладёт
+файл в хранилище по хешу (media.store_file). Готовая загрузка прикрепляется
+к посту по токену (скрытое поле формы upload_token), ссылка на файл
+переходит к посту.
+
+Брошенные загрузки (без новых частей дольше UPLOAD_SESSION_TTL) удаляет
+python -m portal.gc_media вместе с промежуточными файлами.
+"""
+import hashlib
+import os
+import secrets
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+from sqlalchemy import func
+
+from .extensions import db
+from .media import content_hash, release_media, store_file
+from .models import UploadSession
+
+# Размер куска при чтении промежуточного файла для контрольных сумм (1 МБ)
+READ_SIZE = 1024 * 1024
+
+
+class UploadError(Exception):
+    """Ошибка загрузки частями; status — HTTP-код ответа API."""
+
+    def __init__(self, message: str, status: int = 400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+def _staging_dir() -> str:
+    return os.path.join(current_app.instance_path, "upload_staging")
+
+
+def staging_path(token: str) -> str:
+    return os.path.join(_staging_dir(), f"{token}.part")
+
+
+def chunk_size() -> int:
+    return current_app.config.get("UPLOAD_CHUNK_SIZE", 8 * 1024 * 1024)
+
+
+def upload_state(upload: UploadSession) -> dict:
+    """Ответ API: сколько принято и с какого места продолжать."""
+    return {
+        "token": upload.token,
+        "size": upload.size,
+        "offset": upload.received,
+        "chunk_size": chunk_size(),
+        "complete": upload.media_path is not None,
+    }
+
+
+def get_upload(user, token: str) -> UploadSession:
+    upload = UploadSession.query.filter_by(token=token, user_id=user.id).first()
+    if upload is None:
+        raise UploadError("Загрузка не найдена.", 404)
+    return upload
+
+
+def _parse_checksum(value):
+    """SHA-256 из запроса клиента (строка hex) или None; иначе UploadError."""
+    if value is None or value == "":
+        return None
+    if not isinstance(value, str):
+        raise UploadError("Контрольная сумма должна быть SHA-256 в hex.")
+    value = value.lower()
+    if len(value) != 64 or any(c not in "0123456789abcdef" for c in value):
+        raise UploadError("Контрольная сумма должна быть SHA-256 в hex.")
+    return value
+
+
+def start_upload(user, filename: str, size, checksum=None) -> UploadSession:
+    """
+    Открывает загрузку и создаёт пустой промежуточный файл. size и checksum —
+    значения из JSON клиента: неверный тип даёт UploadError (400).
+    """
+    config = current_app.config
+    # bool — подкласс int, но размером файла не бывает
+    if not isinstance(size, int) or isinstance(size, bool):
+        raise UploadError("Размер файла должен быть целым числом.")
+    if size <= 0:
+        raise UploadError("Пустой файл.")
+    if size > config.get("UPLOAD_MAX_SIZE", 200 * 1024 * 1024):
+        raise UploadError("Файл слишком большой.", 413)
+    checksum = _parse_checksum(checksum)
+    active = (
+        db.session.query(func.count(UploadSession.id))
+        .filter(UploadSession.user_id == user.id, UploadSession.media_path.is_(None))
+        .scalar()
+    )
+    if active >= config.get("UPLOAD_MAX_ACTIVE", 5):
+        raise UploadError("Слишком много незавершённых загрузок.", 429)
+
+    upload = UploadSession(
+        token=secrets.token_hex(16), user_id=user.id, filename=filename, size=size, checksum=checksum
+    )
+    os.makedirs(_staging_dir(), exist_ok=True)
+    open(staging_path(upload.token), "wb").close()
+    db.session.add(upload)
+    return upload
+
+
+def write_chunk(upload: UploadSession, offset: int, stream, length: int, chunk_sha256=None) -> None:
+    """
+    Пишет часть длиной length байт с позиции offset. offset не может быть больше
+    уже принятого (иначе 409 с offset, с которого продолжать).
+    """
+    if upload.media_path is not None:
+        raise UploadError("Загрузка уже завершена.", 409, upload.received)
+    if offset < 0 or offset > upload.received:
+        raise UploadError("Неверное смещение части.", 409, upload.received)
+    if length <= 0 or length > chunk_size():
+        raise UploadError("Неверный размер части.", 413)
+    if offset + length > upload.size:
+        raise UploadError("Часть выходит за размер файла.", 416, upload.received)
+
+    data = stream.read(length)
+    if len(data) != length:
+        raise UploadError("Часть пришла не полностью.", 400, upload.received)
+    if chunk_sha256 and hashlib.sha256(data).hexdigest() != chunk_sha256.strip().lower():
+        raise UploadError("Контрольная сумма части не совпала.", 422, upload.received)
+
+    path = staging_path(upload.token)
+    if not os.path.exists(path):
+        raise UploadError("Промежуточный файл потерян, начните загрузку заново.", 410)
+    with open(path, "r+b") as target:
+        target.seek(offset)
+        target.write(data)
+        # Повтор части: всё, что было после неё, будет прислано заново
+        target.truncate(offset + length)
+    upload.received = offset + length
+    upload.updated_at = datetime.now(timezone.utc)
+
+
+def _file_hashes(path: str) -> tuple:
+    """(SHA-256 для проверки клиентом, BLAKE2b для хранилища) за один проход."""
+    sha256 = hashlib.sha256()
+    digest = content_hash()
+    with open(path, "rb") as source:
+        while True:
+            chunk = source.read(READ_SIZE)
+            if not chunk:
+                return sha256.hexdigest(), digest.hexdigest()
+            sha256.update(chunk)
+            digest.update(chunk)
+
+
+def complete_upload(upload: UploadSession, checksum=None) -> str:
+    """
+    Проверяет размер и SHA-256 и кладёт файл в хранилище; возвращает media_path.
+    При несовпадении суммы загрузка начинается заново (offset 0).
+    """
+    if upload.media_path is not None:
+        return upload.media_path
+    checksum = _parse_checksum(checksum)
+    if upload.received != upload.size:
+        raise UploadError("Приняты не все части.", 409, upload.received)
+    path = staging_path(upload.token)
+    if not os.path.exists(path) or os.path.getsize(path) != upload.size:
+        raise UploadError("Промежуточный файл потерян, начните загрузку заново.", 410)
+
+    sha256, digest = _file_hashes(path)
+    expected = checksum or upload.checksum
+    if expected and expected != sha256:
+        open(path, "wb").close()
+        upload.received = 0
+        upload.updated_at = datetime.now(timezone.utc)
+        raise UploadError("Контрольная сумма файла не совпала, загрузите его заново.", 422, 0)
+
+    ext = upload.filename.rsplit(".", 1)[-1].lower()
+    upload.media_path = store_file(path, ext, digest, upload.size)
+    upload.updated_at = datetime.now(timezone.utc)
+    return upload.media_path
+
+
+def attach_upload(user, token: str):
+    """
+    Забирает завершённую загрузку для поста: возвращает media_path (ссылка на файл
+    переходит к посту) или None, если загрузки нет или она не завершена.
+    """
+    upload = UploadSession.query.filter_by(token=token, user_id=user.id).first()
+    if upload is None or upload.media_path is None:
+        return None
+    media_path = upload.media_path
+    db.session.delete(upload)
+    return media_path
+
+
+def cancel_upload(upload: UploadSession) -> int:
+    """Отменяет загрузку; возвращает размер удалённого промежуточного файла."""
+    release_media(upload.media_path)
+    db.session.delete(upload)
+    return _remove_staging(upload.token)
+
+
+def _remove_staging(token: str) -> int:
+    """Удаляет промежуточный файл; возвращает его размер."""
+    path = staging_path(token)
+    try:
+        size = os.path.getsize(path)
+        os.remove(path)
+        return size
+    except FileNotFoundError:
+        return 0
+
+
+def collect_abandoned_uploads(max_age_seconds=None) -> tuple:
+    """
+    Удаляет загрузки без новых частей дольше max_age_seconds (по умолчанию
+    UPLOAD_SESSION_TTL) и промежуточные файлы без загрузки. Возвращает (загрузок, байт).
+    """
+    if max_age_seconds is None:
+        max_age_seconds = current_app.config.get("UPLOAD_SESSION_TTL", 86400)
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=max_age_seconds)
+    abandoned = UploadSession.query.filter(UploadSession.updated_at < cutoff).all()
+    freed = 0
+    for upload in abandoned:
+        freed += cancel_upload(upload)
+    db.session.commit()
+
+    # Промежуточные файлы, чья строка уже удалена (например, после отката транзакции)
+    staging = _staging_dir()
+    if os.path.isdir(staging):
+        known = {token for (token,) in db.session.query(UploadSession.token)}
+        for name in os.listdir(staging):
+            path = os.path.join(staging, name)
+            token = name.rsplit(".", 1)[0]
+            if token in known:
+                continue
+            if datetime.fromtimestamp(os.path.getmtime(path), timezone.utc) < cutoff:
+                freed += os.path.getsize(path)
+                os.remove(path)
+    return len(abandoned), freed
@@ -0,0 +1,175 @@
+"""
+Буфер записи просмотров постов (write-behind).
+
+Пока читатель листает пост, страница шлёт маяк /api/post/<id>/view каждые
+несколько секунд. Вместо SELECT + INSERT/UPDATE + commit на каждый маяк данные
+копятся в памяти процесса по ключу (пользователь, пост): максимальный прогресс
+и время просмотра, «просмотрен полностью» — если хоть раз пришло True.
+Фоновый поток сбрасывает накопленное одной транзакцией через
+INSERT ... ON CONFLICT DO UPDATE раз в VIEW_BUFFER_FLUSH_SECONDS или сразу,
+как записей становится VIEW_BUFFER_MAX_ENTRIES. При остановке процесса буфер
+сбрасывается ещё раз (atexit). VIEW_BUFFER_FLUSH_SECONDS = 0 — писать сразу
+в запросе, без фонового потока.
+
+При сбросе новые зрители поста по-прежнему увеличивают viewers_count и
+горячесть, а рекомендации пользователя помечаются устаревшими.
+"""
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+
+from flask import current_app
+from sqlalchemy import func, or_
+
+from .background import PeriodicFlusher
+from .counters import adjust_post_counters
+from .extensions import db, upsert_insert
+from .hotness import HOT_VIEW_WEIGHT, bump_hot_score
+from .models import Post, PostView
+from .recommendations import mark_recommendations_stale
+
+_buffer_lock = threading.Lock()
+
+_view_table = PostView.__table__
+# {имя СУБД: INSERT ... ON CONFLICT DO UPDATE}
+_upserts = {}
+
+
+def _upsert_statement():
+    dialect = db.engine.dialect.name
+    statement = _upserts.get(dialect)
+    if statement is None:
+        statement = upsert_insert(_view_table)
+        # Наибольшее из двух значений: max(a, b) в SQLite, greatest(a, b) в PostgreSQL
+        greatest = func.max if dialect == "sqlite" else func.greatest
+        statement = _upserts[dialect] = statement.on_conflict_do_update(
+            index_elements=[_view_table.c.user_id, _view_table.c.post_id],
+            set_={
+                "progress": greatest(_view_table.c.progress, statement.excluded.progress),
+                "is_complete": or_(_view_table.c.is_complete, statement.excluded.is_complete),
+                "view_duration": greatest(_view_table.c.view_duration, statement.excluded.view_duration),
+                "viewed_at": statement.excluded.viewed_at,
+            },
+        )
+    return statement
+
+
+class ViewBuffer:
+    """Накопитель маяков просмотра одного процесса (см. get_view_buffer)."""
+
+    def __init__(self, app, flush_seconds: float, max_entries: int):
+        self.app = app
+        self.flush_seconds = flush_seconds
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+        # Сброс выполняется строго по одному: фоновый поток, atexit и ручной вызов
+        self._flush_lock = threading.Lock()
+        self._flusher = PeriodicFlusher(self.flush, flush_seconds, "view-buffer-flusher") if flush_seconds > 0 else None
+
+    def record(self, user_id: int, post_id: int, progress: float, is_complete: bool, view_duration: float) -> tuple:
+        """Учитывает маяк и возвращает накопленные (progress, is_complete)."""
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            entry = self._entries.get((user_id, post_id))
+            if entry is None:
+                entry = self._entries[(user_id, post_id)] = {
+                    "progress": progress,
+                    "is_complete": is_complete,
+                    "view_duration": view_duration,
+                }
+            else:
+                entry["progress"] = max(entry["progress"], progress)
+                entry["is_complete"] = entry["is_complete"] or is_complete
+                entry["view_duration"] = max(entry["view_duration"], view_duration)
+            entry["viewed_at"] = now
+            result = (entry["progress"], entry["is_complete"])
+            pending = len(self._entries)
+
+        if self._flusher is None:
+            self.flush()
+        else:
+            self._flusher.ensure_started()
+            if pending >= self.max_entries:
+                self._flusher.wake()
+        return result
+
+    def _take(self) -> dict:
+        with self._lock:
+            entries, self._entries = self._entries, {}
+        return entries
+
+    def _restore(self, entries: dict) -> None:
+        """Возвращает несохранённые записи в буфер, сливая с пришедшими за это время."""
+        with self._lock:
+            for key, old in entries.items():
+                entry = self._entries.get(key)
+                if entry is None:
+                    self._entries[key] = old
+                    continue
+                entry["progress"] = max(entry["progress"], old["progress"])
+                entry["is_complete"] = entry["is_complete"] or old["is_complete"]
+                entry["view_duration"] = max(entry["view_duration"], old["view_duration"])
+
+    def flush(self) -> int:
+        """Записывает накопленное в БД; возвращает число сохранённых записей."""
+        with self._flush_lock:
+            entries = self._take()
+            if not entries:
+                return 0
+            with self.app.app_context():
+                try:
+                    saved = _write_entries(entries)
+                    db.session.commit()
+                    return saved
+                except Exception:
+                    db.session.rollback()
+                    self._restore(entries)
+                    current_app.logger.exception("Не удалось сохранить просмотры постов, повтор при следующем сбросе")
+                    return 0
+                finally:
+                    db.session.remove()
+
+
+def _write_entries(entries: dict) -> int:
+    post_ids = {post_id for _, post_id in entries}
+    posts = {post.id: post for post in Post.query.filter(Post.id.in_(post_ids))}
+    # Маяки удалённых за это время постов отбрасываем
+    entries = {key: entry for key, entry in entries.items() if key[1] in posts}
+    if not entries:
+        return 0
+
+    user_ids = {user_id for user_id, _ in entries}
+    existing = set(
+        db.session.query(PostView.user_id, PostView.post_id)
+        .filter(PostView.post_id.in_(posts), PostView.user_id.in_(user_ids))
+    )
+    db.session.execute(
+        _upsert_statement(),
+        [{"user_id": user_id, "post_id": post_id, **entry} for (user_id, post_id), entry in entries.items()],
+    )
+
+    new_viewers = Counter(post_id for user_id, post_id in entries if (user_id, post_id) not in existing)
+    for post_id, count in new_viewers.items():
+        adjust_post_counters(post_id, viewers_count=count)
+        bump_hot_score(posts[post_id], HOT_VIEW_WEIGHT * count)
+    for user_id, post_id in entries:
+        mark_recommendations_stale(user_id, post_id)
+    return len(entries)
+
+
+def get_view_buffer() -> ViewBuffer:
+    """Буфер текущего приложения (создаётся при первом обращении)."""
+    app = current_app._get_current_object()
+    buffer = app.extensions.get("view_buffer")
+    if buffer is not None:
+        return buffer
+    with _buffer_lock:
+        buffer = app.extensions.get("view_buffer")
+        if buffer is None:
+            buffer = app.extensions["view_buffer"] = ViewBuffer(
+                app,
+                flush_seconds=app.config.get("VIEW_BUFFER_FLUSH_SECONDS", 0.3),
+                max_entries=app.config.get("VIEW_BUFFER_MAX_ENTRIES", 200),
+            )
+    return buffer
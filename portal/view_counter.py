@@ -0,0 +1,178 @@
+"""
+Счётчик открытий постов (Post.views), в том числе анонимных.
+
+Открытие страницы не пишет в БД: приращения копятся в памяти процесса в
+нескольких «полосах» (stripes) со своими блокировками, полоса выбирается по
+post_id, поэтому параллельные запросы к разным постам не ждут друг друга.
+Повторное открытие того же поста в той же сессии в течение VIEW_DEDUP_SECONDS
+не считается. Ключ сессии анонимного посетителя выводится из адреса и
+User-Agent, поэтому клиенты без cookie тоже не считаются на каждом запросе
+(ценой того, что посетители за одним NAT с одинаковым браузером считаются
+одним). Фоновый поток раз в VIEW_COUNTER_FLUSH_SECONDS применяет накопленное
+одним пакетным UPDATE post SET views = views + :delta; при 0 каждое открытие
+сразу пишет приращение своего поста. Истёкшие окна дедупликации забываются
+не чаще раза в SEEN_PRUNE_SECONDS.
+"""
+import hashlib
+import threading
+import time
+
+from flask import current_app, request, session
+from flask_login import current_user
+from sqlalchemy import bindparam, update
+
+from .background import PeriodicFlusher
+from .extensions import db
+from .models import Post
+
+VIEW_SESSION_KEY = "view_session"
+# Как часто чистить память о засчитанных открытиях от истёкших окон дедупликации
+SEEN_PRUNE_SECONDS = 60.0
+
+_post_table = Post.__table__
+_increment_statement = (
+    update(_post_table)
+    .where(_post_table.c.id == bindparam("post_id"))
+    .values(views=_post_table.c.views + bindparam("delta"))
+)
+
+_counter_lock = threading.Lock()
+
+
+class _Stripe:
+    __slots__ = ("lock", "counts", "seen")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {}
+        # (сессия, post_id) -> время последнего засчитанного открытия
+        self.seen = {}
+
+
+class ViewCounter:
+    """Полосатые счётчики открытий постов одного процесса (см. get_view_counter)."""
+
+    def __init__(self, app, stripes: int, flush_seconds: float, dedup_seconds: float):
+        self.app = app
+        self.dedup_seconds = dedup_seconds
+        self._stripes = [_Stripe() for _ in range(max(1, stripes))]
+        self._flush_lock = threading.Lock()
+        self._pruned_at = time.monotonic()
+        self._flusher = PeriodicFlusher(self.flush, flush_seconds, "view-counter-flusher") if flush_seconds > 0 else None
+
+    def _stripe(self, post_id: int) -> _Stripe:
+        return self._stripes[post_id % len(self._stripes)]
+
+    def register(self, post_id: int, session_id: str) -> bool:
+        """Учитывает открытие поста; False — повтор в окне дедупликации."""
+        now = time.monotonic()
+        stripe = self._stripe(post_id)
+        with stripe.lock:
+            key = (session_id, post_id)
+            last_seen = stripe.seen.get(key)
+            if last_seen is not None and now - last_seen < self.dedup_seconds:
+                return False
+            stripe.seen[key] = now
+            stripe.counts[post_id] = stripe.counts.get(post_id, 0) + 1
+        if now - self._pruned_at >= SEEN_PRUNE_SECONDS:
+            self._prune(now)
+        if self._flusher is None:
+            # Пишем только этот пост (вместе с его приращениями после неудачной записи)
+            with stripe.lock:
+                delta = stripe.counts.pop(post_id, 0)
+            if delta:
+                self._write({post_id: delta})
+        else:
+            self._flusher.ensure_started()
+        return True
+
+    def _prune(self, now: float) -> None:
+        """Забывает сессии, чьё окно дедупликации истекло."""
+        self._pruned_at = now
+        cutoff = now - self.dedup_seconds
+        for stripe in self._stripes:
+            with stripe.lock:
+                stripe.seen = {key: seen for key, seen in stripe.seen.items() if seen >= cutoff}
+
+    def pending(self, post_id: int) -> int:
+        """Открытия поста, ещё не записанные в БД."""
+        stripe = self._stripe(post_id)
+        with stripe.lock:
+            return stripe.counts.get(post_id, 0)
+
+    def _take(self) -> dict:
+        counts = {}
+        for stripe in self._stripes:
+            with stripe.lock:
+                taken, stripe.counts = stripe.counts, {}
+            counts.update(taken)
+        return counts
+
+    def _restore(self, counts: dict) -> None:
+        for post_id, delta in counts.items():
+            stripe = self._stripe(post_id)
+            with stripe.lock:
+                stripe.counts[post_id] = stripe.counts.get(post_id, 0) + delta
+
+    def flush(self) -> int:
+        """Записывает накопленные открытия в Post.views; возвращает число постов."""
+        with self._flush_lock:
+            counts = self._take()
+            if not counts:
+                return 0
+            return self._write(counts)
+
+    def _write(self, counts: dict) -> int:
+        """Применяет приращения к Post.views; при ошибке возвращает их в полосы."""
+        with self.app.app_context():
+            try:
+                db.session.execute(
+                    _increment_statement,
+                    [{"post_id": post_id, "delta": delta} for post_id, delta in counts.items()],
+                )
+                db.session.commit()
+                return len(counts)
+            except Exception:
+                db.session.rollback()
+                self._restore(counts)
+                current_app.logger.exception("Не удалось сохранить счётчики просмотров, повтор при следующем сбросе")
+                return 0
+            finally:
+                db.session.remove()
+
+
+def get_view_counter() -> ViewCounter:
+    """Счётчик текущего приложения (создаётся при первом обращении)."""
+    app = current_app._get_current_object()
+    counter = app.extensions.get("view_counter")
+    if counter is not None:
+        return counter
+    with _counter_lock:
+        counter = app.extensions.get("view_counter")
+        if counter is None:
+            counter = app.extensions["view_counter"] = ViewCounter(
+                app,
+                stripes=app.config.get("VIEW_COUNTER_STRIPES", 16),
+                flush_seconds=app.config.get("VIEW_COUNTER_FLUSH_SECONDS", 5.0),
+                dedup_seconds=app.config.get("VIEW_DEDUP_SECONDS", 1800.0),
+            )
+    return counter
+
+
+def _session_id() -> str:
+    if current_user.is_authenticated:
+        return f"user:{current_user.id}"
+    # Ключ анонимного посетителя хранится в подписанной cookie-сессии; клиент
+    # без cookie получает тот же ключ по адресу и User-Agent при каждом запросе
+    view_session = session.get(VIEW_SESSION_KEY)
+    if not view_session:
+        client = f"{request.remote_addr}|{request.headers.get('User-Agent', '')}"
+        view_session = session[VIEW_SESSION_KEY] = "anon:" + hashlib.sha256(client.encode()).hexdigest()[:32]
+    return view_session
+
+
+def count_post_view(post: Post) -> int:
+    """Регистрирует открытие поста и возвращает число просмотров с учётом ещё не записанных."""
+    counter = get_view_counter()
+    counter.register(post.id, _session_id())
+    return post.views + counter.pending(post.id)
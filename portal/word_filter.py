@@ -0,0 +1,140 @@
+"""
+Поиск запрещённых слов автоматом Ахо–Корасик.
+
+Автомат строится один раз на версию списка слов и проверяет текст за один
+линейный проход, независимо от длины списка. Формат записей списка:
+    слово    — только целое слово;
+    слово*   — основа: совпадает с началом слова (дурак* → дураки, дураку);
+    *слово*  — подстрока в любом месте текста.
+"""
+from typing import Iterable, Optional
+
+MODE_WORD = "word"
+MODE_STEM = "stem"
+MODE_SUBSTRING = "substring"
+
+
+def normalize_for_matching(text: str) -> str:
+    """Приводит текст к виду, в котором ищутся слова (регистр, ё → е)."""
+    return (text or "").lower().replace("ё", "е")
+
+
+def parse_entry(entry: str) -> Optional[tuple]:
+    """Разбирает запись списка на (шаблон, режим). Пустые записи — None."""
+    raw = (entry or "").strip()
+    if raw.startswith("*") and raw.endswith("*") and len(raw) > 2:
+        pattern, mode = raw[1:-1], MODE_SUBSTRING
+    elif raw.endswith("*") and len(raw) > 1:
+        pattern, mode = raw[:-1], MODE_STEM
+    else:
+        pattern, mode = raw, MODE_WORD
+    pattern = normalize_for_matching(pattern.strip("*").strip())
+    if not pattern:
+        return None
+    return pattern, mode
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum() or ch == "_"
+
+
+class BadWordMatcher:
+    """Скомпилированный автомат Ахо–Корасик для списка запрещённых слов."""
+
+    def __init__(self, entries: Iterable[str]):
+        # Переходы бора, суффиксные ссылки и выходы (индексы шаблонов) по состояниям
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        # (исходная запись, длина шаблона, режим)
+        self._patterns = []
+
+        for entry in sorted(set(entries or ())):
+            parsed = parse_entry(entry)
+            if not parsed:
+                continue
+            pattern, mode = parsed
+            self._add(pattern, (entry.strip(), len(pattern), mode))
+        self._build_links()
+
+    def __len__(self) -> int:
+        return len(self._patterns)
+
+    def _add(self, pattern: str, meta: tuple) -> None:
+        state = 0
+        for ch in pattern:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append(len(self._patterns))
+        self._patterns.append(meta)
+
+    def _build_links(self) -> None:
+        # Обход в ширину: у детей корня суффиксная ссылка всегда ведёт в корень
+        queue = list(self._goto[0].values())
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def _scan(self, text: str, first_only: bool) -> list:
+        found = []
+        if not self._patterns or not text:
+            return found
+        normalized = normalize_for_matching(text)
+        length = len(normalized)
+        goto, fail, out, patterns = self._goto, self._fail, self._out, self._patterns
+        state = 0
+        for pos, ch in enumerate(normalized):
+            nxt = goto[state].get(ch)
+            while nxt is None and state:
+                state = fail[state]
+                nxt = goto[state].get(ch)
+            state = nxt or 0
+            if not out[state]:
+                continue
+            for idx in out[state]:
+                term, size, mode = patterns[idx]
+                if mode != MODE_SUBSTRING:
+                    start = pos - size + 1
+                    if start > 0 and _is_word_char(normalized[start - 1]):
+                        continue
+                    if mode == MODE_WORD and pos + 1 < length and _is_word_char(normalized[pos + 1]):
+                        continue
+                if term not in found:
+                    found.append(term)
+                    if first_only:
+                        return found
+        return found
+
+    def contains(self, text: str) -> bool:
+        """Есть ли в тексте хотя бы одно запрещённое слово."""
+        return bool(self._scan(text, first_only=True))
+
+    def find_all(self, text: str) -> list:
+        """Все найденные записи списка в порядке первого появления."""
+        return self._scan(text, first_only=False)
+
+
+# Автомат пересобирается только при смене версии списка
+_compiled = {"version": None, "matcher": BadWordMatcher(())}
+
+
+def get_matcher(entries: Iterable[str], version) -> BadWordMatcher:
+    """Возвращает автомат для версии списка, компилируя его при первом обращении."""
+    if _compiled["version"] != version:
+        _compiled["matcher"] = BadWordMatcher(entries)
+        _compiled["version"] = version
+    return _compiled["matcher"]